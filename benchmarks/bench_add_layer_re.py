@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Benchmark of Model.add_layer_re on a diamond heavy DAG. Every layer concatenates the two layers before it,
+# so the number of paths grows exponentially while the number of edges grows linearly.
+# Run from the repository root: PYTHONPATH=. python benchmarks/bench_add_layer_re.py
+
+import time
+
+from hugectrpy.model import Solver, MomentumSGD, Model
+from hugectrpy.layers import Dropout, Concat
+
+
+def build_dag(size):
+    layers = [Dropout(name='l0', src_layers=None), Dropout(name='l1', src_layers=None)]
+    for i in range(2, size):
+        layers.append(Concat(name='l' + str(i), src_layers=[layers[i - 1], layers[i - 2]]))
+    return layers[-1]
+
+
+def main():
+    for size in [1250, 2500, 5000, 10000]:
+        last = build_dag(size)
+        model = Model(Solver(), MomentumSGD())
+        start = time.perf_counter()
+        model.add_layer_re(last)
+        elapsed = time.perf_counter() - start
+        assert model.get_layer_count() == size
+        print("{:>6} layers: {:8.2f} ms, {:6.2f} us/layer".format(size, elapsed * 1e3, elapsed * 1e6 / size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Throughput against p50/p99 latency of the asyncio micro-batcher in front of the NumPy reference executor, which
+# stands in for the inference engine. An open loop load generator submits single samples with exponential
+# inter-arrival times at increasing rates, for unbatched serving and several max-wait settings.
+# Run from the repository root: PYTHONPATH=. python benchmarks/bench_batching.py
+
+import asyncio
+import time
+
+import numpy as np
+
+from bench_reference import build_model
+from hugectrpy.batching import MicroBatcher
+from hugectrpy.reference import ReferenceExecutor
+
+
+async def generate_load(batcher, samples, rate, rng):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    arrivals = start + np.cumsum(rng.exponential(1 / rate, len(samples)))
+    requests = []
+    for sample, arrival in zip(samples, arrivals):
+        delay = arrival - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        requests.append(asyncio.ensure_future(batcher.predict(sample)))
+    await asyncio.gather(*requests)
+    return len(samples) / (loop.time() - start)
+
+
+async def run(predict, max_batch, max_wait, samples, rate):
+    async with MicroBatcher(predict, max_batch, max_wait) as batcher:
+        throughput = await generate_load(batcher, samples, rate, np.random.default_rng(1))
+    return throughput, batcher.get_stats()
+
+
+def main():
+    batch_size = 256
+    executor = ReferenceExecutor(build_model(batch_size))
+    rng = np.random.default_rng(0)
+    count = 2000
+    samples = [{'dense': d, 'data1': k} for d, k in zip(rng.normal(size=(count, 13)).astype(np.float32),
+                                                        rng.integers(0, 1 << 40, (count, 26, 1)))]
+
+    def predict(batch):
+        batch = dict(batch, label=np.zeros((len(batch['dense']), 1), dtype=np.float32))
+        return executor.predict(batch)
+
+    one = {k: v[None] for k, v in samples[0].items()}
+    start = time.perf_counter()
+    for _ in range(20):
+        predict(one)
+    capacity = 20 / (time.perf_counter() - start)
+    print("unbatched capacity ~{:.0f} samples/s".format(capacity))
+    print("{:>22} {:>9} {:>11} {:>9} {:>9} {:>10}".format(
+        'config', 'offered/s', 'achieved/s', 'p50 ms', 'p99 ms', 'mean batch'))
+    for name, max_batch, max_wait in [('unbatched', 1, 0), ('max_wait 1 ms', batch_size, 0.001),
+                                      ('max_wait 5 ms', batch_size, 0.005)]:
+        for factor in (0.5, 0.9, 2, 5, 10):
+            rate = factor * capacity
+            n = min(count, int(rate * 2) + 50)
+            throughput, stats = asyncio.run(run(predict, max_batch, max_wait, samples[:n], rate))
+            print("{:>22} {:9.0f} {:11.0f} {:9.2f} {:9.2f} {:10.1f}".format(
+                name, rate, throughput, stats['latency_p50'] * 1e3, stats['latency_p99'] * 1e3,
+                stats['mean_batch']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Throughput of the NumPy reference executor on a Criteo sized tower: 13 dense features, 26 slots embedded into
+# 16 floats and a 1024-1024-512-256-1 MLP.
+# Run from the repository root: PYTHONPATH=. python benchmarks/bench_reference.py
+
+import time
+
+import numpy as np
+
+from hugectrpy.model import Solver, AdamOptimizer, Model
+from hugectrpy.layers import Dense, Label, Sparse, Data, DistributedSlotSparseEmbeddingHash, \
+    Reshape, Concat, FullyConnected, RELU, BinaryCrossEntropyLoss
+from hugectrpy.reference import ReferenceExecutor
+
+
+def build_model(batch_size):
+    label = Label(name='label', dim=1)
+    sparse = Sparse(name='data1', max_feature_num_per_sample=1, slot_num=26)
+    data = Data(name='data', label=label, dense=Dense(name='dense', dim=13), sparse=sparse)
+    emb = DistributedSlotSparseEmbeddingHash(name='sparse_embedding1', src_layers=sparse, vocabulary_size=1603616,
+                                             load_factor=0.75, embedding_vec_size=16, combiner=0)
+    last = Concat(name='concat1', src_layers=[Reshape(name='reshape1', src_layers=emb, leading_dim=416),
+                                              data.dense])
+    for i, n in enumerate([1024, 1024, 512, 256]):
+        last = RELU(name='relu' + str(i), src_layers=FullyConnected(name='fc' + str(i), src_layers=last, n=n))
+    loss = BinaryCrossEntropyLoss(name='loss', src_layers=[FullyConnected(name='fc4', src_layers=last, n=1), label])
+    model = Model(Solver(batch_size=batch_size), AdamOptimizer(), [data])
+    model.add_layer_re(loss)
+    return model
+
+
+def main():
+    batch_size = 2048
+    executor = ReferenceExecutor(build_model(batch_size))
+    rng = np.random.default_rng(0)
+    batch = {'label': rng.integers(0, 2, (batch_size, 1)).astype(np.float32),
+             'dense': rng.normal(size=(batch_size, 13)).astype(np.float32),
+             'data1': rng.integers(0, 1 << 40, (batch_size, 26, 1))}
+    executor.train_step(batch)
+    for name, step in [('train', executor.train_step), ('evaluate', executor.evaluate)]:
+        start = time.perf_counter()
+        for _ in range(5):
+            step(batch)
+        elapsed = (time.perf_counter() - start) / 5
+        print("{:>8}: {:8.1f} ms/batch of {}, {:9.0f} samples/s".format(
+            name, elapsed * 1e3, batch_size, batch_size / elapsed))
+
+
+if __name__ == '__main__':
+    main()
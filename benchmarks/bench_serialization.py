@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Benchmark of serializing a model repeatedly with one field changed between runs, comparing the cached
+# str(model) with rebuilding the parameters of every object.
+# Run from the repository root: PYTHONPATH=. python benchmarks/bench_serialization.py
+
+import json
+import time
+
+from hugectrpy.model import Solver, AdamOptimizer, Model
+from hugectrpy.layers import Dense, Label, Sparse, Data, FullyConnected, RELU
+
+
+def build_model(size):
+    data = Data(name='data', label=Label(name='label', dim=1), dense=Dense(name='dense', dim=13),
+                sparse=Sparse(name='data1', slot_num=26))
+    model = Model(Solver(), AdamOptimizer(), [data])
+    last = data.dense
+    for i in range(size // 2):
+        fc = FullyConnected(name='fc' + str(i), src_layers=last, n=200)
+        last = RELU(name='relu' + str(i), src_layers=fc)
+        model.add_layer(fc)
+        model.add_layer(last)
+    return model
+
+
+def rebuild(model):
+    return json.dumps({'solver': model.solver.get_parameters(),
+                       'optimizer': model.optimizer.get_parameters(),
+                       'layers': [l.get_parameters() for l in model.layers]})
+
+
+def run(model, serialize, repeats):
+    start = time.perf_counter()
+    for i in range(repeats):
+        model.optimizer.lr = 0.001 * (i + 1)
+        model.layers[1].n = 100 + i
+        serialize(model)
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    for size in [100, 1000, 10000]:
+        model = build_model(size)
+        assert str(model) == rebuild(model)
+        repeats = max(10, 100000 // size)
+        full = run(model, rebuild, repeats)
+        cached = run(model, str, repeats)
+        print("{:>6} layers: full rebuild {:8.3f} ms, cached {:8.3f} ms, speedup {:5.1f}x".format(
+            size, full * 1e3, cached * 1e3, full / cached))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Latency of EmbeddingCache lookups against uncached SparseModelFile lookups: a snapshot of 4M keys of 16 floats,
+# a filled 1M row cache and requests of 26 slots x 64 Zipf distributed keys. Runs once with the snapshot in the
+# page cache and once with it dropped from memory before every request, the case of a production snapshot larger
+# than memory that the cache is for, where every row not cached is read from storage. Snapshots are opened for
+# random access as InferenceEngine does. Exits with an error if a cached lookup is slower than an uncached one on
+# the cold snapshot; with the whole snapshot in memory an uncached lookup is a searchsorted and a gather, which the
+# cache does not beat.
+# Run from the repository root: PYTHONPATH=. python benchmarks/bench_serving.py
+
+import gc
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from hugectrpy.serving import EmbeddingCache
+from hugectrpy.snapshot import SparseModelFile, get_record_dtype
+
+ROWS, VEC, CAPACITY, REQUESTS = 4 << 20, 16, 1 << 20, 200
+
+
+def open_snapshot(path, order, cold):
+    '''
+    Opens the snapshot with its key index already built, after dropping its pages from memory if `cold`.
+    '''
+    gc.collect()
+    if cold:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    source = SparseModelFile(path, VEC, random_access=True)
+    # building the index reads every key, which would bring the whole file back into memory
+    source._order = order
+    return source
+
+
+def time_requests(holder, get, batches, path, order, cold):
+    '''
+    Returns the mean seconds of `get(keys)` per request, the snapshot of `holder.source` being reopened for every
+    request. The previous mapping is released first, pages of a live mapping are not dropped.
+    '''
+    total = 0.0
+    for keys in batches:
+        holder.source = None
+        holder.source = open_snapshot(path, order, cold)
+        start = time.perf_counter()
+        get(keys)
+        total += time.perf_counter() - start
+    return total / len(batches)
+
+
+class Uncached:
+
+    def __init__(self):
+        self.source = None
+
+    def get(self, keys):
+        return self.source.lookup(keys)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'sparse.bin')
+        snapshot = np.zeros(ROWS, get_record_dtype(VEC))
+        snapshot['key'] = rng.permutation(ROWS) * 7919
+        snapshot['vector'] = 1
+        snapshot.tofile(path)
+        del snapshot
+        order = SparseModelFile(path, VEC).get_order()
+        gc.collect()
+
+        p = 1 / np.arange(1, ROWS + 1) ** 1.05
+        batches = [np.unique(r * 7919) for r in rng.choice(ROWS, (REQUESTS, 26 * 64), p=p / p.sum())]
+
+        failed = False
+        for cold in (False, True):
+            print("snapshot {}".format("dropped from memory" if cold else "in the page cache"))
+            uncached = Uncached()
+            uncached = time_requests(uncached, uncached.get, batches, path, order, cold)
+            print("{:>10}: {:6.2f} ms/request".format('uncached', uncached * 1e3))
+            for policy in ('lru', 'lfu', 'tinylfu'):
+                cache = EmbeddingCache(open_snapshot(path, order, False), CAPACITY, policy)
+                for first in range(0, CAPACITY + (1 << 16), 1 << 16):
+                    cache.get(np.arange(first, first + (1 << 16)) * 7919)
+                cache.hits = cache.misses = 0
+                cached = time_requests(cache, cache.get, batches, path, order, cold)
+                cache.source = None
+                print("{:>10}: {:6.2f} ms/request, hit rate {:.2f}".format(
+                    policy, cached * 1e3, cache.get_stats()['hit_rate']))
+                failed |= cold and cached > uncached
+    if failed:
+        sys.exit("a cached lookup is slower than an uncached one on the cold snapshot")
+
+
+if __name__ == '__main__':
+    main()
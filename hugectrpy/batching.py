@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from hugectrpy.serving import LatencyCounter
+
+
+class MicroBatcher:
+
+    def __init__(self, predict_fn, max_batch, max_wait=0.002, max_queue=None):
+        '''
+
+        Groups single samples submitted from asyncio code into batches, runs one vectorized prediction per batch in
+        a worker thread and resolves the future of every sample with its row of the result. A batch is run when it
+        holds `max_batch` samples or `max_wait` seconds after its first sample arrived, whichever comes first.
+        Samples arriving while a batch runs wait in a bounded queue, `predict` blocks while it is full.
+        Use as `async with MicroBatcher(...) as batcher`, or call `start` and `close`.
+        :param predict_fn: callable
+            Specifies the function mapping a batch, a dict of arrays with a leading batch dimension, to an array of
+            one result per sample, e.g. `InferenceEngine.predict`.
+        :param max_batch: int
+            Specifies the largest batch.
+        :param max_wait: float
+            Specifies how long in seconds a batch waits for more samples.
+        :param max_queue: int, optional
+            Specifies the number of waiting samples before `predict` blocks, 4 batches by default.
+        '''
+        if max_batch < 1:
+            raise ValueError("max_batch must be positive, got {}".format(max_batch))
+        self.predict_fn = predict_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue or 4 * max_batch
+        self.queue = None
+        self.task = None
+        self.pool = None
+        self.batches = 0
+        self.samples = 0
+        self.latency = LatencyCounter()
+
+    @classmethod
+    def for_engine(cls, engine, max_wait=0.002, max_queue=None):
+        '''
+        Returns a batcher in front of an InferenceEngine, batching up to `solver.batch_size` samples.
+        '''
+        return cls(engine.predict, engine.model.solver.batch_size, max_wait, max_queue)
+
+    def start(self):
+        if self.task is not None:
+            raise ValueError("The batcher is already running")
+        self.queue = asyncio.Queue(self.max_queue)
+        self.pool = ThreadPoolExecutor(1)
+        self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def close(self):
+        '''
+        Runs the samples already submitted and stops the batcher.
+        '''
+        if self.task is None:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.pool.shutdown()
+        self.task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def predict(self, sample):
+        '''
+        Submits one sample, a dict of arrays without the batch dimension, and returns its result.
+        '''
+        if self.task is None:
+            raise ValueError("The batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await self.queue.put((sample, future))
+        result = await future
+        self.latency.record(time.perf_counter() - start)
+        return result
+
+    async def collect(self):
+        # the next batch, None once closed and empty
+        first = await self.queue.get()
+        if first is None:
+            return None
+        items = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(items) < self.max_batch:
+            try:
+                item = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is None:
+                # run what we have, then stop
+                self.queue.put_nowait(None)
+                break
+            items.append(item)
+        return items
+
+    def call(self, samples):
+        # the batch is built and run in the worker thread, so a malformed sample fails only its batch, and the error
+        # is caught there, so its traceback does not hold the frame of `run`, which callers clearing the frames of a
+        # caught exception would close
+        try:
+            batch = {name: np.stack([sample[name] for sample in samples]) for name in samples[0]}
+            return self.predict_fn(batch), None
+        except Exception as e:
+            return None, e
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self.collect()
+            if items is None:
+                return
+            samples = [sample for sample, _ in items]
+            results, error = await loop.run_in_executor(self.pool, self.call, samples)
+            if error is not None:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.batches += 1
+            self.samples += len(items)
+            for (_, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def get_stats(self):
+        '''
+        Returns the number of batches, the mean batch size and the request latency statistics in seconds.
+        '''
+        stats = {'batches': self.batches, 'mean_batch': self.samples / self.batches if self.batches else 0.0}
+        stats.update({'latency_' + k: v for k, v in self.latency.get_stats().items() if k != 'count'})
+        return stats
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import collections
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from hugectrpy.data import RecordLayout, BinaryWriter, write_file_list
+
+# value of every digit, indexed by its ASCII code, -1 for other characters
+DIGITS = np.full(256, -1, dtype=np.int64)
+DIGITS[np.frombuffer(b'0123456789', np.uint8)] = np.arange(10)
+DIGITS[np.frombuffer(b'abcdef', np.uint8)] = np.arange(10, 16)
+DIGITS[np.frombuffer(b'ABCDEF', np.uint8)] = np.arange(10, 16)
+
+# largest number of digits parsed without overflowing 64 bits
+MAX_DIGITS = {10: 18, 16: 16}
+
+# powers of every base, indexed by the exponent
+POWERS = {base: np.array([base ** e for e in range(MAX_DIGITS[base])], dtype=np.uint64) for base in MAX_DIGITS}
+
+# CRC-32 (zlib) of every byte value, for hashing one byte of many fields at a time
+CRC32_TABLE = np.arange(256, dtype=np.uint32)
+for _ in range(8):
+    CRC32_TABLE = np.where(CRC32_TABLE & 1, (CRC32_TABLE >> 1) ^ np.uint32(0xEDB88320), CRC32_TABLE >> 1)
+
+
+def parse_integers(buf, starts, ends, base):
+    '''
+
+    Parses the integer fields buf[starts[i]:ends[i]] of a byte array at once. Empty fields give 0.
+    :param buf: uint8 array
+        Specifies the text.
+    :param starts: int array
+        Specifies the first byte of every field.
+    :param ends: int array
+        Specifies the end (exclusive) of every field.
+    :param base: int
+        Specifies the base, 10 (with an optional leading '-') or 16.
+    :return: int64 array
+    '''
+    negative = np.zeros(len(starts), dtype=bool)
+    if base == 10:
+        negative = (ends > starts) & (buf[starts] == ord('-'))
+    starts = starts + negative
+    lengths = ends - starts
+    if np.any(lengths > MAX_DIGITS[base]):
+        raise ValueError("integer with more than {} digits".format(MAX_DIGITS[base]))
+
+    # position of every digit and the power of the base it stands for
+    first = np.cumsum(lengths) - lengths
+    positions = np.arange(lengths.sum()) + np.repeat(starts - first, lengths)
+    digits = DIGITS[buf[positions]]
+    if np.any((digits < 0) | (digits >= base)):
+        raise ValueError("invalid base {} integer".format(base))
+    exponents = np.repeat(ends, lengths) - 1 - positions
+    contributions = digits.view(np.uint64) * POWERS[base][exponents]
+
+    values = np.zeros(len(starts), dtype=np.uint64)
+    present = lengths > 0
+    if np.any(present):
+        values[present] = np.add.reduceat(contributions, first[present])
+    values = values.astype(np.int64)
+    return np.where(negative, -values, values)
+
+
+def hash_fields(buf, starts, ends):
+    '''
+
+    Returns the CRC-32 of the fields buf[starts[i]:ends[i]] of a byte array, equal to `zlib.crc32` of every field,
+    computed one byte position of all fields at a time. Empty fields give 0.
+    :param buf: uint8 array
+        Specifies the text.
+    :param starts: int array
+        Specifies the first byte of every field.
+    :param ends: int array
+        Specifies the end (exclusive) of every field.
+    :return: int64 array
+    '''
+    lengths = ends - starts
+    longest = int(lengths.max()) if len(lengths) else 0
+    # longest fields first, the fields still hashed at a position are a prefix; small keys sort by radix
+    shortfall = longest - lengths
+    order = np.argsort(shortfall.astype(np.uint16) if longest < 1 << 16 else shortfall, kind='stable')
+    starts = starts[order]
+    # number of fields longer than every position
+    longer = len(lengths) - np.cumsum(np.bincount(lengths, minlength=longest + 1))
+    crc = np.full(len(starts), 0xFFFFFFFF, dtype=np.uint32)
+    for position in range(longest):
+        count = int(longer[position])
+        head = crc[:count]
+        crc[:count] = CRC32_TABLE[(head ^ buf[starts[:count] + position]) & 0xFF] ^ (head >> 8)
+    hashes = np.empty(len(starts), dtype=np.int64)
+    hashes[order] = crc ^ np.uint32(0xFFFFFFFF)
+    return hashes
+
+
+def parse_chunk(text, layout, key_encoding, log_dense):
+    '''
+    Parses TSV lines (bytes) of label, dense and categorical columns into packed records. Label and dense columns
+    hold integers.
+    '''
+    if not text.endswith(b'\n'):
+        text += b'\n'
+    buf = np.frombuffer(text, np.uint8)
+    columns = 1 + layout.dense_dim + layout.slot_num
+    ends = np.flatnonzero((buf == ord('\t')) | (buf == ord('\n')))
+    line_ends = buf[ends] == ord('\n')
+    expected = (np.arange(len(ends)) % columns) == columns - 1
+    if len(ends) % columns != 0 or np.any(line_ends != expected):
+        line = np.cumsum(line_ends)[np.flatnonzero(line_ends != expected)[0]] if len(ends) % columns == 0 else None
+        raise ValueError("lines must have {} tab separated columns{}".format(
+            columns, "" if line is None else ", line {} of the chunk does not".format(line)))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    # drop the carriage return of Windows line ends
+    ends = np.where(line_ends & (ends > starts) & (buf[ends - 1] == ord('\r')), ends - 1, ends)
+    starts = starts.reshape(-1, columns)
+    ends = ends.reshape(-1, columns)
+    count = len(starts)
+
+    label = parse_integers(buf, starts[:, 0], ends[:, 0], 10).astype(np.float32).reshape(count, 1)
+    dense_columns = slice(1, 1 + layout.dense_dim)
+    dense = parse_integers(buf, starts[:, dense_columns].ravel(), ends[:, dense_columns].ravel(), 10)
+    dense = dense.reshape(count, layout.dense_dim).astype(np.float64)
+    if log_dense:
+        dense = np.log1p(np.maximum(dense, 0))
+
+    key_columns = slice(1 + layout.dense_dim, columns)
+    key_starts = starts[:, key_columns].ravel()
+    key_ends = ends[:, key_columns].ravel()
+    if key_encoding == 'hex':
+        keys = parse_integers(buf, key_starts, key_ends, 16)
+    else:
+        keys = hash_fields(buf, key_starts, key_ends)
+    keys = keys.reshape(count, layout.slot_num, 1)
+    # keys of different slots never collide, the slot is in the upper 32 bits
+    keys[:, :, 0] = (keys[:, :, 0] & 0xFFFFFFFF) | (np.arange(layout.slot_num, dtype=np.int64) << 32)
+    return layout.pack(label, dense.astype(np.float32), keys)
+
+
+class RollingWriter:
+
+    def __init__(self, output_dir, prefix, layout, records_per_file):
+        '''
+        Writes records to numbered files of at most `records_per_file` records.
+        '''
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.layout = layout
+        self.records_per_file = records_per_file
+        self.files = []
+        self.writer = None
+
+    def write(self, raw):
+        while len(raw) > 0:
+            if self.writer is None:
+                path = os.path.join(self.output_dir, "{}{:05d}.bin".format(self.prefix, len(self.files)))
+                self.writer = BinaryWriter(path, self.layout)
+                self.files.append(path)
+            space = self.records_per_file - self.writer.number_of_records
+            self.writer.write_raw(raw[:space])
+            raw = raw[space:]
+            if self.writer.number_of_records == self.records_per_file:
+                self.writer.close()
+                self.writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def convert(inputs, output_dir, dense_dim=13, slot_num=26, check=True, processes=None, chunk_size=65536,
+            max_pending=None, target_file_size=1 << 30, prefix='part', file_list='file_list.txt',
+            key_encoding='hex', log_dense=True):
+    '''
+
+    Converts Criteo style TSV files (label, dense columns, categorical columns) into HugeCTR binary files with one
+    key per slot and writes the file list expected by `Data(source=...)`. Lines are read in chunks that are
+    parsed in a process pool, at most `max_pending` chunks are in memory at a time and records are written in
+    input order.
+    :param inputs: str or list of str
+        Specifies the TSV files.
+    :param output_dir: str
+        Specifies the directory of the binary files and the file list.
+    :param dense_dim: int
+        Specifies the number of dense columns.
+    :param slot_num: int
+        Specifies the number of categorical columns, each becomes a slot.
+    :param check: Boolean
+        Specifies whether records have checksums, i.e. check='Sum' in the Data layer.
+    :param processes: int, optional
+        Specifies the number of parsing processes, all CPUs by default. With 1 chunks are parsed in this process.
+    :param chunk_size: int
+        Specifies the number of lines parsed at once.
+    :param max_pending: int, optional
+        Specifies the maximum number of chunks being parsed or waiting to be written, twice the number of
+        processes by default.
+    :param target_file_size: int
+        Specifies the maximum size in bytes of a binary file, so files can be read in parallel.
+    :param prefix: str
+        Specifies the prefix of binary file names.
+    :param file_list: str
+        Specifies the name of the file list written in `output_dir`.
+    :param key_encoding: str
+        'hex' parses categorical values as hexadecimal numbers, 'hash' hashes them with CRC32. Empty values are 0.
+        The slot index is stored in the upper 32 bits of the key.
+    :param log_dense: Boolean
+        If set, dense values are transformed with log(1 + max(x, 0)).
+    :return: str
+        Path of the file list.
+    '''
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    if key_encoding not in ('hex', 'hash'):
+        raise ValueError("key_encoding must be 'hex' or 'hash', got {}".format(key_encoding))
+    processes = processes or os.cpu_count()
+    max_pending = max_pending or 2 * processes
+    layout = RecordLayout(label_dim=1, dense_dim=dense_dim, slot_num=slot_num, nnz=1, check=check)
+    os.makedirs(output_dir, exist_ok=True)
+    writer = RollingWriter(output_dir, prefix, layout, max(1, target_file_size // layout.record_size))
+
+    def read_chunks():
+        for path in inputs:
+            with open(path, 'rb') as fp:
+                while True:
+                    lines = b''.join(itertools.islice(fp, chunk_size))
+                    if not lines:
+                        break
+                    yield lines
+
+    try:
+        if processes == 1:
+            for lines in read_chunks():
+                writer.write(parse_chunk(lines, layout, key_encoding, log_dense))
+        else:
+            with ProcessPoolExecutor(processes) as pool:
+                pending = collections.deque()
+                for lines in read_chunks():
+                    if len(pending) >= max_pending:
+                        writer.write(pending.popleft().result())
+                    pending.append(pool.submit(parse_chunk, lines, layout, key_encoding, log_dense))
+                while pending:
+                    writer.write(pending.popleft().result())
+    finally:
+        writer.close()
+
+    path = os.path.join(output_dir, file_list)
+    write_file_list(path, writer.files)
+    return path
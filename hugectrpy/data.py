@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import numpy as np
+
+# header of a HugeCTR binary data file
+HEADER_DTYPE = np.dtype([('error_check', '<i8'), ('number_of_records', '<i8'), ('label_dim', '<i8'),
+                         ('dense_dim', '<i8'), ('slot_num', '<i8'), ('reserved', '<i8', 3)])
+
+
+def read_file_list(path):
+    '''
+    Reads a HugeCTR file list: the number of files on the first line, then one path per line.
+    '''
+    with open(path) as fp:
+        lines = [line.strip() for line in fp if line.strip()]
+    if len(lines) == 0:
+        raise ValueError("{} is empty".format(path))
+    count = int(lines[0])
+    if count != len(lines) - 1:
+        raise ValueError("{} declares {} files but lists {}".format(path, count, len(lines) - 1))
+    return lines[1:]
+
+
+def write_file_list(path, files):
+    with open(path, 'w') as fp:
+        fp.write(str(len(files)) + "\n")
+        for f in files:
+            fp.write(f + "\n")
+
+
+class RecordLayout:
+
+    def __init__(self, label_dim, dense_dim, slot_num, nnz, check):
+        '''
+
+        Byte layout of a record with the same number of keys in every slot. A record is the label and dense floats,
+        then for every slot the number of keys (int) and the keys (long long). If `check` is set, every one of
+        those pieces is followed by a checksum byte, the sum of its bytes modulo 256.
+        :param label_dim: int
+            Specifies the number of label floats.
+        :param dense_dim: int
+            Specifies the number of dense floats.
+        :param slot_num: int
+            Specifies the number of slots.
+        :param nnz: int
+            Specifies the number of keys in every slot.
+        :param check: Boolean
+            Specifies whether pieces are followed by checksums.
+        '''
+        self.label_dim = label_dim
+        self.dense_dim = dense_dim
+        self.slot_num = slot_num
+        self.nnz = nnz
+        self.check = check
+
+        c = 1 if check else 0
+        self.dense_offset = 4 * label_dim
+        self.slot_offset = 4 * (label_dim + dense_dim) + c
+        self.slot_size = 4 + c + 8 * nnz + c
+        self.record_size = self.slot_offset + slot_num * self.slot_size
+
+        # boundaries of the checksummed pieces, each followed by its checksum byte
+        self.pieces = []
+        if check:
+            self.pieces.append((0, self.slot_offset - 1))
+            for s in range(slot_num):
+                start = self.slot_offset + s * self.slot_size
+                self.pieces.append((start, start + 4))
+                self.pieces.append((start + 5, start + 5 + 8 * nnz))
+
+    def get_views(self, buffer, offset, count):
+        '''
+
+        Returns zero-copy arrays over `count` records of a buffer.
+        :param buffer: buffer
+            Specifies a memory map or a uint8 array holding the records.
+        :param offset: int
+            Specifies the position of the first record in the buffer.
+        :param count: int
+            Specifies the number of records.
+        :return: tuple of arrays
+            label (count, label_dim), dense (count, dense_dim), nnz (count, slot_num) and
+            keys (count, slot_num, nnz).
+        '''
+        R = self.record_size
+        label = np.ndarray((count, self.label_dim), '<f4', buffer, offset, (R, 4))
+        dense = np.ndarray((count, self.dense_dim), '<f4', buffer, offset + self.dense_offset, (R, 4))
+        nnz = np.ndarray((count, self.slot_num), '<i4', buffer, offset + self.slot_offset, (R, self.slot_size))
+        keys_offset = offset + self.slot_offset + 4 + (1 if self.check else 0)
+        keys = np.ndarray((count, self.slot_num, self.nnz), '<i8', buffer, keys_offset, (R, self.slot_size, 8))
+        return label, dense, nnz, keys
+
+    def get_checksum_errors(self, raw):
+        '''
+        Returns the indices of records of `raw`, a (count, record_size) uint8 array, with a wrong checksum.
+        '''
+        if not self.check or len(raw) == 0:
+            return np.zeros(0, dtype=np.int64)
+        sums = self.get_sums(raw)
+        wrong = (sums[:, 0::2] % 256) != sums[:, 1::2]
+        return np.flatnonzero(wrong.any(axis=1))
+
+    def get_sums(self, raw):
+        # sums of every piece and of every checksum byte, alternately
+        boundaries = [i for piece in self.pieces for i in piece]
+        return np.add.reduceat(raw, boundaries, axis=1, dtype=np.uint64)
+
+    def pack(self, label, dense, keys):
+        '''
+        Returns records as a (count, record_size) uint8 array, with checksums if `check` is set.
+        '''
+        count = len(label)
+        raw = np.zeros((count, self.record_size), dtype=np.uint8)
+        label_view, dense_view, nnz_view, keys_view = self.get_views(raw, 0, count)
+        label_view[...] = label
+        dense_view[...] = dense
+        nnz_view[...] = self.nnz
+        keys_view[...] = keys
+        if self.check and count > 0:
+            raw[:, [end for _, end in self.pieces]] = self.get_sums(raw)[:, 0::2] % 256
+        return raw
+
+
+class BinaryFile:
+
+    def __init__(self, path):
+        '''
+
+        Memory mapped HugeCTR binary data file with the same number of keys in every slot of every record.
+        :param path: str
+            Specifies the path of the file.
+        '''
+        self.path = path
+        self.mmap = np.memmap(path, dtype=np.uint8, mode='r')
+        if len(self.mmap) < HEADER_DTYPE.itemsize:
+            raise ValueError("{}: too small for a header".format(path))
+        header = np.frombuffer(self.mmap, HEADER_DTYPE, count=1)[0]
+        self.number_of_records = int(header['number_of_records'])
+        check = bool(header['error_check'])
+        label_dim, dense_dim, slot_num = int(header['label_dim']), int(header['dense_dim']), int(header['slot_num'])
+
+        # the number of keys of the first slot of the first record gives the layout
+        nnz = 0
+        if self.number_of_records > 0 and slot_num > 0:
+            nnz_offset = HEADER_DTYPE.itemsize + 4 * (label_dim + dense_dim) + (1 if check else 0)
+            nnz = int(np.frombuffer(self.mmap, '<i4', count=1, offset=nnz_offset)[0])
+        self.layout = RecordLayout(label_dim, dense_dim, slot_num, nnz, check)
+
+        expected = HEADER_DTYPE.itemsize + self.number_of_records * self.layout.record_size
+        if len(self.mmap) != expected:
+            raise ValueError("{}: size is {} bytes but {} records of {} keys per slot take {} bytes, files with a "
+                             "varying number of keys per slot are not supported".format(
+                                 path, len(self.mmap), self.number_of_records, nnz, expected))
+
+    def get_records(self, start, stop):
+        '''
+        Returns zero-copy label, dense and keys arrays of records [start, stop).
+        '''
+        label, dense, nnz, keys = self.layout.get_views(
+            self.mmap, HEADER_DTYPE.itemsize + start * self.layout.record_size, stop - start)
+        return label, dense, keys
+
+    def verify(self, start=0, stop=None, chunk=65536):
+        '''
+        Checks the number of keys and the checksums of records [start, stop) and raises ValueError on the first
+        broken record.
+        '''
+        stop = self.number_of_records if stop is None else stop
+        R = self.layout.record_size
+        for begin in range(start, stop, chunk):
+            end = min(begin + chunk, stop)
+            offset = HEADER_DTYPE.itemsize + begin * R
+            _, _, nnz, _ = self.layout.get_views(self.mmap, offset, end - begin)
+            wrong = np.flatnonzero((nnz != self.layout.nnz).any(axis=1))
+            if len(wrong) > 0:
+                raise ValueError("{}: record {} has a different number of keys per slot".format(
+                    self.path, begin + wrong[0]))
+            raw = np.ndarray((end - begin, R), np.uint8, self.mmap, offset)
+            wrong = self.layout.get_checksum_errors(raw)
+            if len(wrong) > 0:
+                raise ValueError("{}: checksum of record {} is wrong".format(self.path, begin + wrong[0]))
+
+
+class BinaryWriter:
+
+    def __init__(self, path, layout):
+        '''
+        Writes a HugeCTR binary data file. The number of records in the header is written on `close`.
+        :param path: str
+            Specifies the path of the file.
+        :param layout: RecordLayout
+            Specifies the layout of the records.
+        '''
+        self.path = path
+        self.layout = layout
+        self.number_of_records = 0
+        self.fp = open(path, 'wb')
+        self.fp.write(self.get_header().tobytes())
+
+    def get_header(self):
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header['error_check'] = 1 if self.layout.check else 0
+        header['number_of_records'] = self.number_of_records
+        header['label_dim'] = self.layout.label_dim
+        header['dense_dim'] = self.layout.dense_dim
+        header['slot_num'] = self.layout.slot_num
+        return header
+
+    def write(self, label, dense, keys):
+        '''
+        Appends records given as label (count, label_dim), dense (count, dense_dim) and keys (count, slot_num, nnz).
+        '''
+        self.write_raw(self.layout.pack(label, dense, keys))
+
+    def write_raw(self, raw):
+        '''
+        Appends records already packed with `layout.pack`.
+        '''
+        self.fp.write(raw.data)
+        self.number_of_records += len(raw)
+
+    def close(self):
+        self.fp.seek(0)
+        self.fp.write(self.get_header().tobytes())
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_data_file(data, path, check_features=True):
+    '''
+    Opens a binary file and checks its header against the Label, Dense and Sparse of a Data layer.
+    :param check_features: Boolean
+        Specifies whether the keys per sample must fit `max_feature_num_per_sample`.
+    '''
+    f = BinaryFile(path)
+    layout = f.layout
+    slot_num = sum(sp.slot_num for sp in data.sparse)
+    if (layout.label_dim, layout.dense_dim, layout.slot_num) != (data.label.dim, data.dense.dim, slot_num):
+        raise ValueError("{}: label_dim {}, dense_dim {} and slot_num {} do not match {}, {} and {}".format(
+            path, layout.label_dim, layout.dense_dim, layout.slot_num, data.label.dim, data.dense.dim, slot_num))
+    if (data.check == 'Sum') != layout.check:
+        raise ValueError("{}: checksums {} but check is {}".format(
+            path, "present" if layout.check else "absent", data.check))
+    for sp in data.sparse:
+        if check_features and sp.slot_num * layout.nnz > sp.max_feature_num_per_sample:
+            raise ValueError("{}: {} keys per sample exceed max_feature_num_per_sample {} of {}".format(
+                path, sp.slot_num * layout.nnz, sp.max_feature_num_per_sample, sp.get_name()))
+    return f
+
+
+class DataReader:
+
+    def __init__(self, data, batch_size, eval=False, verify=True):
+        '''
+
+        Reads batches from the files listed in the source of a Data layer without copying them. A batch does not
+        span files, so the last batch of a file may be smaller.
+        :param data: Data
+            Specifies the Data layer, its Label, Dense and Sparse give the expected layout.
+        :param batch_size: int
+            Specifies the number of records per batch.
+        :param eval: Boolean
+            If set, `eval_source` is read instead of `source`.
+        :param verify: Boolean
+            If set, checksums and the number of keys of every batch are checked when the files have checksums.
+        '''
+        self.data = data
+        self.batch_size = batch_size
+        self.verify = verify
+        source = data.eval_source if eval else data.source
+        if source is None:
+            raise ValueError("{}: no source given".format(data.get_name()))
+        self.files = read_file_list(source)
+
+    def __iter__(self):
+        data = self.data
+        for path in self.files:
+            f = open_data_file(self.data, path)
+            for start in range(0, f.number_of_records, self.batch_size):
+                stop = min(start + self.batch_size, f.number_of_records)
+                if self.verify:
+                    f.verify(start, stop)
+                label, dense, keys = f.get_records(start, stop)
+                batch = {data.label.get_name(): label, data.dense.get_name(): dense}
+                first = 0
+                for sp in data.sparse:
+                    batch[sp.get_name()] = keys[:, first:first + sp.slot_num]
+                    first += sp.slot_num
+                yield batch
+
+    def get_size(self):
+        '''
+        Returns the total number of records in the listed files.
+        '''
+        return sum(BinaryFile(path).number_of_records for path in self.files)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import math
+
+import numpy as np
+
+from hugectrpy.data import DataReader, open_data_file
+from hugectrpy.stats import hash64
+
+
+def zipf_keys(count, distinct, exponent=1.05, seed=0):
+    '''
+    Returns `count` keys drawn from `distinct` keys whose frequencies follow Zipf's law. Keys are hashed ranks, so
+    they look like hashed categorical values.
+    '''
+    rng = np.random.default_rng(seed)
+    cdf = np.cumsum(1.0 / np.arange(1, distinct + 1) ** exponent)
+    cdf /= cdf[-1]
+    ranks = np.minimum(np.searchsorted(cdf, rng.random(count)), distinct - 1)
+    return (hash64(ranks) >> np.uint64(1)).astype(np.int64)
+
+
+def sample_keys(data, eval=False, max_keys=None, batch_size=65536):
+    '''
+    Returns the valid keys of the files of a Data layer in file order, at most `max_keys` of them.
+    '''
+    chunks, total = [], 0
+    for path in DataReader(data, batch_size, eval=eval).files:
+        f = open_data_file(data, path, check_features=False)
+        for start in range(0, f.number_of_records, batch_size):
+            _, _, keys = f.get_records(start, min(start + batch_size, f.number_of_records))
+            keys = keys[keys >= 0]
+            chunks.append(keys[:None if max_keys is None else max_keys - total])
+            total += len(chunks[-1])
+            if max_keys is not None and total >= max_keys:
+                return np.concatenate(chunks)
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int64)
+
+
+def insert_keys(keys, capacity, batch_size=1 << 20):
+    '''
+
+    Inserts distinct keys into a linear probing hashtable of `capacity` rows and returns the number of rows probed
+    to find every key. Keys are inserted in rounds: in every round each pending key looks at its next row, one key
+    per free row is placed and the others move on. The rows taken do not depend on the order of insertion and
+    neither does the total probe length.
+    :param keys: int64 array
+        Specifies distinct keys.
+    :param capacity: int
+        Specifies the number of rows, at least the number of keys.
+    :param batch_size: int
+        Specifies the number of keys inserted at once.
+    :return: int64 array
+    '''
+    if len(keys) > capacity:
+        raise ValueError("{} keys do not fit in {} rows".format(len(keys), capacity))
+    occupied = np.zeros(capacity, dtype=bool)
+    probes = np.zeros(len(keys), dtype=np.int64)
+    for begin in range(0, len(keys), batch_size):
+        home = (hash64(keys[begin:begin + batch_size]) % np.uint64(capacity)).astype(np.int64)
+        pending = np.arange(len(home))
+        distance = 0
+        while len(pending) > 0:
+            rows = home[pending] + distance
+            rows[rows >= capacity] -= capacity
+            free = np.flatnonzero(~occupied[rows])
+            # the first key looking at a free row takes it
+            taken, first = np.unique(rows[free], return_index=True)
+            occupied[taken] = True
+            placed = pending[free[first]]
+            probes[begin + placed] = distance + 1
+            keep = np.ones(len(pending), dtype=bool)
+            keep[free[first]] = False
+            pending = pending[keep]
+            distance += 1
+    return probes
+
+
+class HashtableReport:
+
+    def __init__(self, rows):
+        '''
+        Result of `simulate_hashtable`.
+        :param rows: list of dict
+            Specifies the statistics of every simulated load factor.
+        '''
+        self.rows = rows
+
+    def recommend(self, max_p99_probes=8, max_overflow=0.0):
+        '''
+
+        Returns the statistics of the smallest table whose p99 probe length and fraction of keys past
+        `max_probes` meet the targets, None if no load factor does.
+        :param max_p99_probes: float
+            Specifies the largest acceptable p99 probe length.
+        :param max_overflow: float
+            Specifies the largest acceptable fraction of keys probed more than `max_probes` rows.
+        '''
+        valid = [row for row in self.rows
+                 if row['p99_probes'] <= max_p99_probes and row['overflow'] <= max_overflow]
+        return min(valid, key=lambda row: row['capacity']) if valid else None
+
+    def __str__(self):
+        lines = ["load_factor  capacity  MiB  mean  weighted  p99  max  overflow"]
+        for row in self.rows:
+            lines.append("{:.2f}  {}  {:.1f}  {:.2f}  {:.2f}  {:.0f}  {}  {:.2e}".format(
+                row['load_factor'], row['capacity'], row['bytes'] / (1 << 20), row['mean_probes'],
+                row['weighted_probes'], row['p99_probes'], row['longest_probe'], row['overflow']))
+        return "\n".join(lines)
+
+
+def simulate_hashtable(keys, load_factors=(0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95), max_probes=64,
+                       embedding=None, num_state_tables=0, mixed_precision=None, batch_size=1 << 20):
+    '''
+
+    Replays keys into linear probing hashtables sized for every load factor and measures how many rows a lookup
+    probes. Rows are selected with `stats.hash64`, not the hash of the GPU table, so the results hold for a well
+    mixed hash rather than bit for bit.
+    :param keys: int64 array
+        Specifies the looked up keys, e.g. from `sample_keys` or `zipf_keys`. Repeated keys weight the
+        `weighted_probes` statistic by how often they are accessed.
+    :param load_factors: list of float
+        Specifies the simulated load factors, capacity is the number of distinct keys / load factor.
+    :param max_probes: int
+        Specifies the probe length past which a lookup is counted as an overflow.
+    :param embedding: DistributedSlotSparseEmbeddingHash, optional
+        If set, `bytes` uses the row size of this embedding, otherwise only the keys are counted.
+    :param num_state_tables: int
+        Specifies the number of optimizer state tables stored with every row.
+    :param mixed_precision: int, optional
+        If set, embedding vectors and optimizer states are stored in half precision.
+    :param batch_size: int
+        Specifies the number of keys inserted at once.
+    :return: HashtableReport
+    '''
+    from hugectrpy.layers import KEY_BYTES
+    distinct, counts = np.unique(np.asarray(keys, dtype=np.int64), return_counts=True)
+    row_bytes = KEY_BYTES if embedding is None else embedding.get_row_bytes(num_state_tables, mixed_precision)
+    rows = []
+    for load_factor in load_factors:
+        if not 0 < load_factor <= 1:
+            raise ValueError("load_factor {} is not in (0, 1]".format(load_factor))
+        capacity = max(1, int(math.ceil(len(distinct) / load_factor)))
+        probes = insert_keys(distinct, capacity, batch_size)
+        empty = len(probes) == 0
+        rows.append({'load_factor': load_factor, 'capacity': capacity, 'bytes': capacity * row_bytes,
+                     'mean_probes': 0.0 if empty else float(probes.mean()),
+                     'weighted_probes': 0.0 if empty else float(np.average(probes, weights=counts)),
+                     'p99_probes': 0.0 if empty else float(np.percentile(probes, 99)),
+                     'longest_probe': 0 if empty else int(probes.max()),
+                     'overflow': 0.0 if empty else float(np.mean(probes > max_probes))})
+    return HashtableReport(rows)
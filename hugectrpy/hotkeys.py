@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import numpy as np
+
+from hugectrpy.data import DataReader
+from hugectrpy.layers import Data, DistributedSlotSparseEmbeddingHash
+from hugectrpy.stats import HyperLogLog
+
+
+class HotKeyReport:
+
+    def __init__(self, model, touched, working_set):
+        '''
+        Result of `analyze_hot_keys`.
+        :param model: Model
+            Specifies the analyzed model.
+        :param touched: dict
+            Maps embedding names to the number of distinct rows touched by every iteration.
+        :param working_set: dict
+            Maps embedding names to the estimated number of distinct rows touched up to every iteration.
+        '''
+        self.model = model
+        self.touched = touched
+        self.working_set = working_set
+
+    def get_embeddings(self):
+        return [layer for layer in self.model.layers if layer.get_name() in self.touched]
+
+    def get_touched_percentiles(self, name, percentiles=(50, 90, 99, 100)):
+        '''
+        Returns the given percentiles of the rows touched per iteration by an embedding.
+        '''
+        return np.percentile(self.touched[name], percentiles)
+
+    def get_state_row_bytes(self, embedding):
+        # an update reads and writes the weights and every optimizer state of a row
+        element_size = 2 if self.model.solver.mixed_precision else 4
+        tables = 1 + self.model.optimizer.get_state_tables_count()
+        return 2 * embedding.embedding_vec_size * element_size * tables
+
+    def get_update_bytes(self, global_update):
+        '''
+        Returns the mean bytes of weights and optimizer states read and written by one update step over all
+        embeddings.
+        :param global_update: Boolean
+            If set, every row of the hashtables is updated, otherwise only the rows touched by the batch.
+        '''
+        total = 0.0
+        for embedding in self.get_embeddings():
+            rows = embedding.get_capacity() if global_update else np.mean(self.touched[embedding.get_name()])
+            total += rows * self.get_state_row_bytes(embedding)
+        return total
+
+    def recommend_global_update(self, threshold=0.5):
+        '''
+        Returns True when sparse updates would move at least `threshold` times the bytes of global updates, i.e.
+        when batches touch so much of the tables that selecting the touched rows does not pay off.
+        '''
+        global_bytes = self.get_update_bytes(True)
+        return global_bytes > 0 and self.get_update_bytes(False) >= threshold * global_bytes
+
+    def apply(self, threshold=0.5):
+        '''
+        Sets `global_update` of the optimizer of the model to the recommended value.
+        '''
+        self.model.optimizer.global_update = self.recommend_global_update(threshold)
+
+    def __str__(self):
+        lines = []
+        for embedding in self.get_embeddings():
+            name = embedding.get_name()
+            p50, p90, p99, top = self.get_touched_percentiles(name)
+            lines.append("{}: {:.0f}/{:.0f}/{:.0f}/{:.0f} rows touched per iteration (p50/p90/p99/max) of {}, "
+                         "~{:.0f} rows touched after {} iterations".format(
+                             name, p50, p90, p99, top, embedding.get_capacity(), self.working_set[name][-1],
+                             len(self.working_set[name])))
+        sparse, dense = self.get_update_bytes(False), self.get_update_bytes(True)
+        lines.append("update traffic per step: {:.1f} MiB sparse, {:.1f} MiB global ({:.1f}x)".format(
+            sparse / (1 << 20), dense / (1 << 20), dense / sparse if sparse else float('inf')))
+        lines.append("recommended global_update: {}".format(self.recommend_global_update()))
+        return "\n".join(lines)
+
+
+def iter_full_batches(batches, batch_size, names):
+    '''
+    Re-slices batches that end at file boundaries, as DataReader gives them, into batches of exactly `batch_size`
+    records of the inputs `names`, carrying the rest of a file over to the next one. Only the last batch may be
+    smaller.
+    '''
+    pending, count = [], 0
+    for batch in batches:
+        pending.append({name: batch[name] for name in names})
+        count += len(batch[names[0]])
+        if count < batch_size:
+            continue
+        merged = pending[0] if len(pending) == 1 else \
+            {name: np.concatenate([b[name] for b in pending]) for name in names}
+        start = 0
+        while count - start >= batch_size:
+            yield {name: values[start:start + batch_size] for name, values in merged.items()}
+            start += batch_size
+        pending = [{name: values[start:] for name, values in merged.items()}] if start < count else []
+        count -= start
+    if count > 0:
+        yield {name: np.concatenate([b[name] for b in pending]) for name in names}
+
+
+def analyze_hot_keys(model, eval=False, max_iterations=None, precision=14):
+    '''
+
+    Streams batches of `solver.batch_size` samples from the Data layer of a model, spanning file ends so that only
+    the last batch may be smaller, and counts, for every embedding,
+    the distinct rows touched by each iteration and the working set of rows touched so far. Combined with the
+    embedding sizes and the optimizer, this gives the traffic of sparse and global optimizer updates.
+    :param model: Model
+        Specifies the model, it must have a Data layer and embeddings reading its Sparse inputs.
+    :param eval: Boolean
+        If set, `eval_source` is read instead of `source`.
+    :param max_iterations: int, optional
+        Specifies the number of analyzed iterations, all batches of the files by default.
+    :param precision: int
+        Specifies the precision of the HyperLogLog sketches estimating the working sets.
+    :return: HotKeyReport
+    '''
+    data = [layer for layer in model.layers if isinstance(layer, Data)]
+    if len(data) != 1:
+        raise ValueError("model must have exactly one Data layer, has {}".format(len(data)))
+    data = data[0]
+    sparse_names = {sp.get_name() for sp in data.sparse}
+    embeddings = [layer for layer in model.layers if isinstance(layer, DistributedSlotSparseEmbeddingHash) and
+                  layer.get_bottom_names()[0] in sparse_names]
+    if len(embeddings) == 0:
+        raise ValueError("no embedding reads the Sparse inputs of {}".format(data.get_name()))
+
+    touched = {e.get_name(): [] for e in embeddings}
+    working_set = {e.get_name(): [] for e in embeddings}
+    sketches = {e.get_name(): HyperLogLog(precision) for e in embeddings}
+    batches = iter_full_batches(DataReader(data, model.solver.batch_size, eval=eval, verify=False),
+                                model.solver.batch_size, sorted({e.get_bottom_names()[0] for e in embeddings}))
+    for iteration, batch in enumerate(batches):
+        if max_iterations is not None and iteration >= max_iterations:
+            break
+        for e in embeddings:
+            keys = batch[e.get_bottom_names()[0]]
+            keys = np.unique(keys[keys >= 0])
+            touched[e.get_name()].append(len(keys))
+            sketches[e.get_name()].add(keys)
+            working_set[e.get_name()].append(float(sketches[e.get_name()].estimate()[0]))
+    return HotKeyReport(model, {name: np.array(v, dtype=np.int64) for name, v in touched.items()},
+                        {name: np.array(v) for name, v in working_set.items()})
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import itertools
+import os
+import threading
+import time
+
+from hugectrpy.data import HEADER_DTYPE, DataReader, open_data_file
+
+
+def read_file(path, chunk_size, readahead, deadline, drop_cache):
+    '''
+    Reads a file sequentially in chunks until its end or `deadline` and returns the number of bytes read.
+    '''
+    fadvise = hasattr(os, 'posix_fadvise')
+    buffer = bytearray(chunk_size)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if fadvise:
+            if drop_cache:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        offset = 0
+        advised = 0
+        while True:
+            # ask for the next `readahead` bytes once half of the previous window is consumed
+            if readahead and fadvise and offset + readahead // 2 >= advised:
+                os.posix_fadvise(fd, advised, offset + readahead - advised, os.POSIX_FADV_WILLNEED)
+                advised = offset + readahead
+            n = os.readv(fd, [buffer])
+            if n == 0:
+                break
+            offset += n
+            if time.perf_counter() > deadline:
+                break
+    finally:
+        os.close(fd)
+    return offset
+
+
+def measure_read(files, record_sizes, threads, chunk_size=1 << 20, readahead=0, max_seconds=5.0, drop_cache=True):
+    '''
+
+    Reads files with a pool of threads, each taking the next unread file, and measures the throughput.
+    :param files: list of str
+        Specifies the files.
+    :param record_sizes: list of int
+        Specifies the record size of every file, to count samples.
+    :param threads: int
+        Specifies the number of reader threads.
+    :param chunk_size: int
+        Specifies the bytes of a read call.
+    :param readahead: int
+        Specifies the bytes the kernel is asked to prefetch ahead of the reads with posix_fadvise, 0 to rely on the
+        default readahead.
+    :param max_seconds: float
+        Specifies when reading stops if the files are not read by then.
+    :param drop_cache: Boolean
+        If set, cached pages of a file are dropped before reading it, so the storage is measured rather than the
+        page cache. Pages written but not yet flushed stay cached.
+    :return: dict
+        `bytes`, `samples`, `seconds`, `mb_per_second` and `samples_per_second`.
+    '''
+    next_file = itertools.count()
+    lock = threading.Lock()
+    totals = {'bytes': 0, 'samples': 0}
+    start = time.perf_counter()
+    deadline = start + max_seconds
+
+    def work():
+        while time.perf_counter() < deadline:
+            with lock:
+                i = next(next_file)
+            if i >= len(files):
+                return
+            n = read_file(files[i], chunk_size, readahead, deadline, drop_cache)
+            with lock:
+                totals['bytes'] += n
+                totals['samples'] += max(0, n - HEADER_DTYPE.itemsize) // record_sizes[i]
+
+    pool = [threading.Thread(target=work) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    seconds = time.perf_counter() - start
+    return {'bytes': totals['bytes'], 'samples': totals['samples'], 'seconds': seconds,
+            'mb_per_second': totals['bytes'] / seconds / 1e6, 'samples_per_second': totals['samples'] / seconds}
+
+
+class IOReport:
+
+    def __init__(self, rows, required=None):
+        '''
+        Result of `benchmark_input`.
+        :param rows: list of dict
+            Specifies the `threads`, `chunk_size`, `readahead` and measured values of every configuration.
+        :param required: float, optional
+            Specifies the samples/s a node must read to keep its GPUs fed.
+        '''
+        self.rows = rows
+        self.required = required
+
+    def get_knees(self, gain=0.1):
+        '''
+        Returns, for every chunk size and readahead, the row with the fewest threads after which more threads
+        improve samples/s by less than `gain`.
+        '''
+        knees = []
+        groups = sorted({(r['chunk_size'], r['readahead']) for r in self.rows})
+        for chunk_size, readahead in groups:
+            rows = sorted((r for r in self.rows if (r['chunk_size'], r['readahead']) == (chunk_size, readahead)),
+                          key=lambda r: r['threads'])
+            knee = rows[-1]
+            for row, more in zip(rows, rows[1:]):
+                if more['samples_per_second'] < (1 + gain) * row['samples_per_second']:
+                    knee = row
+                    break
+            knees.append(knee)
+        return knees
+
+    def recommend(self, gain=0.1):
+        '''
+        Returns the reader settings with the highest throughput at the knee of the thread count, whether they
+        keep up with the required rate and the headroom over it.
+        '''
+        best = max(self.get_knees(gain), key=lambda r: r['samples_per_second'])
+        recommendation = {k: best[k] for k in ('threads', 'chunk_size', 'readahead', 'mb_per_second',
+                                               'samples_per_second')}
+        if self.required:
+            recommendation['required'] = self.required
+            recommendation['headroom'] = best['samples_per_second'] / self.required
+            recommendation['sufficient'] = best['samples_per_second'] >= self.required
+        return recommendation
+
+    def __str__(self):
+        lines = ["{:>7} {:>10} {:>10} {:>9} {:>12}".format('threads', 'chunk KiB', 'ahead KiB', 'MB/s',
+                                                         'samples/s')]
+        for r in sorted(self.rows, key=lambda r: (r['chunk_size'], r['readahead'], r['threads'])):
+            lines.append("{:7d} {:10d} {:10d} {:9.1f} {:12.0f}".format(
+                r['threads'], r['chunk_size'] >> 10, r['readahead'] >> 10, r['mb_per_second'],
+                r['samples_per_second']))
+        recommendation = self.recommend()
+        line = "recommended: {} threads, {} KiB chunks, {} KiB readahead, {:.0f} samples/s".format(
+            recommendation['threads'], recommendation['chunk_size'] >> 10, recommendation['readahead'] >> 10,
+            recommendation['samples_per_second'])
+        if self.required:
+            line += ", {} {:.0f} samples/s required per node ({:.2f}x)".format(
+                "meets" if recommendation['sufficient'] else "BELOW", self.required, recommendation['headroom'])
+        lines.append(line)
+        return "\n".join(lines)
+
+
+def benchmark_input(model, threads=(1, 2, 4, 8, 16), chunk_sizes=(1 << 20,), readaheads=(0, 16 << 20),
+                    step_time=None, eval=False, max_seconds=5.0, drop_cache=True):
+    '''
+
+    Measures how fast the files of the Data layer of a model can be read for every combination of reader threads,
+    chunk size and readahead, and compares it with the samples/s a node needs. `batch_size` is the global batch,
+    so a node reads batch_size * (its GPUs / all GPUs) samples per step.
+    :param model: Model
+        Specifies the model, the files of its Data layer are read.
+    :param threads: list of int
+        Specifies the thread counts to measure.
+    :param chunk_sizes: list of int
+        Specifies the read sizes in bytes to measure.
+    :param readaheads: list of int
+        Specifies the readahead windows in bytes to measure.
+    :param step_time: float, optional
+        Specifies the target seconds per step, the estimate of `Model.estimate_cost` by default.
+    :param eval: Boolean
+        If set, `eval_source` is read instead of `source`.
+    :param max_seconds: float
+        Specifies the time limit of every measurement.
+    :param drop_cache: Boolean
+        Specifies whether cached pages are dropped before reading, see `measure_read`.
+    :return: IOReport
+    '''
+    from hugectrpy.layers import Data
+    data = [layer for layer in model.layers if isinstance(layer, Data)]
+    if len(data) != 1:
+        raise ValueError("model must have exactly one Data layer, has {}".format(len(data)))
+    data = data[0]
+    files = DataReader(data, 1, eval=eval).files
+    record_sizes = [open_data_file(data, path, check_features=False).layout.record_size for path in files]
+    if step_time is None:
+        step_time = model.estimate_cost()['step_time']
+    devices = model.solver.get_devices()
+    largest_node = max(sum(1 for node, _ in devices if node == n) for n, _ in devices)
+    required = model.solver.batch_size * largest_node / len(devices) / step_time
+
+    rows = []
+    for chunk_size, readahead, count in itertools.product(chunk_sizes, readaheads, threads):
+        row = measure_read(files, record_sizes, count, chunk_size, readahead, max_seconds, drop_cache)
+        row.update({'threads': count, 'chunk_size': chunk_size, 'readahead': readahead})
+        rows.append(row)
+    return IOReport(rows, required)
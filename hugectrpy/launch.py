@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import collections
+import re
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+# lines of the HugeCTR training log, after the "[..][HUGECTR][INFO]: " prefix
+NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[-+]?(?:nan|inf)'
+ITERATION_PATTERN = re.compile(
+    r'Iter: (\d+) Time\((\d+) iters\): ({0})s Loss: ({0})(?:,?\s*lr:\s*({0}))?'.format(NUMBER))
+AUC_PATTERN = re.compile(r'Evaluation, AUC: ({})'.format(NUMBER))
+EVAL_TIME_PATTERN = re.compile(r'Eval Time for (\d+) iters: ({})s'.format(NUMBER))
+SNAPSHOT_PATTERN = re.compile(r'Dumping (sparse|dense) weights to files?|(Write hash table) to file')
+
+
+def parse_line(line, batch_size):
+    '''
+    Returns the event of a log line as a dict with its `type`, or None for other lines.
+    :param batch_size: int
+        Specifies the batch size, giving `samples_per_second` of iteration events.
+    '''
+    match = ITERATION_PATTERN.search(line)
+    if match:
+        iterations, seconds = int(match.group(2)), float(match.group(3))
+        return {'type': 'iteration', 'iteration': int(match.group(1)), 'loss': float(match.group(4)),
+                'lr': float(match.group(5)) if match.group(5) else None, 'seconds': seconds,
+                'samples_per_second': iterations * batch_size / seconds if seconds > 0 else float('inf')}
+    match = AUC_PATTERN.search(line)
+    if match:
+        return {'type': 'eval', 'auc': float(match.group(1))}
+    match = EVAL_TIME_PATTERN.search(line)
+    if match:
+        return {'type': 'eval_time', 'iterations': int(match.group(1)), 'seconds': float(match.group(2))}
+    match = SNAPSHOT_PATTERN.search(line)
+    if match:
+        return {'type': 'snapshot', 'what': 'sparse' if match.group(2) else match.group(1)}
+    return None
+
+
+class Job:
+
+    def __init__(self, args, batch_size, cwd=None, env=None, log_lines=1000):
+        '''
+
+        Runs a training process and parses its output as it streams, in a reader thread. Events are dicts with a
+        `type` of 'iteration' (loss every `display` iterations and the samples/s of that interval), 'eval'
+        (AUC), 'eval_time', 'snapshot' or 'exit' (return code, always last). Each event also holds `iteration`,
+        the last iteration logged before it, and `time`, when it was read.
+        :param args: list of str
+            Specifies the command line.
+        :param batch_size: int
+            Specifies the batch size of the solver.
+        :param cwd: str, optional
+            Specifies the working directory of the process.
+        :param env: dict, optional
+            Specifies the environment of the process.
+        :param log_lines: int
+            Specifies the number of recent output lines kept in `lines`.
+        '''
+        self.args = args
+        self.batch_size = batch_size
+        self.events = []
+        self.lines = collections.deque(maxlen=log_lines)
+        self.returncode = None
+        self.start_time = time.time()
+        self._condition = threading.Condition()
+        self._process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd, env=env,
+                                         text=True, errors='replace', bufsize=1)
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def _read(self):
+        iteration = 0
+        try:
+            for line in self._process.stdout:
+                line = line.rstrip('\n')
+                self.lines.append(line)
+                try:
+                    event = parse_line(line, self.batch_size)
+                except ValueError:
+                    # a line that only looks like an event
+                    continue
+                if event is None:
+                    continue
+                iteration = event.get('iteration', iteration)
+                event['iteration'] = iteration
+                event['time'] = time.time()
+                self._append(event)
+        finally:
+            # keep draining, a full pipe would block the process, and always end with the exit event
+            try:
+                for _ in self._process.stdout:
+                    pass
+            except (OSError, ValueError):
+                pass
+            self._process.stdout.close()
+            event = {'type': 'exit', 'returncode': self._process.wait(), 'iteration': iteration, 'time': time.time()}
+            self.returncode = event['returncode']
+            self._append(event)
+
+    def _append(self, event):
+        with self._condition:
+            self.events.append(event)
+            self._condition.notify_all()
+
+    def metrics(self, types=None, timeout=None):
+        '''
+        Yields events as they are parsed until the process exits, starting from the first one.
+        :param types: collection of str, optional
+            Specifies the event types yielded, all by default. The 'exit' event ends the iteration either way.
+        :param timeout: float, optional
+            Specifies how long to wait for an event before raising TimeoutError.
+        '''
+        index = 0
+        while True:
+            with self._condition:
+                if not self._condition.wait_for(lambda: index < len(self.events), timeout):
+                    raise TimeoutError("No event within {} s".format(timeout))
+                event = self.events[index]
+            index += 1
+            if types is None or event['type'] in types or event['type'] == 'exit':
+                yield event
+            if event['type'] == 'exit':
+                return
+
+    def __iter__(self):
+        return self.metrics()
+
+    def wait(self, timeout=None):
+        '''
+        Waits for the process to exit and its output to be parsed, and returns the return code.
+        '''
+        self._process.wait(timeout)
+        self._reader.join(timeout)
+        return self.returncode
+
+    def terminate(self):
+        self._process.terminate()
+
+    def get_summary(self):
+        '''
+        Returns the last loss, the best and last AUC, the median, p10 and mean samples/s of the intervals and the
+        number of snapshots seen so far.
+        '''
+        iterations = [e for e in self.events if e['type'] == 'iteration']
+        aucs = [e['auc'] for e in self.events if e['type'] == 'eval']
+        throughput = np.array([e['samples_per_second'] for e in iterations])
+        summary = {'iteration': iterations[-1]['iteration'] if iterations else 0,
+                   'loss': iterations[-1]['loss'] if iterations else None,
+                   'auc': aucs[-1] if aucs else None, 'best_auc': max(aucs) if aucs else None,
+                   'snapshots': sum(1 for e in self.events if e['type'] == 'snapshot'),
+                   'returncode': self.returncode}
+        if len(throughput) > 0:
+            summary.update({'samples_per_second': float(np.median(throughput)),
+                            'samples_per_second_p10': float(np.percentile(throughput, 10)),
+                            'samples_per_second_mean': float(throughput.mean())})
+        return summary
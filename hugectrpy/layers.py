@@ -15,8 +15,30 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import math
 
-class Layer:
+from hugectrpy.serialization import Serializable
+
+# size of a hash key (long long) stored next to each embedding vector
+KEY_BYTES = 8
+
+
+def get_size(shape):
+    '''
+    Returns the number of elements of a per-sample shape.
+    '''
+    size = 1
+    for d in shape:
+        size *= d
+    return size
+
+
+def _make_cost(forward_flops=0, forward_bytes=0, backward_flops=0, backward_bytes=0):
+    return {'forward_flops': forward_flops, 'forward_bytes': forward_bytes,
+            'backward_flops': backward_flops, 'backward_bytes': backward_bytes}
+
+
+class Layer(Serializable):
 
     def __init__(self, name, src_layers):
         '''
@@ -45,6 +67,50 @@ class Layer:
         else:
             return 1
 
+    def get_bottom_names(self):
+        '''
+        Returns the names of the source layers as a list.
+        '''
+        if self.get_src_layers_count() > 1:
+            return [layer.get_name() for layer in self.get_src_layers()]
+        elif self.get_src_layers_count() == 1:
+            return [self.get_src_layers().get_name()]
+        return []
+
+    def get_top_names(self):
+        '''
+        Returns the names of the tensors produced by the layer.
+        '''
+        return [self.name]
+
+    def get_cache_key(self):
+        return tuple(self.get_bottom_names())
+
+    def get_output_shapes(self, input_shapes):
+        '''
+        Infers the shapes of the produced tensors. Shapes are per sample, i.e. they do not include the batch dimension.
+        Element-wise layers keep the shape of their first input.
+        :param input_shapes: list of tuples
+            Specifies the shapes of the source tensors in the order of `get_bottom_names`.
+        :return: list of tuples
+            Shapes in the order of `get_top_names`.
+        '''
+        return [input_shapes[0]]
+
+    def get_cost(self, batch_size, input_shapes, element_size=4):
+        '''
+        Estimates FLOPs and bytes moved by the forward and backward passes of the layer.
+        :param batch_size: int
+            Specifies the number of samples processed.
+        :param input_shapes: list of tuples
+            Specifies the per sample shapes of the source tensors.
+        :param element_size: int
+            Specifies bytes per element, 2 in mixed precision and 4 otherwise.
+        :return: dict
+            forward_flops, forward_bytes, backward_flops and backward_bytes.
+        '''
+        return _make_cost()
+
     def get_parameters(self):
         params = dict()
         params['name'] = self.name
@@ -86,6 +152,16 @@ class Dropout(Layer):
         d_params['rate'] = self.rate
         return {k: v for k, v in d_params.items() if v is not None}
 
+    def get_output_shapes(self, input_shapes):
+        if not 0 <= self.rate < 1:
+            raise ValueError("{}: rate {} is not in [0, 1)".format(self.name, self.rate))
+        return [input_shapes[0]]
+
+    def get_cost(self, batch_size, input_shapes, element_size=4):
+        elements = batch_size * get_size(input_shapes[0])
+        # forward draws the mask and scales, backward applies the stored mask
+        return _make_cost(2 * elements, 3 * elements * element_size, elements, 3 * elements * element_size)
+
 
 class FullyConnected(Layer):
 
@@ -108,6 +184,49 @@ class FullyConnected(Layer):
         f_params['fc_param'] = { "num_output" : self.n }
         return {k: v for k, v in f_params.items() if v is not None}
 
+    def get_output_shapes(self, input_shapes):
+        if self.n <= 0:
+            raise ValueError("{}: n {} is not positive".format(self.name, self.n))
+        return [input_shapes[0][:-1] + (self.n,)]
+
+    def get_cost(self, batch_size, input_shapes, element_size=4):
+        rows = batch_size * get_size(input_shapes[0][:-1])
+        k = input_shapes[0][-1]
+        n = self.n
+        # forward: Y = XW + b, backward: dX = dY W^T, dW = X^T dY, db = sum(dY)
+        return _make_cost(2 * rows * k * n + rows * n,
+                         (rows * k + k * n + n + rows * n) * element_size,
+                         4 * rows * k * n + rows * n,
+                         (2 * rows * k + rows * n + 2 * k * n + n) * element_size)
+
+
+class FusedFullyConnected(FullyConnected):
+
+    def __init__(self, name, src_layers, n=1024):
+        '''
+        Fully connected layer followed by a ReLU in one kernel. HugeCTR supports it only in mixed precision.
+        :param name: str
+            Specifies name of a layer.
+        :param src_layers: Layer or a list of Layers
+            Specifies source layer(s) for a layer.
+        :param n: int
+            Specifies the number of neurons in the layer.
+        '''
+        super().__init__(name, src_layers, n)
+
+    def get_parameters(self):
+        f_params = super().get_parameters()
+        f_params['type'] = 'FusedInnerProduct'
+        return f_params
+
+    def get_cost(self, batch_size, input_shapes, element_size=4):
+        cost = super().get_cost(batch_size, input_shapes, element_size)
+        # the activation is applied in registers, only its flops are added
+        outputs = batch_size * get_size(input_shapes[0][:-1]) * self.n
+        cost['forward_flops'] += outputs
+        cost['backward_flops'] += outputs
+        return cost
+
 
 class ELU(Layer):
 
@@ -130,6 +249,10 @@ class ELU(Layer):
         e_params['elu_param'] = { "elu_param" : self.alpha }
         return {k: v for k, v in e_params.items() if v is not None}
 
+    def get_cost(self, batch_size, input_shapes, element_size=4):
+        elements = batch_size * get_size(input_shapes[0])
+        return _make_cost(4 * elements, 2 * elements * element_size, 2 * elements, 3 * elements * element_size)
+
 
 class Reshape(Layer):
 
@@ -153,6 +276,15 @@ class Reshape(Layer):
         r_params['leading_dim'] = self.leading_dim
         return {k: v for k, v in r_params.items() if v is not None}
 
+    def get_output_shapes(self, input_shapes):
+        width = get_size(input_shapes[0])
+        if self.leading_dim <= 0 or width % self.leading_dim != 0:
+            raise ValueError("{}: leading_dim {} does not divide input width {}".format(
+                self.name, self.leading_dim, width))
+        if width == self.leading_dim:
+            return [(self.leading_dim,)]
+        return [(width // self.leading_dim, self.leading_dim)]
+
 
 class Concat(Layer):
 
@@ -169,6 +301,35 @@ class Concat(Layer):
     def get_parameters(self):
         c_params = super().get_parameters()
         c_params['type'] = 'Concat'
+        return {k: v for k, v in c_params.items() if v is not None}
+
+    def get_output_shapes(self, input_shapes):
+        leading = input_shapes[0][:-1]
+        for shape in input_shapes[1:]:
+            if shape[:-1] != leading:
+                raise ValueError("{}: cannot concat shapes {}".format(self.name, list(input_shapes)))
+        return [leading + (sum(shape[-1] for shape in input_shapes),)]
+
+    def get_cost(self, batch_size, input_shapes, element_size=4):
+        elements = batch_size * sum(get_size(shape) for shape in input_shapes)
+        return _make_cost(0, 2 * elements * element_size, 0, 2 * elements * element_size)
+
+
+class Top:
+
+    def __init__(self, layer, index):
+        '''
+        One of the outputs of a layer producing several tensors, e.g. a range of a Slice layer.
+        :param layer: Layer
+            Specifies the layer producing the output.
+        :param index: int
+            Specifies the position of the output in `layer.get_top_names()`.
+        '''
+        self.layer = layer
+        self.index = index
+
+    def get_name(self):
+        return self.layer.get_top_names()[self.index]
 
 
 class Slice(Layer):
@@ -190,17 +351,38 @@ class Slice(Layer):
         s_params = super().get_parameters()
 
         # change top if there are multiple ranges
-        length = len(self.ranges)
-        if length > 1:
-            s = []
-            for i in range(0, length):
-                s.append(self.get_name()+"_"+i)
-            s_params['top'] = s
+        if len(self.ranges) > 1:
+            s_params['top'] = self.get_top_names()
 
         s_params['ranges'] = self.ranges
         s_params['type'] = 'Slice'
         return {k: v for k, v in s_params.items() if v is not None}
 
+    def get_top(self, index):
+        '''
+        Returns the output of the range at `index`, to be used as the source of another layer.
+        '''
+        return Top(self, index)
+
+    def get_top_names(self):
+        if len(self.ranges) > 1:
+            return [self.get_name() + "_" + str(i) for i in range(0, len(self.ranges))]
+        return [self.name]
+
+    def get_output_shapes(self, input_shapes):
+        shape = input_shapes[0]
+        outputs = []
+        for start, end in self.ranges:
+            if not 0 <= start < end <= shape[-1]:
+                raise ValueError("{}: range [{}, {}] does not fit input width {}".format(
+                    self.name, start, end, shape[-1]))
+            outputs.append(shape[:-1] + (end - start,))
+        return outputs
+
+    def get_cost(self, batch_size, input_shapes, element_size=4):
+        elements = batch_size * sum(get_size(shape) for shape in self.get_output_shapes(input_shapes))
+        return _make_cost(0, 2 * elements * element_size, 0, 2 * elements * element_size)
+
 
 class DistributedSlotSparseEmbeddingHash(Layer):
 
@@ -227,6 +409,54 @@ class DistributedSlotSparseEmbeddingHash(Layer):
         self.embedding_vec_size = embedding_vec_size
         self.combiner = combiner
 
+    def get_capacity(self):
+        '''
+        Returns the number of rows allocated for the hashtable, i.e. vocabulary_size / load_factor.
+        '''
+        return int(math.ceil(self.vocabulary_size / self.load_factor))
+
+    def get_row_bytes(self, num_state_tables=0, mixed_precision=None):
+        '''
+        Returns the bytes used by one row of the hashtable.
+        :param num_state_tables: int
+            Specifies the number of extra tables the optimizer keeps per embedding weight.
+        :param mixed_precision: int, optional
+            If set, embedding vectors and optimizer states are stored in half precision.
+        '''
+        element_size = 2 if mixed_precision else 4
+        return KEY_BYTES + self.embedding_vec_size * element_size * (1 + num_state_tables)
+
+    def get_memory_bytes(self, num_state_tables=0, mixed_precision=None):
+        '''
+        Returns the total bytes used by the hashtable before it is sharded across GPUs.
+        '''
+        return self.get_capacity() * self.get_row_bytes(num_state_tables, mixed_precision)
+
+    def get_output_shapes(self, input_shapes):
+        if len(input_shapes[0]) != 2:
+            raise ValueError("{}: expects sparse input of (slot_num, max_feature_num_per_sample) keys, got {}".format(
+                self.name, input_shapes[0]))
+        if self.vocabulary_size <= 0 or self.embedding_vec_size <= 0:
+            raise ValueError("{}: vocabulary_size and embedding_vec_size must be positive".format(self.name))
+        if not 0 < self.load_factor <= 1:
+            raise ValueError("{}: load_factor {} is not in (0, 1]".format(self.name, self.load_factor))
+        if self.combiner not in (0, 1):
+            raise ValueError("{}: combiner {} is neither 0 (sum) nor 1 (mean)".format(self.name, self.combiner))
+        # input is (slot_num, max_feature_num_per_sample) keys, one combined vector is produced per slot
+        return [(input_shapes[0][0], self.embedding_vec_size)]
+
+    def get_cost(self, batch_size, input_shapes, element_size=4):
+        slot_num, max_feature_num = input_shapes[0]
+        keys = batch_size * slot_num * max_feature_num
+        gathered = keys * self.embedding_vec_size
+        outputs = batch_size * slot_num * self.embedding_vec_size
+        # forward reads the keys and their rows and combines them per slot,
+        # backward scatters the output gradients to the rows of the keys
+        return _make_cost(gathered,
+                         keys * KEY_BYTES + (gathered + outputs) * element_size,
+                         gathered,
+                         keys * KEY_BYTES + (2 * gathered + outputs) * element_size)
+
     def get_parameters(self):
         d_params = super().get_parameters()
         d_params['type'] = 'DistributedSlotSparseEmbeddingHash'
@@ -237,6 +467,34 @@ class DistributedSlotSparseEmbeddingHash(Layer):
         return {k: v for k, v in d_params.items() if v is not None}
 
 
+class LocalizedSlotSparseEmbeddingHash(DistributedSlotSparseEmbeddingHash):
+
+    def __init__(self, name, src_layers, vocabulary_size, load_factor, embedding_vec_size, combiner):
+        '''
+        Localized Slot Sparse Embedding Hash layer. Every slot is stored on a single GPU, slot i on the i % n-th of
+        the n GPUs, instead of every slot being spread over all GPUs. The Sparse input must have type
+        'LocalizedSlot'.
+        :param name: str
+            Specifies name of a layer.
+        :param src_layers: Layer or a list of Layers
+            Specifies source layer(s) for a layer.
+        :param vocabulary_size: int or long
+            Specifies the maximum vocabulary size for the embedding.
+        :param load_factor: float
+            Specifies the radio of the loaded vocabulary to capacity of the hashtable.
+        :param embedding_vec_size: int
+            Specifies the vector size of an embedding weight (value).
+        :param combiner: Boolean
+            If set to 0 then sum, if set to 1 then mean
+        '''
+        super().__init__(name, src_layers, vocabulary_size, load_factor, embedding_vec_size, combiner)
+
+    def get_parameters(self):
+        l_params = super().get_parameters()
+        l_params['type'] = 'LocalizedSlotSparseEmbeddingHash'
+        return l_params
+
+
 class RELU(Layer):
     def __init__(self, name, src_layers):
         '''
@@ -253,6 +511,10 @@ class RELU(Layer):
         r_params['type'] = 'ReLu'
         return {k: v for k, v in r_params.items() if v is not None}
 
+    def get_cost(self, batch_size, input_shapes, element_size=4):
+        elements = batch_size * get_size(input_shapes[0])
+        return _make_cost(elements, 2 * elements * element_size, elements, 3 * elements * element_size)
+
 
 class BinaryCrossEntropyLoss(Layer):
     def __init__(self, name, src_layers):
@@ -270,8 +532,19 @@ class BinaryCrossEntropyLoss(Layer):
         b_params['type'] = 'BinaryCrossEntropyLoss'
         return {k: v for k, v in b_params.items() if v is not None}
 
+    def get_output_shapes(self, input_shapes):
+        if len(input_shapes) != 2 or input_shapes[0] != input_shapes[1]:
+            raise ValueError("{}: expects predictions and labels of the same shape, got {}".format(
+                self.name, list(input_shapes)))
+        return [()]
+
+    def get_cost(self, batch_size, input_shapes, element_size=4):
+        elements = batch_size * get_size(input_shapes[0])
+        # sigmoid and log loss forward, gradient of the predictions backward
+        return _make_cost(5 * elements, 2 * elements * element_size, 3 * elements, 3 * elements * element_size)
 
-class Dense:
+
+class Dense(Serializable):
 
     def __init__(self, name, dim=0):
         '''
@@ -293,9 +566,9 @@ class Dense:
     def get_name(self):
         return self.name
 
-class Sparse:
+class Sparse(Serializable):
 
-    def __init__(self, name, slot_num, max_feature_num_per_sample=100):
+    def __init__(self, name, slot_num, max_feature_num_per_sample=100, type='DistributedSlot'):
         '''
 
         :param name: str
@@ -304,15 +577,18 @@ class Sparse:
             Specifies slot number.
         :param max_feature_num_per_sample: int
             Specifies maximum feature number per sample.
+        :param type: str
+            Specifies the embedding reading the input, 'DistributedSlot' or 'LocalizedSlot'.
         '''
         self.name = name
         self.slot_num = slot_num
         self.max_feature_num_per_sample = max_feature_num_per_sample
+        self.type = type
 
     def get_parameters(self):
         s_params = dict()
         s_params['top'] = self.name
-        s_params['type'] = "DistributedSlot"
+        s_params['type'] = self.type
         s_params['max_faeture_num_per_sample'] = self.max_feature_num_per_sample
         s_params['slot_num'] = self.slot_num
         return {k: v for k, v in s_params.items() if v is not None}
@@ -320,7 +596,7 @@ class Sparse:
     def get_name(self):
         return self.name
 
-class Label:
+class Label(Serializable):
 
     def __init__(self, name, dim):
         self.name = name
@@ -381,5 +657,17 @@ class Data(Layer):
         d_params['sparse'] = {'sparse': s}
         return {k: v for k, v in d_params.items() if v is not None}
 
+    def get_cache_key(self):
+        return (self.label.get_json(), self.dense.get_json()) + tuple(sp.get_json() for sp in self.sparse)
+
+    def get_top_names(self):
+        return [self.label.get_name(), self.dense.get_name()] + [sp.get_name() for sp in self.sparse]
+
+    def get_output_shapes(self, input_shapes):
+        shapes = [(self.label.dim,), (self.dense.dim,)]
+        for sp in self.sparse:
+            shapes.append((sp.slot_num, sp.max_feature_num_per_sample))
+        return shapes
+
     def __str__(self):
         return str(self.get_parameters())
\ No newline at end of file
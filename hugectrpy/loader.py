@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import inspect
+import json
+from collections.abc import MutableSequence
+
+from hugectrpy import layers as L
+from hugectrpy.model import Solver, AdamOptimizer, MomentumSGD, Nesterov
+
+
+def load_model(source, model_class):
+    '''
+    Parses a HugeCTR JSON configuration into `model_class`. See `Model.from_json`.
+    '''
+    if isinstance(source, str):
+        with open(source) as fp:
+            config = json.load(fp)
+    else:
+        config = json.load(source)
+
+    return model_class(solver=build_solver(config['solver']),
+                       optimizer=build_optimizer(config['optimizer']),
+                       layers=LazyLayers(config.get('layers', [])))
+
+
+def build_solver(params):
+    params = dict(params)
+    if 'batchsize' in params:
+        params['batch_size'] = params.pop('batchsize')
+    # keys of HugeCTR versions the Solver does not model are ignored
+    known = inspect.signature(Solver).parameters
+    return Solver(**{key: value for key, value in params.items() if key in known})
+
+
+def build_optimizer(params):
+    optimizer_type = params.get('type')
+    if optimizer_type == 'Adam':
+        hparam = params['adam_hparam']
+        return AdamOptimizer(gloabl_update=hparam.get('global_update', False), lr=hparam.get('learning_rate'),
+                             alpha=hparam.get('alpha'), beta1=hparam.get('beta1'), beta2=hparam.get('beta2'),
+                             epsilon=hparam.get('epsilon'))
+    elif optimizer_type in ('MomentumSGD', 'Nesterov'):
+        hparam = params['momentum_sgd_hparam']
+        optimizer_class = MomentumSGD if optimizer_type == 'MomentumSGD' else Nesterov
+        return optimizer_class(global_update=params.get('global_update', False), lr=hparam.get('learning_rate'),
+                               momentum=hparam.get('momentum_factor'))
+    raise ValueError("Unknown optimizer type: {}".format(optimizer_type))
+
+
+def build_data(params, sources):
+    label = params['label']['label']
+    dense = params['dense']['dense']
+    sparse = params['sparse']['sparse']
+    return L.Data(name=params['name'],
+                  label=L.Label(name=label['top'], dim=label['label_dim']),
+                  dense=L.Dense(name=dense['top'], dim=dense['dense_dim']),
+                  sparse=[L.Sparse(name=s['top'], slot_num=s['slot_num'],
+                                   max_feature_num_per_sample=s.get('max_feature_num_per_sample',
+                                                                    s.get('max_faeture_num_per_sample')),
+                                   type=s.get('type', 'DistributedSlot')) for s in sparse],
+                  source=params.get('source'), eval_source=params.get('eval_source'), check=params.get('check'))
+
+
+def build_embedding(params, sources):
+    hparam = params['sparse_embedding_hparam']
+    embedding_class = L.LocalizedSlotSparseEmbeddingHash if params['type'] == 'LocalizedSlotSparseEmbeddingHash' \
+        else L.DistributedSlotSparseEmbeddingHash
+    return embedding_class(params['name'], sources, vocabulary_size=hparam['vocabulary_size'],
+                           load_factor=hparam['load_factor'], embedding_vec_size=hparam['embedding_vec_size'],
+                           combiner=hparam['combiner'])
+
+
+# layer type in the configuration -> function building the layer from its parameters and source layers
+LAYER_BUILDERS = {
+    'Data': build_data,
+    'InnerProduct': lambda p, src: L.FullyConnected(p['name'], src, n=p['fc_param']['num_output']),
+    'FusedInnerProduct': lambda p, src: L.FusedFullyConnected(p['name'], src, n=p['fc_param']['num_output']),
+    'ELU': lambda p, src: L.ELU(p['name'], src, alpha=p['elu_param']['elu_param']),
+    'ReLu': lambda p, src: L.RELU(p['name'], src),
+    'Dropout': lambda p, src: L.Dropout(p['name'], src, rate=p['rate']),
+    'Reshape': lambda p, src: L.Reshape(p['name'], src, leading_dim=p['leading_dim']),
+    'Concat': lambda p, src: L.Concat(p['name'], src),
+    'Slice': lambda p, src: L.Slice(p['name'], src, ranges=p['ranges']),
+    'DistributedSlotSparseEmbeddingHash': build_embedding,
+    'LocalizedSlotSparseEmbeddingHash': build_embedding,
+    'BinaryCrossEntropyLoss': lambda p, src: L.BinaryCrossEntropyLoss(p['name'], src),
+}
+
+
+class LazyLayers(MutableSequence):
+
+    def __init__(self, configs):
+        '''
+        List of layers built from their configurations when first accessed. A layer is built together with the
+        layers it depends on, found through an index from top names to configurations.
+        :param configs: list of dict
+            Specifies the `layers` section of a configuration.
+        '''
+        # every entry is a [configuration, layer] cell, the layer is None until it is built
+        self._cells = []
+        self._index = dict()
+        for config in configs:
+            if config.get('type') not in LAYER_BUILDERS:
+                raise ValueError("Unknown layer type {} of layer {}".format(config.get('type'), config.get('name')))
+            self._cells.append([config, None])
+        self._reindex()
+
+    def _reindex(self):
+        self._index = dict()
+        for cell in self._cells:
+            outputs = self._get_outputs(cell[0]) if cell[0] is not None else self._get_layer_outputs(cell[1])
+            for top, output in outputs:
+                self._index[top] = (cell, output)
+
+    @staticmethod
+    def _get_outputs(config):
+        # (top name, how to get that output from the built layer) pairs
+        if config['type'] == 'Data':
+            yield config['label']['label']['top'], 'label'
+            yield config['dense']['dense']['top'], 'dense'
+            for i, sparse in enumerate(config['sparse']['sparse']):
+                yield sparse['top'], i
+        elif isinstance(config.get('top'), list):
+            for i, top in enumerate(config['top']):
+                yield top, i
+        else:
+            yield config.get('top', config['name']), None
+
+    @staticmethod
+    def _get_layer_outputs(layer):
+        # the same pairs for a layer set directly
+        if isinstance(layer, L.Data):
+            yield layer.label.get_name(), 'label'
+            yield layer.dense.get_name(), 'dense'
+            for i, sparse in enumerate(layer.sparse):
+                yield sparse.get_name(), i
+            return
+        tops = layer.get_top_names()
+        if len(tops) > 1:
+            for i, top in enumerate(tops):
+                yield top, i
+        else:
+            yield tops[0], None
+
+    @staticmethod
+    def _get_bottoms(config):
+        bottom = config.get('bottom')
+        if bottom is None:
+            return []
+        return bottom if isinstance(bottom, list) else [bottom]
+
+    def _resolve(self, name):
+        cell, output = self._index[name]
+        layer = cell[1]
+        if output is None:
+            return layer
+        elif output == 'label':
+            return layer.label
+        elif output == 'dense':
+            return layer.dense
+        elif isinstance(layer, L.Data):
+            return layer.sparse[output]
+        return layer.get_top(output)
+
+    def _build(self, cell):
+        visiting = set()
+        stack = [cell]
+        while stack:
+            current = stack[-1]
+            if current[1] is not None:
+                stack.pop()
+                continue
+            config = current[0]
+            bottoms = self._get_bottoms(config)
+            pending = []
+            for bottom in bottoms:
+                if bottom not in self._index:
+                    raise ValueError("{}: bottom {} is not produced by any layer".format(config['name'], bottom))
+                if self._index[bottom][0][1] is None:
+                    pending.append(self._index[bottom][0])
+            if pending:
+                if id(current) in visiting:
+                    raise ValueError("Cycle detected: {} depends on itself".format(config['name']))
+                visiting.add(id(current))
+                stack.extend(pending)
+                continue
+            sources = [self._resolve(bottom) for bottom in bottoms]
+            if len(sources) == 0:
+                sources = None
+            elif not isinstance(config['bottom'], list):
+                sources = sources[0]
+            current[1] = LAYER_BUILDERS[config['type']](config, sources)
+            stack.pop()
+        return cell[1]
+
+    def get_built_count(self):
+        '''
+        Returns the number of layers built so far.
+        '''
+        return sum(1 for cell in self._cells if cell[1] is not None)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._build(cell) for cell in self._cells[index]]
+        return self._build(self._cells[index])
+
+    def __setitem__(self, index, layer):
+        if isinstance(index, slice):
+            self._cells[index] = [[None, l] for l in layer]
+        else:
+            self._cells[index] = [None, layer]
+        self._reindex()
+
+    def __delitem__(self, index):
+        del self._cells[index]
+        self._reindex()
+
+    def __len__(self):
+        return len(self._cells)
+
+    def insert(self, index, layer):
+        cell = [None, layer]
+        self._cells.insert(index, cell)
+        for top, output in self._get_layer_outputs(layer):
+            self._index[top] = (cell, output)
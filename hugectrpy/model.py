@@ -15,6 +15,10 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import math
+
+from hugectrpy.serialization import Serializable
+
 
 class Model:
 
@@ -35,43 +39,566 @@ class Model:
         else:
             self.layers = layers
 
+    @classmethod
+    def from_json(cls, source):
+        '''
+
+        Loads a model from a HugeCTR JSON configuration. Layers are built when they are first accessed,
+        together with the layers they depend on.
+        :param source: str or file-like object
+            Specifies the path of the configuration or an open text stream.
+        :return: Model
+        '''
+        from hugectrpy.loader import load_model
+        return load_model(source, cls)
+
     def get_parameters(self):
+        '''
+        Returns the configuration as a dict. The solver, optimizer and layer parameters are cached by those objects,
+        so the returned dict must not be modified.
+        '''
         parameters = dict()
-        parameters['solver'] = self.solver.get_parameters()
-        parameters['optimizer'] = self.optimizer.get_parameters()
+        parameters['solver'] = self.solver.get_cached_parameters()
+        parameters['optimizer'] = self.optimizer.get_cached_parameters()
         all_layers=[]
         for layer in self.layers:
-            all_layers.append(layer.get_parameters())
+            all_layers.append(layer.get_cached_parameters())
         parameters['layers'] = all_layers
         return {k: v for k, v in parameters.items() if v is not None}
 
     def __str__(self):
-        import json
-        return json.dumps(self.get_parameters())
+        return ''.join(self.iter_json_chunks())
+
+    def iter_json_chunks(self, cache=True):
+        '''
+
+        Yields the configuration as JSON text piece by piece: the solver, the optimizer and then one layer at a
+        time. Joined, the pieces are the same text as json.dumps(self.get_parameters()).
+        :param cache: Boolean
+            If set to False, JSON of objects not cached yet is not kept, so memory stays bounded by the largest layer.
+        '''
+        yield '{"solver": '
+        yield self.solver.get_json(cache)
+        yield ', "optimizer": '
+        yield self.optimizer.get_json(cache)
+        yield ', "layers": ['
+        for i, layer in enumerate(self.layers):
+            if i > 0:
+                yield ', '
+            yield layer.get_json(cache)
+        yield ']}'
+
+    def dump(self, fp, cache=False):
+        '''
+
+        Writes the configuration to a file without building the whole document in memory.
+        :param fp: file-like object
+            Specifies a text stream with a `write` method, e.g. an open file or `socket.makefile('w')`.
+        :param cache: Boolean
+            Specifies whether JSON built while writing is cached in the objects.
+        '''
+        for chunk in self.iter_json_chunks(cache):
+            fp.write(chunk)
+
+    def launch(self, binary='huge_ctr', config_path='config.json', args=None, cwd=None, env=None):
+        '''
+
+        Writes the configuration and starts training with the HugeCTR binary, `binary --train config_path`.
+        The output is parsed while it streams, see `Job`.
+        :param binary: str or list of str
+            Specifies the training binary, or a command line the arguments are appended to.
+        :param config_path: str
+            Specifies where the configuration is written, relative to `cwd` if given.
+        :param args: list of str, optional
+            Specifies more arguments of the binary.
+        :param cwd: str, optional
+            Specifies the working directory of the binary.
+        :param env: dict, optional
+            Specifies the environment of the binary.
+        :return: Job
+        '''
+        import os
+        from hugectrpy.launch import Job
+        with open(os.path.join(cwd, config_path) if cwd else config_path, 'w') as fp:
+            self.dump(fp)
+        command = [binary] if isinstance(binary, str) else list(binary)
+        return Job(command + ['--train', config_path] + list(args or []), self.solver.batch_size, cwd, env)
 
     def add_layer(self, layer):
         self.layers.append(layer)
 
     def add_layer_re(self, layer):
-        from hugectrpy.layers import Layer
-        if isinstance(layer, Layer):
-            self.layers.append(layer)
-            if layer.get_src_layers_count() > 1:
-                for sl in layer.get_src_layers():
-                    self.add_layer_re(sl)
-            elif layer.get_src_layers_count == 1:
-                self.add_layer_re( layer.get_src_layers())
+        '''
+
+        Adds a layer together with every layer it depends on, sources before the layers that use them.
+        Layers already in the model and layers reached through several paths are added once. Runs in
+        O(layers + edges) without recursion.
+        :param layer: Layer
+            Specifies the last layer of the graph, typically the loss.
+        '''
+        from hugectrpy.layers import Layer, Top
+
+        def get_sources(l):
+            src = l.get_src_layers()
+            if src is None:
+                return iter(())
+            src = src if isinstance(src, list) else [src]
+            return iter([s.layer if isinstance(s, Top) else s for s in src])
+
+        if not isinstance(layer, Layer):
+            return
+        added = {id(l) for l in self.layers}
+        names = {l.get_name(): l for l in self.layers}
+        if id(layer) in added:
+            return
+
+        # depth first search with an explicit stack, a layer is appended once all its sources are
+        visiting = {id(layer)}
+        stack = [(layer, get_sources(layer))]
+        while stack:
+            current, sources = stack[-1]
+            for src in sources:
+                if not isinstance(src, Layer) or id(src) in added:
+                    continue
+                if id(src) in visiting:
+                    raise ValueError("Cycle detected: {} depends on itself".format(src.get_name()))
+                visiting.add(id(src))
+                stack.append((src, get_sources(src)))
+                break
+            else:
+                stack.pop()
+                visiting.discard(id(current))
+                if names.get(current.get_name(), current) is not current:
+                    raise ValueError("Two different layers are named {}".format(current.get_name()))
+                names[current.get_name()] = current
+                added.add(id(current))
+                self.layers.append(current)
 
     def get_layer_count(self):
         return len(self.layers)
 
+    def plan_memory(self, device_memory=None, slot_weights=None):
+        '''
+
+        Estimates the memory used on every GPU by the embedding hashtables and the optimizer states kept for them.
+        A DistributedSlotSparseEmbeddingHash is sharded row-wise across all GPUs in `Solver.gpu`, the slots of a
+        LocalizedSlotSparseEmbeddingHash are stored whole, slot i on the i % n-th of the n GPUs.
+        :param device_memory: int or dict, optional
+            Specifies the memory budget in bytes of each GPU. A dict maps (node, gpu) tuples to budgets.
+            If a GPU exceeds its budget a ValueError is raised.
+        :param slot_weights: dict, optional
+            Maps names of localized embeddings to the relative size of every slot, in slot order, e.g. from
+            `ShardingPlan.get_slot_memory`. By default the slots have the same size.
+        :return: dict
+            Bytes used per GPU, keyed by (node, gpu) tuples.
+        '''
+        import numpy as np
+        from hugectrpy.layers import DistributedSlotSparseEmbeddingHash, LocalizedSlotSparseEmbeddingHash
+        devices = self.solver.get_devices()
+        num_state_tables = self.optimizer.get_state_tables_count()
+        plan = {device: 0 for device in devices}
+        for layer in self.layers:
+            if not isinstance(layer, DistributedSlotSparseEmbeddingHash):
+                continue
+            rows = layer.get_capacity()
+            row_bytes = layer.get_row_bytes(num_state_tables, self.solver.mixed_precision)
+            if isinstance(layer, LocalizedSlotSparseEmbeddingHash):
+                slot_num = layer.get_src_layers().slot_num
+                weights = (slot_weights or {}).get(layer.get_name())
+                weights = np.ones(slot_num) if weights is None else np.asarray(weights, dtype=np.float64)
+                if len(weights) != slot_num:
+                    raise ValueError("{}: {} slot weights for {} slots".format(
+                        layer.get_name(), len(weights), slot_num))
+                share = np.bincount(np.arange(slot_num) % len(devices), weights, len(devices)) / weights.sum()
+                # rows of every GPU, rounded so that they add up to the capacity
+                bounds = np.floor(np.concatenate(([0], np.cumsum(share))) * rows + 0.5).astype(np.int64)
+                device_rows = np.diff(bounds)
+            else:
+                # the first (rows % number of devices) shards hold one extra row
+                device_rows = [rows // len(devices) + (1 if i < rows % len(devices) else 0)
+                               for i in range(len(devices))]
+            for device, shard_rows in zip(devices, device_rows):
+                plan[device] += int(shard_rows) * row_bytes
+
+        if device_memory is not None:
+            errors = []
+            for device, used in plan.items():
+                budget = device_memory.get(device) if isinstance(device_memory, dict) else device_memory
+                if budget is not None and used > budget:
+                    errors.append("node {} gpu {} needs {} bytes, budget is {} bytes".format(
+                        device[0], device[1], used, budget))
+            if errors:
+                raise ValueError("Embedding memory exceeds GPU budget: " + "; ".join(errors))
+        return plan
+
+    def infer_shapes(self, errors=None):
+        '''
+
+        Propagates per sample tensor shapes through the layers in their order in the model, in a single pass.
+        :param errors: list, optional
+            If given, problems are appended to it and layers depending on a broken layer are skipped.
+            Otherwise a ValueError listing every problem is raised.
+        :return: list of (layer, input shapes, output shapes) tuples
+            One entry per layer whose shapes could be inferred.
+        '''
+        raise_errors = errors is None
+        if raise_errors:
+            errors = []
+
+        producers = dict()
+        for layer in self.layers:
+            for top in layer.get_top_names():
+                if top in producers:
+                    errors.append("{}: top {} is also produced by {}".format(
+                        layer.get_name(), top, producers[top].get_name()))
+                producers[top] = layer
+
+        shapes = dict()
+        # tops of layers that failed, their consumers are skipped without reporting the same problem again
+        failed = set()
+        inferred = []
+        for layer in self.layers:
+            input_shapes = []
+            for bottom in layer.get_bottom_names():
+                if bottom in shapes:
+                    input_shapes.append(shapes[bottom])
+                elif bottom in failed:
+                    input_shapes = None
+                elif bottom in producers:
+                    errors.append("{}: bottom {} is produced by {}, which comes later".format(
+                        layer.get_name(), bottom, producers[bottom].get_name()))
+                    input_shapes = None
+                else:
+                    errors.append("{}: bottom {} is not produced by any layer".format(layer.get_name(), bottom))
+                    input_shapes = None
+                if input_shapes is None:
+                    break
+
+            if input_shapes is not None:
+                try:
+                    output_shapes = layer.get_output_shapes(input_shapes)
+                except ValueError as e:
+                    errors.append(str(e))
+                else:
+                    shapes.update(zip(layer.get_top_names(), output_shapes))
+                    inferred.append((layer, input_shapes, output_shapes))
+                    continue
+            failed.update(layer.get_top_names())
+
+        if raise_errors and errors:
+            raise ValueError("Invalid model:\n  " + "\n  ".join(errors))
+        return inferred
+
+    def validate(self):
+        '''
+
+        Checks the solver and propagates shapes from the Data layer through every layer. Every problem found is
+        reported at once.
+        :return: dict
+            Per sample shape of every tensor, keyed by top name.
+        '''
+        errors = []
+        devices = self.solver.get_devices()
+        if len(devices) == 0:
+            errors.append("solver: no GPU is given")
+        elif self.solver.batch_size % len(devices) != 0:
+            errors.append("solver: batch_size {} is not divisible by the {} GPUs".format(
+                self.solver.batch_size, len(devices)))
+        if self.solver.mixed_precision not in (None, 128, 256, 512, 1024):
+            errors.append("solver: mixed_precision {} is not one of 128, 256, 512 and 1024".format(
+                self.solver.mixed_precision))
+
+        shapes = dict()
+        for layer, _, output_shapes in self.infer_shapes(errors):
+            shapes.update(zip(layer.get_top_names(), output_shapes))
+
+        if errors:
+            raise ValueError("Invalid model:\n  " + "\n  ".join(errors))
+        return shapes
+
+    def estimate_cost(self, peak_flops=15.7e12, memory_bandwidth=900e9):
+        '''
+
+        Estimates FLOPs, bytes moved and time of a training step with a roofline model. Each GPU is assumed to
+        process batch_size / number of GPUs samples, and each pass of a layer takes the longer of its compute
+        time and its memory time.
+        :param peak_flops: float
+            Specifies the peak FLOP/s of a GPU. Defaults to a V100 in single precision.
+        :param memory_bandwidth: float
+            Specifies the memory bandwidth of a GPU in bytes/s.
+        :return: dict
+            Totals `flops`, `bytes` and `step_time` in seconds, and the cost of every layer under `layers`.
+        '''
+        batch_size = self.solver.batch_size / len(self.solver.get_devices())
+        element_size = 2 if self.solver.mixed_precision else 4
+        layers = []
+        for layer, input_shapes, _ in self.infer_shapes():
+            cost = layer.get_cost(batch_size, input_shapes, element_size)
+            cost['name'] = layer.get_name()
+            cost['time'] = max(cost['forward_flops'] / peak_flops, cost['forward_bytes'] / memory_bandwidth) + \
+                max(cost['backward_flops'] / peak_flops, cost['backward_bytes'] / memory_bandwidth)
+            layers.append(cost)
+
+        estimate = dict()
+        estimate['flops'] = sum(c['forward_flops'] + c['backward_flops'] for c in layers)
+        estimate['bytes'] = sum(c['forward_bytes'] + c['backward_bytes'] for c in layers)
+        estimate['step_time'] = sum(c['time'] for c in layers)
+        estimate['layers'] = layers
+        return estimate
+
+    def check_alignment(self, multiple=8):
+        '''
+
+        Finds widths that are not multiples of `multiple`, which keeps tensor cores from running at full speed in
+        mixed precision: the inputs and outputs of FullyConnected layers, embedding vectors, Reshape leading
+        dimensions and Concat outputs. The efficiency is the share of the padded work that is useful, e.g. a
+        FullyConnected layer with 13 inputs and 200 outputs computes 13 of 16 padded columns.
+        :param multiple: int
+            Specifies the alignment, 8 halves for tensor cores.
+        :return: list of dict
+            `layer`, `parameter`, `value`, `aligned` (the padded value) and `efficiency` of every misaligned width,
+            in layer order.
+        '''
+        from hugectrpy import layers as L
+        findings = []
+
+        def check(layer, parameter, value, efficiency=None):
+            if value % multiple != 0:
+                aligned = _pad(value, multiple)
+                findings.append({'layer': layer.get_name(), 'parameter': parameter, 'value': value,
+                                 'aligned': aligned, 'efficiency': value / aligned if efficiency is None
+                                 else efficiency})
+
+        for layer, input_shapes, output_shapes in self.infer_shapes():
+            if isinstance(layer, L.FullyConnected):
+                k = input_shapes[0][-1]
+                efficiency = k / _pad(k, multiple) * layer.n / _pad(layer.n, multiple)
+                check(layer, 'input width', k, efficiency)
+                check(layer, 'n', layer.n, efficiency)
+            elif isinstance(layer, L.DistributedSlotSparseEmbeddingHash):
+                check(layer, 'embedding_vec_size', layer.embedding_vec_size)
+            elif isinstance(layer, L.Reshape):
+                check(layer, 'leading_dim', layer.leading_dim)
+            elif isinstance(layer, L.Concat):
+                check(layer, 'width', output_shapes[0][-1])
+        return findings
+
+    def pad_alignment(self, multiple=8):
+        '''
+
+        Pads `FullyConnected.n` and `embedding_vec_size` to multiples of `multiple` and updates the leading
+        dimension of the Reshape layers downstream so the graph stays consistent. Layers feeding a loss, directly
+        or through activations and dropout, keep their width, and so do layers whose padding would move the columns
+        a Slice selects, e.g. through a Concat or a Reshape to rows, or give a Reshape a width it cannot split. The padded units are extra trainable units, so the padded model is equivalent in shape,
+        not in numbers. Widths coming from the data (dense features) are not padded, see `check_alignment` for what
+        remains. All changes are computed first and applied only if the padded model validates, otherwise the model
+        is left unchanged.
+        :param multiple: int
+            Specifies the alignment.
+        :return: list of str
+            One line per changed layer.
+        '''
+        from hugectrpy import layers as L
+        # the predictions keep their width, through the layers that keep the shape of their input
+        producers = {top: layer for layer in self.layers for top in layer.get_top_names()}
+        pending = [bottom for layer in self.layers if isinstance(layer, L.BinaryCrossEntropyLoss)
+                   for bottom in layer.get_bottom_names()]
+        loss_inputs = set()
+        while pending:
+            name = pending.pop()
+            loss_inputs.add(name)
+            if type(producers.get(name)) in (L.RELU, L.ELU, L.Dropout):
+                pending.extend(producers[name].get_bottom_names())
+        # layers not padded because a Slice depends on their columns or a Reshape cannot split their width, grown
+        # until no layer does
+        keep = set()
+        while True:
+            changes, report, conflicts = self._plan_padding(multiple, loss_inputs | keep)
+            if not conflicts:
+                break
+            keep |= conflicts
+
+        previous = [(layer, attribute, getattr(layer, attribute)) for layer, attribute, _ in changes]
+        for layer, attribute, value in changes:
+            setattr(layer, attribute, value)
+        try:
+            self.validate()
+        except ValueError:
+            for layer, attribute, value in previous:
+                setattr(layer, attribute, value)
+            raise
+        return report
+
+    def _plan_padding(self, multiple, keep):
+        '''
+        Returns the (layer, attribute, value) changes and report of `pad_alignment` without applying them, and the
+        padded layers whose columns reach a Slice at another position or whose width a Reshape cannot split.
+        '''
+        import copy
+        from hugectrpy import layers as L
+        changes, report, conflicts = [], [], set()
+        shapes = dict()
+        # per top, the padded layers that changed its width and those that moved its columns
+        padded, moved = dict(), dict()
+        for layer, old_input_shapes, _ in self.infer_shapes():
+            name = layer.get_name()
+            bottoms = layer.get_bottom_names()
+            input_shapes = [shapes.get(bottom, shape) for bottom, shape in zip(bottoms, old_input_shapes)]
+            input_padded = set().union(*[padded.get(bottom, ()) for bottom in bottoms])
+            input_moved = set().union(*[moved.get(bottom, ()) for bottom in bottoms])
+            change = None
+            if isinstance(layer, L.FullyConnected):
+                # new weights read any column order, the padded units come last
+                input_padded, input_moved = set(), set()
+                if name not in keep and layer.n % multiple != 0:
+                    change = ('n', layer.n, _pad(layer.n, multiple))
+                    input_padded = {name}
+            elif isinstance(layer, L.DistributedSlotSparseEmbeddingHash):
+                if name not in keep and layer.embedding_vec_size % multiple != 0:
+                    change = ('embedding_vec_size', layer.embedding_vec_size,
+                              _pad(layer.embedding_vec_size, multiple))
+                    input_padded = input_padded | {name}
+            elif isinstance(layer, L.Reshape):
+                old_width = L.get_size(old_input_shapes[0])
+                width = L.get_size(input_shapes[0])
+                if width != old_width:
+                    # keep the number of rows, or a single row
+                    rows = old_width // layer.leading_dim
+                    if width % rows != 0:
+                        # the padded width cannot be split into the same rows, the layers padding it are kept and
+                        # the shapes that follow are not known
+                        return changes, report, conflicts | input_padded
+                    change = ('leading_dim', layer.leading_dim, width // rows)
+                    if old_input_shapes[0][:-1] != (rows,):
+                        # padding inside the rows of the input moves the columns that follow
+                        input_moved = input_moved | input_padded
+            elif isinstance(layer, L.Concat):
+                # padding an input moves the columns of the inputs after it
+                for bottom in bottoms[:-1]:
+                    input_moved = input_moved | padded.get(bottom, set())
+            elif isinstance(layer, L.Slice):
+                conflicts |= input_moved
+                input_padded, input_moved = set(), set()
+            if change is not None:
+                attribute, old_value, value = change
+                changes.append((layer, attribute, value))
+                report.append("{}: {} {} -> {}".format(name, attribute, old_value, value))
+                layer = copy.copy(layer)
+                setattr(layer, attribute, value)
+            shapes.update(zip(layer.get_top_names(), layer.get_output_shapes(input_shapes)))
+            for top in layer.get_top_names():
+                padded[top], moved[top] = input_padded, input_moved
+        return changes, report, conflicts
+
+    def optimize(self):
+        '''
 
-class Solver:
+        Rewrites the layers into an equivalent graph that runs faster, until no rule applies:
+        Dropout layers with rate 0 and Reshape layers that keep the shape of their input are removed,
+        FullyConnected layers feeding only a RELU are fused into a FusedFullyConnected when mixed_precision is set,
+        Concat layers feeding only another Concat are merged into it and layers that do not feed a loss are
+        dropped. Consumers of removed layers are rewired to their inputs. The model must be valid. The rewrites
+        apply to a copy of the layers, so layer objects the caller holds, or that other models share, keep the
+        original graph.
+        :return: list of str
+            One line per applied rewrite.
+        '''
+        import copy
+        from hugectrpy import layers as L
+        report = []
+        self.layers = copy.deepcopy(list(self.layers))
+        changed = True
+        while changed:
+            changed = False
+            shapes = {layer.get_name(): (input_shapes, output_shapes)
+                      for layer, input_shapes, output_shapes in self.infer_shapes()}
+            consumers = dict()
+            for layer in self.layers:
+                for bottom in layer.get_bottom_names():
+                    consumers.setdefault(bottom, []).append(layer)
+
+            for layer in self.layers:
+                name = layer.get_name()
+                if type(layer) is L.Dropout and layer.rate == 0:
+                    report.append("removed {}: dropout with rate 0".format(name))
+                elif type(layer) is L.Reshape and shapes[name][0][0] == shapes[name][1][0]:
+                    report.append("removed {}: reshape to the shape of its input {}".format(name, shapes[name][1][0]))
+                elif type(layer) is L.FullyConnected and self.solver.mixed_precision and \
+                        len(consumers.get(name, [])) == 1 and type(consumers[name][0]) is L.RELU:
+                    relu = consumers[name][0]
+                    fused = L.FusedFullyConnected(relu.get_name(), layer.get_src_layers(), n=layer.n)
+                    self.layers[self.layers.index(relu)] = fused
+                    _replace_source(self.layers, relu.get_name(), fused)
+                    report.append("fused {} and {} into FusedInnerProduct {}".format(
+                        name, relu.get_name(), fused.get_name()))
+                elif type(layer) is L.Concat and len(consumers.get(name, [])) == 1 and \
+                        type(consumers[name][0]) is L.Concat:
+                    outer = consumers[name][0]
+                    sources = []
+                    for source in _get_sources(outer):
+                        sources.extend(_get_sources(layer) if source.get_name() == name else [source])
+                    outer.src_layers = sources
+                    report.append("merged {} into {}".format(name, outer.get_name()))
+                    self.layers.remove(layer)
+                    changed = True
+                    break
+                else:
+                    continue
+                # the layer is replaced by its only input
+                if not isinstance(layer, L.Concat):
+                    _replace_source(self.layers, name, _get_sources(layer)[0])
+                    self.layers.remove(layer)
+                changed = True
+                break
+
+        losses = [layer for layer in self.layers if isinstance(layer, L.BinaryCrossEntropyLoss)]
+        if losses:
+            producers = {top: layer for layer in self.layers for top in layer.get_top_names()}
+            needed = set()
+            pending = list(losses)
+            while pending:
+                layer = pending.pop()
+                if id(layer) in needed:
+                    continue
+                needed.add(id(layer))
+                pending.extend(producers[bottom] for bottom in layer.get_bottom_names())
+            for layer in [layer for layer in self.layers if id(layer) not in needed]:
+                if not isinstance(layer, L.Data):
+                    report.append("removed {}: does not feed the loss".format(layer.get_name()))
+                    self.layers.remove(layer)
+        return report
+
+
+def _pad(value, multiple):
+    return -(-value // multiple) * multiple
+
+
+def _get_sources(layer):
+    sources = layer.get_src_layers()
+    if sources is None:
+        return []
+    return list(sources) if isinstance(sources, list) else [sources]
+
+
+def _replace_source(layers, name, source):
+    '''
+    Makes the layers reading the tensor `name` read `source` instead.
+    '''
+    for layer in layers:
+        sources = layer.get_src_layers()
+        if isinstance(sources, list):
+            if any(s.get_name() == name for s in sources):
+                layer.src_layers = [source if s.get_name() == name else s for s in sources]
+        elif sources is not None and sources.get_name() == name:
+            layer.src_layers = source
+
+
+class Solver(Serializable):
 
     def __init__(self, lr_policy='fixed', display=1000, max_iter=30000, gpu=[0],
                  batch_size=512, snapshot=100000, snapshot_prefix="./",
                  eval_interval=1000, eval_batches=60, mixed_precision=None,
-                 dense_model_file=None, sparse_model_file=None):
+                 dense_model_file=None, sparse_model_file=None, warmup_steps=None):
         '''
 
         :param lr_policy: str, optional
@@ -102,6 +629,8 @@ class Solver:
             In v2.1 multi-embeddings are supported in one model. Each embedding will have one model file.
         :param dense_model_file:
             Specifies model file for dense model. No need to config if train from scratch
+        :param warmup_steps: int, optional
+            Specifies the number of iterations over which the learning rate ramps up linearly.
         '''
         self.lr_policy = lr_policy
         self.display = display
@@ -120,6 +649,89 @@ class Solver:
         self.mixed_precision = mixed_precision
         self.dense_model_file = dense_model_file
         self.sparse_model_file = sparse_model_file
+        self.warmup_steps = warmup_steps
+
+    def get_cache_key(self):
+        # gpu and sparse_model_file are lists and may be changed in place
+        return str(self.gpu), str(self.sparse_model_file)
+
+    def get_devices(self):
+        '''
+        Returns the GPUs of `gpu` as a list of (node, gpu) tuples. A flat list is treated as a single node.
+        '''
+        if len(self.gpu) > 0 and isinstance(self.gpu[0], list):
+            return [(node, g) for node, gpus in enumerate(self.gpu) for g in gpus]
+        return [(0, g) for g in self.gpu]
+
+    def scale_to(self, gpu, optimizer=None, lr_rule='linear', warmup_steps=None, eval_overhead=None,
+                 eval_cost=1.0 / 3, snapshot_overhead=None, step_time=None, snapshot_time=None):
+        '''
+
+        Plans the move of a training job to another set of GPUs. The batch size per GPU is kept, so the global
+        batch size grows with the number of GPUs and fewer iterations cover the same data: `max_iter`,
+        `eval_interval`, `snapshot` and `warmup_steps` are divided by the scale so the number of epochs and the
+        samples between evaluations and snapshots stay the same, and `eval_batches` so the same number of samples
+        is evaluated. The solver and the optimizer are not modified, scaled copies are returned in the plan.
+        :param gpu: list of integer
+            Specifies the new GPUs, in the format of `gpu`.
+        :param optimizer: Optimizer, optional
+            Specifies the optimizer whose learning rate (and alpha for Adam) is scaled.
+        :param lr_rule: str
+            'linear' multiplies the learning rate by the scale, 'sqrt' by its square root, 'none' keeps it.
+        :param warmup_steps: int, optional
+            Specifies the warmup of the new job. By default an existing warmup is scaled like `max_iter`, and when
+            the learning rate grows without one the first 1% of the iterations (at least 1) are used.
+        :param eval_overhead: float, optional
+            If set, `eval_interval` is raised so that evaluation takes at most this fraction of the training time.
+        :param eval_cost: float
+            Specifies the time of an evaluation batch relative to a training iteration, forward only by default.
+        :param snapshot_overhead: float, optional
+            If set with `step_time` and `snapshot_time`, `snapshot` is raised so that writing snapshots takes at most
+            this fraction of the training time.
+        :param step_time: float, optional
+            Specifies the time in seconds of a training iteration on the new GPUs, e.g. from
+            `Model.estimate_cost`.
+        :param snapshot_time: float, optional
+            Specifies the time in seconds of writing a snapshot.
+        :return: ScalingPlan
+        '''
+        import copy
+        if lr_rule not in ('linear', 'sqrt', 'none'):
+            raise ValueError("lr_rule must be 'linear', 'sqrt' or 'none', got {}".format(lr_rule))
+        solver = copy.copy(self)
+        solver.gpu = copy.deepcopy(gpu) if not isinstance(gpu, int) else [gpu]
+        if len(solver.get_devices()) == 0:
+            raise ValueError("gpu must list at least one GPU")
+        scale = len(solver.get_devices()) / len(self.get_devices())
+
+        solver.batch_size = int(round(self.batch_size * scale))
+        solver.max_iter = max(1, int(math.ceil(self.max_iter / scale)))
+        solver.eval_interval = max(1, int(round(self.eval_interval / scale)))
+        solver.eval_batches = max(1, int(math.ceil(self.eval_batches / scale)))
+        solver.snapshot = max(1, int(round(self.snapshot / scale)))
+        lr_scale = {'linear': scale, 'sqrt': math.sqrt(scale), 'none': 1.0}[lr_rule]
+        if warmup_steps is not None:
+            solver.warmup_steps = warmup_steps
+        elif self.warmup_steps is not None:
+            solver.warmup_steps = max(1, int(round(self.warmup_steps / scale)))
+        elif lr_scale > 1:
+            solver.warmup_steps = max(1, solver.max_iter // 100)
+
+        if eval_overhead is not None:
+            # eval_batches * eval_cost / eval_interval is the time spent evaluating per training iteration
+            solver.eval_interval = max(solver.eval_interval,
+                                       int(math.ceil(solver.eval_batches * eval_cost / eval_overhead)))
+        if snapshot_overhead is not None and step_time is not None and snapshot_time is not None:
+            solver.snapshot = max(solver.snapshot, int(math.ceil(snapshot_time / (snapshot_overhead * step_time))))
+
+        scaled_optimizer = None
+        if optimizer is not None:
+            scaled_optimizer = copy.copy(optimizer)
+            if optimizer.lr is not None:
+                scaled_optimizer.lr = optimizer.lr * lr_scale
+            if isinstance(optimizer, AdamOptimizer) and optimizer.alpha is not None:
+                scaled_optimizer.alpha = optimizer.alpha * lr_scale
+        return ScalingPlan(self, solver, optimizer, scaled_optimizer, scale)
 
     def get_parameters(self):
         parameter_list = dict()
@@ -135,6 +747,7 @@ class Solver:
         parameter_list['mixed_precision'] = self.mixed_precision
         parameter_list['dense_model_file'] = self.dense_model_file
         parameter_list['sparse_model_file'] = self.sparse_model_file
+        parameter_list['warmup_steps'] = self.warmup_steps
 
         # this is kind of a sanity check
         return {k: v for k, v in parameter_list.items() if v is not None}
@@ -143,7 +756,50 @@ class Solver:
         return str(self.get_parameters())
 
 
-class Optimizer:
+class ScalingPlan:
+
+    def __init__(self, solver, scaled_solver, optimizer, scaled_optimizer, scale):
+        '''
+        Result of `Solver.scale_to`: the original and scaled solver and optimizer.
+        :param scale: float
+            Specifies the ratio of the new to the old number of GPUs.
+        '''
+        self.solver = solver
+        self.scaled_solver = scaled_solver
+        self.optimizer = optimizer
+        self.scaled_optimizer = scaled_optimizer
+        self.scale = scale
+
+    def apply(self, model):
+        '''
+        Sets the scaled solver and optimizer on a model.
+        '''
+        model.solver = self.scaled_solver
+        if self.scaled_optimizer is not None:
+            model.optimizer = self.scaled_optimizer
+
+    def get_rows(self):
+        '''
+        Returns (parameter, before, after) tuples of the planned values.
+        '''
+        rows = [('gpus', len(self.solver.get_devices()), len(self.scaled_solver.get_devices()))]
+        for name in ('batch_size', 'max_iter', 'warmup_steps', 'eval_interval', 'eval_batches', 'snapshot'):
+            rows.append((name, getattr(self.solver, name), getattr(self.scaled_solver, name)))
+        if self.optimizer is not None:
+            rows.append(('lr', self.optimizer.lr, self.scaled_optimizer.lr))
+            if isinstance(self.optimizer, AdamOptimizer):
+                rows.append(('alpha', self.optimizer.alpha, self.scaled_optimizer.alpha))
+        return rows
+
+    def __str__(self):
+        rows = [('parameter', 'before', 'after')] + [(name, str(before), str(after))
+                                                     for name, before, after in self.get_rows()]
+        widths = [max(len(str(row[i])) for row in rows) for i in range(3)]
+        return "\n".join("  ".join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip()
+                         for row in rows)
+
+
+class Optimizer(Serializable):
 
     def __init__(self, global_update=False, lr=0.01):
         '''
@@ -158,6 +814,12 @@ class Optimizer:
         self.global_update = global_update
         self.lr = lr
 
+    def get_state_tables_count(self):
+        '''
+        Returns the number of tables the optimizer keeps next to each embedding table.
+        '''
+        return 0
+
     def get_parameters(self):
         params = dict()
         params['global_update'] = self.global_update
@@ -196,6 +858,10 @@ class AdamOptimizer(Optimizer):
         self.beta2 = beta2
         self.epsilon = epsilon
 
+    def get_state_tables_count(self):
+        # first and second moments
+        return 2
+
     def get_parameters(self):
         adam_list = super().get_parameters()
         adam_list['alpha'] = self.alpha
@@ -229,6 +895,10 @@ class MomentumSGD(Optimizer):
         super().__init__(global_update, lr)
         self.momentum = momentum
 
+    def get_state_tables_count(self):
+        # momentum
+        return 1
+
     def get_parameters(self):
 
         momentum_list = dict()
@@ -260,6 +930,10 @@ class Nesterov(Optimizer):
         super().__init__(global_update, lr)
         self.momentum = momentum
 
+    def get_state_tables_count(self):
+        # momentum
+        return 1
+
     def get_parameters(self):
         nesterov_list = dict()
         nesterov_list['momentum_factor'] = self.momentum
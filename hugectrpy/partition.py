@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+
+import numpy as np
+
+from hugectrpy.data import HEADER_DTYPE, DataReader, write_file_list
+
+
+def get_file_weights(files, by='size'):
+    '''
+    Returns the size in bytes ('size') or the number of records read from the header ('records') of every file.
+    '''
+    if by == 'size':
+        return np.array([os.path.getsize(path) for path in files], dtype=np.int64)
+    elif by == 'records':
+        weights = []
+        for path in files:
+            header = np.fromfile(path, HEADER_DTYPE, count=1)
+            if len(header) == 0:
+                raise ValueError("{}: too small for a header".format(path))
+            weights.append(int(header[0]['number_of_records']))
+        return np.array(weights, dtype=np.int64)
+    raise ValueError("by must be 'size' or 'records', got {}".format(by))
+
+
+def pack_files(weights, parts, seed=None, max_moves=1000):
+    '''
+
+    Assigns files to parts so that the heaviest part is as light as possible. Files are placed heaviest first on
+    the lightest part (LPT), then single files are moved or swapped out of the heaviest part while that lowers
+    its load. With a seed, files of the same power-of-two size class are placed in a random order and ties
+    between parts are broken randomly, so every seed gives a different but still balanced assignment.
+    :param weights: int array
+        Specifies the weight of every file.
+    :param parts: int
+        Specifies the number of parts.
+    :param seed: int, optional
+        Specifies the seed of the shuffle, e.g. the epoch.
+    :param max_moves: int
+        Specifies the maximum number of moves and swaps of the local search.
+    :return: int array
+        Part of every file.
+    '''
+    if parts < 1:
+        raise ValueError("parts must be positive, got {}".format(parts))
+    weights = np.asarray(weights, dtype=np.float64)
+    if seed is None:
+        order = np.argsort(-weights, kind='stable')
+        tie_break = np.zeros(parts)
+    else:
+        rng = np.random.default_rng(seed)
+        size_class = np.floor(np.log2(np.maximum(weights, 1)))
+        order = np.lexsort((rng.random(len(weights)), -size_class))
+        tie_break = rng.random(parts)
+
+    assignment = np.zeros(len(weights), dtype=np.int64)
+    loads = np.zeros(parts)
+    for f in order:
+        # the lightest part, ties broken by tie_break
+        part = int(np.lexsort((tie_break, loads))[0])
+        assignment[f] = part
+        loads[part] += weights[f]
+
+    for _ in range(max_moves):
+        worst = int(np.argmax(loads))
+        # files sorted by part then weight, part p holds by_part[bounds[p]:bounds[p + 1]]
+        by_part = np.lexsort((weights, assignment))
+        bounds = np.searchsorted(assignment[by_part], np.arange(parts + 1))
+        mine = by_part[bounds[worst]:bounds[worst + 1]]
+        if len(mine) == 0:
+            break
+        # moving a file of the heaviest part to the lightest one
+        lightest = int(np.argmin(loads))
+        moved = np.maximum(loads[worst] - weights[mine], loads[lightest] + weights[mine])
+        best_move = int(np.argmin(moved))
+        # swapping a file of the heaviest part with a lighter file of another part: the new maximum is lowest
+        # for the file of that part closest to half the load difference below the moved file, so only the two
+        # neighbours of that weight among the sorted files of the part are tried
+        best_swap, swapped = None, np.inf
+        for part in range(parts):
+            files = by_part[bounds[part]:bounds[part + 1]]
+            if part == worst or len(files) == 0:
+                continue
+            targets = weights[mine] - (loads[worst] - loads[part]) / 2
+            nearest = np.searchsorted(weights[files], targets)
+            candidates = np.clip(np.stack((nearest - 1, nearest)), 0, len(files) - 1)
+            delta = weights[mine][None, :] - weights[files[candidates]]
+            after = np.maximum(loads[worst] - delta, loads[part] + delta)
+            best = np.unravel_index(np.argmin(after), after.shape)
+            if after[best] < swapped:
+                best_swap, swapped = (mine[best[1]], files[candidates[best]]), after[best]
+        if min(moved[best_move], swapped) >= loads[worst] - 1e-9:
+            break
+        if moved[best_move] <= swapped:
+            f = mine[best_move]
+            assignment[f] = lightest
+            loads[worst] -= weights[f]
+            loads[lightest] += weights[f]
+        else:
+            a, b = best_swap
+            part = assignment[b]
+            assignment[a], assignment[b] = part, worst
+            loads[worst] -= weights[a] - weights[b]
+            loads[part] += weights[a] - weights[b]
+    return assignment
+
+
+class PartitionPlan:
+
+    def __init__(self, files, weights, assignment, parts, seed=None):
+        '''
+        Result of `partition_files`.
+        :param files: list of str
+            Specifies the partitioned files.
+        :param weights: int array
+            Specifies the weight of every file.
+        :param assignment: int array
+            Specifies the part of every file.
+        :param parts: int
+            Specifies the number of parts.
+        :param seed: int, optional
+            Specifies the seed of the assignment, which also shuffles the order of the files of every part.
+        '''
+        self.files = files
+        self.weights = weights
+        self.assignment = assignment
+        self.parts = parts
+        self.seed = seed
+
+    def get_loads(self):
+        '''
+        Returns the total weight of every part.
+        '''
+        return np.bincount(self.assignment, self.weights, self.parts)
+
+    def get_imbalance(self):
+        '''
+        Returns the heaviest load relative to the mean, 1 being perfectly balanced. Every step, the parts wait
+        for the heaviest one for about 1 - 1 / imbalance of the time.
+        '''
+        loads = self.get_loads()
+        return float(loads.max() / max(loads.mean(), 1e-30))
+
+    def get_file_lists(self):
+        '''
+        Returns the files of every part.
+        '''
+        lists = []
+        rng = np.random.default_rng(self.seed) if self.seed is not None else None
+        for part in range(self.parts):
+            indices = np.flatnonzero(self.assignment == part)
+            if rng is not None:
+                indices = rng.permutation(indices)
+            lists.append([self.files[i] for i in indices])
+        return lists
+
+    def write(self, output_dir, prefix='file_list'):
+        '''
+        Writes one file list per part, `<prefix>.<part>.txt`, and returns their paths.
+        '''
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for part, files in enumerate(self.get_file_lists()):
+            paths.append(os.path.join(output_dir, "{}.{}.txt".format(prefix, part)))
+            write_file_list(paths[-1], files)
+        return paths
+
+    def __str__(self):
+        loads = self.get_loads()
+        counts = np.bincount(self.assignment, minlength=self.parts)
+        lines = ["part {}: {} files, weight {:.0f}".format(p, counts[p], loads[p]) for p in range(self.parts)]
+        lines.append("imbalance {:.3f}, the other parts idle {:.1%} of a step waiting for the heaviest".format(
+            self.get_imbalance(), 1 - 1 / max(self.get_imbalance(), 1e-30)))
+        return "\n".join(lines)
+
+
+def partition_files(data, parts, by='size', seed=None, eval=False, max_moves=1000):
+    '''
+
+    Splits the file list of a Data layer into balanced parts, e.g. one per node of `Solver.gpu` or one per
+    reader, so no part waits for a larger one every step.
+    :param data: Data
+        Specifies the Data layer whose file list is split.
+    :param parts: int
+        Specifies the number of parts.
+    :param by: str
+        Specifies the weight of a file: 'size' in bytes or 'records' read from its header.
+    :param seed: int, optional
+        Specifies the seed shuffling files between parts and within every part, e.g. the epoch. Without a seed
+        the assignment is deterministic LPT.
+    :param eval: Boolean
+        If set, `eval_source` is split instead of `source`.
+    :param max_moves: int
+        Specifies the maximum number of moves of the local search, see `pack_files`.
+    :return: PartitionPlan
+    '''
+    files = DataReader(data, 1, eval=eval).files
+    weights = get_file_weights(files, by)
+    return PartitionPlan(files, weights, pack_files(weights, parts, seed, max_moves), parts, seed)
@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import numpy as np
+
+from hugectrpy import layers as L
+from hugectrpy.model import AdamOptimizer, MomentumSGD, Nesterov
+
+
+class Kernel:
+
+    def __init__(self, layer, input_shapes, executor):
+        '''
+        Base class of the NumPy forward/backward implementation of a layer. Tensors are batch first.
+        :param layer: Layer
+            Specifies the layer to run.
+        :param input_shapes: list of tuples
+            Specifies the per sample shapes of the inputs.
+        :param executor: ReferenceExecutor
+            Specifies the executor owning the kernel, used for random numbers.
+        '''
+        self.layer = layer
+        self.input_shapes = input_shapes
+        self.executor = executor
+        # trainable arrays and their gradients, keyed by parameter name
+        self.params = dict()
+        self.grads = dict()
+
+    def forward(self, inputs, training):
+        '''
+        Returns the outputs in the order of `layer.get_top_names()`.
+        '''
+        raise NotImplementedError
+
+    def backward(self, grad_outputs):
+        '''
+        Returns the gradients of the inputs, None for inputs without gradient (keys, labels). Parameter gradients
+        are stored in `grads`.
+        '''
+        raise NotImplementedError
+
+
+class DataKernel(Kernel):
+
+    def forward(self, inputs, training):
+        batch = self.executor.batch
+        outputs = [np.asarray(batch[self.layer.label.get_name()], dtype=np.float32),
+                   np.asarray(batch[self.layer.dense.get_name()], dtype=np.float32)]
+        for sp in self.layer.sparse:
+            outputs.append(np.asarray(batch[sp.get_name()], dtype=np.int64))
+        return outputs
+
+    def backward(self, grad_outputs):
+        return []
+
+
+class FullyConnectedKernel(Kernel):
+
+    def __init__(self, layer, input_shapes, executor):
+        super().__init__(layer, input_shapes, executor)
+        k = input_shapes[0][-1]
+        n = layer.n
+        self.params['weight'] = executor.rng.normal(0, np.sqrt(2.0 / (k + n)), (k, n)).astype(np.float32)
+        self.params['bias'] = np.zeros(n, dtype=np.float32)
+
+    def forward(self, inputs, training):
+        self.x = inputs[0]
+        y = self.x.reshape(-1, self.x.shape[-1]) @ self.params['weight'] + self.params['bias']
+        return [y.reshape(self.x.shape[:-1] + (self.layer.n,))]
+
+    def backward(self, grad_outputs):
+        dy = grad_outputs[0].reshape(-1, self.layer.n)
+        x = self.x.reshape(-1, self.x.shape[-1])
+        self.grads['weight'] = x.T @ dy
+        self.grads['bias'] = dy.sum(axis=0)
+        return [(dy @ self.params['weight'].T).reshape(self.x.shape)]
+
+
+class FusedFullyConnectedKernel(FullyConnectedKernel):
+
+    def forward(self, inputs, training):
+        y = super().forward(inputs, training)[0]
+        self.mask = y > 0
+        return [y * self.mask]
+
+    def backward(self, grad_outputs):
+        return super().backward([grad_outputs[0] * self.mask])
+
+
+class RELUKernel(Kernel):
+
+    def forward(self, inputs, training):
+        self.mask = inputs[0] > 0
+        return [inputs[0] * self.mask]
+
+    def backward(self, grad_outputs):
+        return [grad_outputs[0] * self.mask]
+
+
+class ELUKernel(Kernel):
+
+    def forward(self, inputs, training):
+        self.x = inputs[0]
+        self.y = np.where(self.x > 0, self.x, self.layer.alpha * np.expm1(np.minimum(self.x, 0)))
+        return [self.y]
+
+    def backward(self, grad_outputs):
+        return [grad_outputs[0] * np.where(self.x > 0, 1, self.y + self.layer.alpha)]
+
+
+class DropoutKernel(Kernel):
+
+    def forward(self, inputs, training):
+        if not training or self.layer.rate == 0:
+            self.mask = None
+            return [inputs[0]]
+        keep = 1 - self.layer.rate
+        self.mask = (self.executor.rng.random(inputs[0].shape, dtype=np.float32) < keep) / np.float32(keep)
+        return [inputs[0] * self.mask]
+
+    def backward(self, grad_outputs):
+        if self.mask is None:
+            return [grad_outputs[0]]
+        return [grad_outputs[0] * self.mask]
+
+
+class ReshapeKernel(Kernel):
+
+    def forward(self, inputs, training):
+        self.shape = inputs[0].shape
+        return [inputs[0].reshape((len(inputs[0]),) + self.layer.get_output_shapes(self.input_shapes)[0])]
+
+    def backward(self, grad_outputs):
+        return [grad_outputs[0].reshape(self.shape)]
+
+
+class ConcatKernel(Kernel):
+
+    def forward(self, inputs, training):
+        self.widths = np.cumsum([x.shape[-1] for x in inputs])[:-1]
+        return [np.concatenate(inputs, axis=-1)]
+
+    def backward(self, grad_outputs):
+        return np.split(grad_outputs[0], self.widths, axis=-1)
+
+
+class SliceKernel(Kernel):
+
+    def forward(self, inputs, training):
+        self.shape = inputs[0].shape
+        return [inputs[0][..., start:end] for start, end in self.layer.ranges]
+
+    def backward(self, grad_outputs):
+        dx = np.zeros(self.shape, dtype=np.float32)
+        # ranges may overlap
+        for (start, end), dy in zip(self.layer.ranges, grad_outputs):
+            dx[..., start:end] += dy
+        return [dx]
+
+
+class EmbeddingKernel(Kernel):
+
+    def __init__(self, layer, input_shapes, executor):
+        '''
+        Hash embedding: a key is stored in row key % vocabulary_size, negative keys are padding.
+        '''
+        super().__init__(layer, input_shapes, executor)
+        bound = 1.0 / np.sqrt(layer.embedding_vec_size)
+        self.params['table'] = executor.rng.uniform(
+            -bound, bound, (layer.vocabulary_size, layer.embedding_vec_size)).astype(np.float32)
+
+    def get_rows(self, keys):
+        '''
+        Returns the rows of non-negative keys.
+        '''
+        return keys % self.layer.vocabulary_size
+
+    def lookup(self, rows):
+        '''
+        Returns the vectors of the given rows.
+        '''
+        return self.params['table'][rows]
+
+    def forward(self, inputs, training):
+        keys = inputs[0]
+        valid = keys >= 0
+        rows = self.get_rows(np.where(valid, keys, 0))
+        self.unique_rows, inverse = np.unique(rows[valid], return_inverse=True)
+        self.inverse = inverse.reshape(-1)
+        self.valid = valid
+        vectors = np.zeros(keys.shape + (self.layer.embedding_vec_size,), dtype=np.float32)
+        vectors[valid] = self.lookup(self.unique_rows)[self.inverse]
+        y = vectors.sum(axis=2)
+        self.scale = None
+        if self.layer.combiner == 1:
+            self.scale = 1.0 / np.maximum(valid.sum(axis=2, keepdims=True), 1).astype(np.float32)
+            y *= self.scale
+        return [y]
+
+    def backward(self, grad_outputs):
+        dy = grad_outputs[0]
+        if self.scale is not None:
+            dy = dy * self.scale
+        # gradient of every valid key, summed per row
+        per_key = np.broadcast_to(dy[:, :, None, :], self.valid.shape + dy.shape[-1:])[self.valid]
+        grad_rows = np.zeros((len(self.unique_rows), dy.shape[-1]), dtype=np.float32)
+        np.add.at(grad_rows, self.inverse, per_key)
+        self.grads['table'] = (self.unique_rows, grad_rows)
+        return [None]
+
+
+class BinaryCrossEntropyLossKernel(Kernel):
+
+    def forward(self, inputs, training):
+        self.x, self.label = inputs
+        x = self.x
+        loss = np.maximum(x, 0) - x * self.label + np.log1p(np.exp(-np.abs(x)))
+        return [np.float32(loss.mean())]
+
+    def backward(self, grad_outputs):
+        sigmoid = 1 / (1 + np.exp(-self.x))
+        return [(sigmoid - self.label) / np.float32(self.x.size), None]
+
+
+# layer class -> kernel class
+KERNELS = {
+    L.Data: DataKernel,
+    L.FullyConnected: FullyConnectedKernel,
+    L.FusedFullyConnected: FusedFullyConnectedKernel,
+    L.RELU: RELUKernel,
+    L.ELU: ELUKernel,
+    L.Dropout: DropoutKernel,
+    L.Reshape: ReshapeKernel,
+    L.Concat: ConcatKernel,
+    L.Slice: SliceKernel,
+    L.DistributedSlotSparseEmbeddingHash: EmbeddingKernel,
+    L.LocalizedSlotSparseEmbeddingHash: EmbeddingKernel,
+    L.BinaryCrossEntropyLoss: BinaryCrossEntropyLossKernel,
+}
+
+
+class Updater:
+
+    def __init__(self, optimizer, num_states):
+        '''
+        Applies the update rule of an optimizer. Embedding tables are updated only on the rows seen in the batch
+        unless `global_update` is set.
+        :param optimizer: Optimizer
+            Specifies the optimizer and its hyperparameters.
+        :param num_states: int
+            Specifies the number of state arrays kept per parameter.
+        '''
+        self.optimizer = optimizer
+        self.num_states = num_states
+        self.states = dict()
+        self.step = 0
+
+    def update(self, key, param, grad):
+        '''
+        Updates `param` in place. `grad` is an array, or a (rows, row gradients) tuple for embedding tables.
+        '''
+        if key not in self.states:
+            self.states[key] = [np.zeros_like(param) for _ in range(self.num_states)]
+        states = self.states[key]
+        if not isinstance(grad, tuple):
+            param[...] = self.apply(param, grad, states)
+        elif self.optimizer.global_update:
+            rows, grad_rows = grad
+            full = np.zeros_like(param)
+            full[rows] = grad_rows
+            param[...] = self.apply(param, full, states)
+        else:
+            rows, grad_rows = grad
+            row_states = [state[rows] for state in states]
+            param[rows] = self.apply(param[rows], grad_rows, row_states)
+            for state, row_state in zip(states, row_states):
+                state[rows] = row_state
+
+    def apply(self, param, grad, states):
+        '''
+        Returns the updated values and updates `states` in place.
+        '''
+        raise NotImplementedError
+
+
+class AdamUpdater(Updater):
+
+    def __init__(self, optimizer):
+        super().__init__(optimizer, 2)
+
+    def apply(self, param, grad, states):
+        o = self.optimizer
+        m, v = states
+        m *= o.beta1
+        m += (1 - o.beta1) * grad
+        v *= o.beta2
+        v += (1 - o.beta2) * grad * grad
+        lr = o.alpha * np.sqrt(1 - o.beta2 ** self.step) / (1 - o.beta1 ** self.step)
+        return param - lr * m / (np.sqrt(v) + o.epsilon)
+
+
+class MomentumSGDUpdater(Updater):
+
+    def __init__(self, optimizer):
+        super().__init__(optimizer, 1)
+
+    def apply(self, param, grad, states):
+        momentum = states[0]
+        momentum *= self.optimizer.momentum
+        momentum -= self.optimizer.lr * grad
+        return param + momentum
+
+
+class NesterovUpdater(Updater):
+
+    def __init__(self, optimizer):
+        super().__init__(optimizer, 1)
+
+    def apply(self, param, grad, states):
+        mu = self.optimizer.momentum
+        accumulation = states[0]
+        previous = accumulation.copy()
+        accumulation *= mu
+        accumulation -= self.optimizer.lr * grad
+        return param - mu * previous + (1 + mu) * accumulation
+
+
+# optimizer class -> updater class
+UPDATERS = {
+    AdamOptimizer: AdamUpdater,
+    MomentumSGD: MomentumSGDUpdater,
+    Nesterov: NesterovUpdater,
+}
+
+
+class ReferenceExecutor:
+
+    def __init__(self, model, seed=0, kernels=None):
+        '''
+
+        Runs a model on CPU with NumPy, e.g. to smoke test a configuration or get a loss baseline. Computation is in
+        single precision regardless of `mixed_precision`, and every layer processes the whole batch at once.
+        :param model: Model
+            Specifies the model to run. Layers must be in dependency order.
+        :param seed: int
+            Specifies the seed of weight initialization and dropout.
+        :param kernels: dict, optional
+            Maps layer classes to kernel classes used instead of those of KERNELS.
+        '''
+        self.model = model
+        self.rng = np.random.default_rng(seed)
+        self.kernels = []
+        kernel_classes = {**KERNELS, **kernels} if kernels else KERNELS
+        for layer, input_shapes, _ in model.infer_shapes():
+            if type(layer) not in kernel_classes:
+                raise ValueError("{}: {} is not supported".format(layer.get_name(), type(layer).__name__))
+            self.kernels.append(kernel_classes[type(layer)](layer, input_shapes, self))
+        if type(model.optimizer) not in UPDATERS:
+            raise ValueError("{} is not supported".format(type(model.optimizer).__name__))
+        self.updater = UPDATERS[type(model.optimizer)](model.optimizer)
+        self.batch = None
+
+    def get_kernel(self, name):
+        for kernel in self.kernels:
+            if kernel.layer.get_name() == name:
+                return kernel
+        raise KeyError(name)
+
+    def forward(self, batch, training=False):
+        '''
+
+        Runs the forward pass.
+        :param batch: dict
+            Maps the names of Label and Dense to float arrays of (batch, dim), and the names of Sparse to int arrays of
+            (batch, slot_num, max_feature_num_per_sample) keys where negative keys are padding.
+        :param training: Boolean
+            Specifies whether dropout is applied.
+        :return: dict
+            Every tensor, keyed by top name. The loss is a scalar.
+        '''
+        self.batch = batch
+        tensors = dict()
+        for kernel in self.kernels:
+            inputs = [tensors[bottom] for bottom in kernel.layer.get_bottom_names()]
+            tensors.update(zip(kernel.layer.get_top_names(), kernel.forward(inputs, training)))
+        self.batch = None
+        return tensors
+
+    def backward(self, tensors):
+        grads = dict()
+        for kernel in reversed(self.kernels):
+            tops = kernel.layer.get_top_names()
+            if isinstance(kernel, BinaryCrossEntropyLossKernel):
+                grad_outputs = [np.float32(1)]
+            elif not any(top in grads for top in tops):
+                continue
+            else:
+                grad_outputs = [grads.get(top, np.zeros_like(tensors[top])) for top in tops]
+            grad_inputs = kernel.backward(grad_outputs)
+            for bottom, grad in zip(kernel.layer.get_bottom_names(), grad_inputs):
+                if grad is None:
+                    continue
+                if bottom in grads:
+                    grads[bottom] = grads[bottom] + grad
+                else:
+                    grads[bottom] = grad
+
+    def train_step(self, batch):
+        '''
+        Runs forward, backward and the optimizer update on a batch and returns the loss.
+        '''
+        tensors = self.forward(batch, training=True)
+        self.backward(tensors)
+        self.updater.step += 1
+        for kernel in self.kernels:
+            for name, grad in kernel.grads.items():
+                self.updater.update((kernel.layer.get_name(), name), kernel.params[name], grad)
+            kernel.grads = dict()
+        return float(self.get_loss(tensors))
+
+    def evaluate(self, batch):
+        '''
+        Returns the loss of a batch without updating the model.
+        '''
+        return float(self.get_loss(self.forward(batch)))
+
+    def predict(self, batch):
+        '''
+        Returns the predicted probabilities, the sigmoid of the input of the loss layer.
+        '''
+        tensors = self.forward(batch)
+        logits = tensors[self.get_loss_kernel().layer.get_bottom_names()[0]]
+        return 1 / (1 + np.exp(-logits))
+
+    def get_loss_kernel(self):
+        for kernel in self.kernels:
+            if isinstance(kernel, BinaryCrossEntropyLossKernel):
+                return kernel
+        raise ValueError("The model has no loss layer")
+
+    def get_loss(self, tensors):
+        return tensors[self.get_loss_kernel().layer.get_top_names()[0]]
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from hugectrpy.data import BinaryWriter, DataReader, open_data_file, write_file_list
+
+
+def merge_counts(keys, counts):
+    '''
+    Sums the counts of equal keys. Returns the sorted distinct keys and their counts.
+    '''
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    counts = counts[order]
+    first = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[first], np.add.reduceat(counts, first)
+
+
+class KeyCounts:
+
+    def __init__(self, slot_num):
+        '''
+        Sums key counts of every slot as they are added. Added counts are merged once they outnumber the merged
+        ones, so every key is merged O(log n) times instead of once per addition.
+        '''
+        self.keys = [np.zeros(0, dtype=np.int64) for _ in range(slot_num)]
+        self.counts = [np.zeros(0, dtype=np.int64) for _ in range(slot_num)]
+        self.pending = [[] for _ in range(slot_num)]
+        self.pending_size = [0] * slot_num
+
+    def add(self, slot, keys, counts):
+        self.pending[slot].append((keys, counts))
+        self.pending_size[slot] += len(keys)
+        if self.pending_size[slot] > len(self.keys[slot]):
+            self.merge(slot)
+
+    def merge(self, slot):
+        if self.pending[slot]:
+            self.keys[slot], self.counts[slot] = merge_counts(
+                np.concatenate([self.keys[slot]] + [k for k, _ in self.pending[slot]]),
+                np.concatenate([self.counts[slot]] + [c for _, c in self.pending[slot]]))
+            self.pending[slot] = []
+            self.pending_size[slot] = 0
+
+    def get(self):
+        '''
+        Returns the sorted distinct keys of every slot and their counts.
+        '''
+        for s in range(len(self.keys)):
+            self.merge(s)
+        return self.keys, self.counts
+
+
+def count_file(data, path, batch_size):
+    '''
+    Returns the sorted distinct keys of every slot of a file and their counts.
+    '''
+    f = open_data_file(data, path, check_features=False)
+    slot_num = f.layout.slot_num
+    counts = KeyCounts(slot_num)
+    for start in range(0, f.number_of_records, batch_size):
+        _, _, batch = f.get_records(start, min(start + batch_size, f.number_of_records))
+        for s in range(slot_num):
+            slot_keys = batch[:, s].ravel()
+            counts.add(s, *np.unique(slot_keys[slot_keys >= 0], return_counts=True))
+    return counts.get()
+
+
+class KeyDictionary:
+
+    def __init__(self, keys, ids, offsets, oov_ids):
+        '''
+
+        Maps the keys of every slot to dense contiguous IDs. Keys of a slot are stored sorted in one array and looked
+        up with np.searchsorted, keys not in the dictionary map to the OOV ID of their slot.
+        :param keys: int64 array
+            Specifies the keys of all slots, sorted within every slot.
+        :param ids: int64 array
+            Specifies the ID of every key.
+        :param offsets: int64 array
+            Specifies where the keys of every slot start, with the total number of keys last.
+        :param oov_ids: int64 array
+            Specifies the OOV ID of every slot.
+        '''
+        self.keys = keys
+        self.ids = ids
+        self.offsets = offsets
+        self.oov_ids = oov_ids
+
+    @classmethod
+    def from_counts(cls, keys, counts, min_count=1):
+        '''
+
+        Builds a dictionary from key counts. In every slot, keys seen at least `min_count` times get IDs in order of
+        decreasing frequency and the others share the OOV ID that follows them. The IDs of a slot follow those of
+        the previous slot.
+        :param keys: list of int64 arrays
+            Specifies the distinct keys of every slot.
+        :param counts: list of int64 arrays
+            Specifies the count of every key.
+        :param min_count: int
+            Specifies the minimum count of a key to get its own ID.
+        '''
+        all_keys, all_ids, offsets, oov_ids = [], [], [0], []
+        next_id = 0
+        for slot_keys, slot_counts in zip(keys, counts):
+            kept = slot_counts >= min_count
+            slot_keys, slot_counts = slot_keys[kept], slot_counts[kept]
+            # most frequent first, ties broken by key
+            order = np.lexsort((slot_keys, -slot_counts))
+            slot_ids = np.empty(len(slot_keys), dtype=np.int64)
+            slot_ids[order] = next_id + np.arange(len(slot_keys))
+            sort = np.argsort(slot_keys)
+            all_keys.append(slot_keys[sort])
+            all_ids.append(slot_ids[sort])
+            offsets.append(offsets[-1] + len(slot_keys))
+            oov_ids.append(next_id + len(slot_keys))
+            next_id += len(slot_keys) + 1
+        return cls(np.concatenate(all_keys).astype(np.int64), np.concatenate(all_ids).astype(np.int64),
+                   np.array(offsets, dtype=np.int64), np.array(oov_ids, dtype=np.int64))
+
+    def get_vocabulary_size(self):
+        '''
+        Returns the number of IDs, including the OOV ID of every slot.
+        '''
+        return int(self.offsets[-1] + len(self.oov_ids))
+
+    def remap(self, keys, first_slot=0):
+        '''
+        Returns the IDs of keys (batch, slot_num, nnz). Negative keys (padding) are kept.
+        :param first_slot: int
+            Specifies the slot of keys[:, 0] in the dictionary.
+        '''
+        ids = np.empty(keys.shape, dtype=np.int64)
+        for s in range(keys.shape[1]):
+            slot = first_slot + s
+            slot_keys = self.keys[self.offsets[slot]:self.offsets[slot + 1]]
+            slot_ids = self.ids[self.offsets[slot]:self.offsets[slot + 1]]
+            query = keys[:, s]
+            position = np.minimum(np.searchsorted(slot_keys, query), max(len(slot_keys) - 1, 0))
+            if len(slot_keys) > 0:
+                found = slot_keys[position] == query
+                ids[:, s] = np.where(found, slot_ids[position], self.oov_ids[slot])
+            else:
+                ids[:, s] = self.oov_ids[slot]
+            ids[:, s][query < 0] = query[query < 0]
+        return ids
+
+    def save(self, path):
+        np.savez(path, keys=self.keys, ids=self.ids, offsets=self.offsets, oov_ids=self.oov_ids)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(arrays['keys'], arrays['ids'], arrays['offsets'], arrays['oov_ids'])
+
+
+def build_dictionary(data, min_count=1, eval=False, batch_size=65536, processes=None):
+    '''
+
+    Counts the keys of every slot in the files of a Data layer and builds a KeyDictionary. Files are counted in
+    parallel.
+    :param data: Data
+        Specifies the Data layer whose files are read.
+    :param min_count: int
+        Specifies the minimum count of a key to get its own ID, rarer keys share the OOV ID of their slot.
+    :param eval: Boolean
+        If set, `eval_source` is read instead of `source`.
+    :param batch_size: int
+        Specifies the number of records processed at once.
+    :param processes: int, optional
+        Specifies the number of processes, all CPUs by default. With 1 files are read in this process.
+    :return: KeyDictionary
+    '''
+    files = DataReader(data, batch_size, eval=eval).files
+    counts = KeyCounts(sum(sp.slot_num for sp in data.sparse))
+
+    def add(file_keys, file_counts):
+        for s, (k, c) in enumerate(zip(file_keys, file_counts)):
+            counts.add(s, k, c)
+
+    # counts are added as files finish, as_completed drops its reference to a future once yielded
+    if processes == 1:
+        for path in files:
+            add(*count_file(data, path, batch_size))
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            for future in as_completed([pool.submit(count_file, data, path, batch_size) for path in files]):
+                add(*future.result())
+    keys, counts = counts.get()
+    return KeyDictionary.from_counts(keys, counts, min_count)
+
+
+# the dictionary of a worker process, set once by its pool initializer
+_dictionary = None
+
+
+def set_dictionary(dictionary):
+    global _dictionary
+    _dictionary = dictionary
+
+
+def remap_file(data, dictionary, path, output_path, batch_size):
+    if dictionary is None:
+        dictionary = _dictionary
+    f = open_data_file(data, path, check_features=False)
+    with BinaryWriter(output_path, f.layout) as writer:
+        for start in range(0, f.number_of_records, batch_size):
+            label, dense, keys = f.get_records(start, min(start + batch_size, f.number_of_records))
+            writer.write(label, dense, dictionary.remap(keys))
+    return output_path
+
+
+def remap_files(data, dictionary, output_dir, eval=False, file_list='file_list.txt', batch_size=65536,
+                processes=None):
+    '''
+
+    Rewrites the files of a Data layer with the keys replaced by their IDs.
+    :param data: Data
+        Specifies the Data layer whose files are rewritten.
+    :param dictionary: KeyDictionary
+        Specifies the mapping of keys to IDs.
+    :param output_dir: str
+        Specifies the directory of the rewritten files and their file list.
+    :param eval: Boolean
+        If set, `eval_source` is rewritten instead of `source`.
+    :param file_list: str
+        Specifies the name of the file list written in `output_dir`.
+    :param batch_size: int
+        Specifies the number of records processed at once.
+    :param processes: int, optional
+        Specifies the number of processes, all CPUs by default. With 1 files are rewritten in this process.
+    :return: str
+        Path of the file list.
+    '''
+    files = DataReader(data, batch_size, eval=eval).files
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = [os.path.join(output_dir, "{:05d}_{}".format(i, os.path.basename(path))) for i, path in enumerate(files)]
+    if processes == 1:
+        for path, output_path in zip(files, outputs):
+            remap_file(data, dictionary, path, output_path, batch_size)
+    else:
+        # the dictionary is sent to every worker once instead of with every file
+        with ProcessPoolExecutor(processes, initializer=set_dictionary, initargs=(dictionary,)) as pool:
+            list(pool.map(remap_file, [data] * len(files), [None] * len(files), files, outputs,
+                          [batch_size] * len(files)))
+    path = os.path.join(output_dir, file_list)
+    write_file_list(path, outputs)
+    return path
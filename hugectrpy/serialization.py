@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+
+
+class Serializable:
+    '''
+
+    Base class for objects written to the configuration with `get_parameters`. The parameters and their JSON text
+    are cached, and the cache is dropped whenever a public attribute is set. Lists changed in place (e.g.
+    `Slice.ranges`) are not noticed, assign a new list or call `invalidate` after changing them.
+    '''
+
+    def __setattr__(self, key, value):
+        object.__setattr__(self, key, value)
+        if not key.startswith('_'):
+            object.__setattr__(self, '_cache', None)
+
+    def invalidate(self):
+        object.__setattr__(self, '_cache', None)
+
+    def get_cache_key(self):
+        '''
+        Returns the values, other than own attributes, the parameters depend on, e.g. names of source layers.
+        The cache is rebuilt when the key changes.
+        '''
+        return None
+
+    def get_cached_parameters(self):
+        '''
+        Returns the cached result of `get_parameters`. It is shared between calls and must not be modified.
+        '''
+        return self._get_cache()[1]
+
+    def get_json(self, cache=True):
+        '''
+        Returns the cached JSON text of `get_parameters`.
+        :param cache: Boolean
+            If set to False and nothing is cached yet, the text is built without being stored.
+        '''
+        if not cache:
+            stored = getattr(self, '_cache', None)
+            if stored is not None and stored[0] == self.get_cache_key():
+                return stored[2]
+            return json.dumps(self.get_parameters())
+        return self._get_cache()[2]
+
+    def _get_cache(self):
+        key = self.get_cache_key()
+        cache = getattr(self, '_cache', None)
+        if cache is None or cache[0] != key:
+            parameters = self.get_parameters()
+            cache = (key, parameters, json.dumps(parameters))
+            object.__setattr__(self, '_cache', cache)
+        return cache
@@ -0,0 +1,459 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import math
+import time
+
+import numpy as np
+
+from hugectrpy import layers as L
+from hugectrpy.reference import DataKernel, EmbeddingKernel, Kernel, ReferenceExecutor
+from hugectrpy.snapshot import SparseModelFile, read_dense_model
+from hugectrpy.stats import hash64
+
+POLICIES = ('lru', 'lfu', 'tinylfu')
+
+
+class LatencyCounter:
+
+    def __init__(self, size=10000):
+        '''
+        Counts calls and keeps the latencies of the last `size` calls.
+        '''
+        self.latencies = np.zeros(size)
+        self.count = 0
+
+    def record(self, seconds):
+        self.latencies[self.count % len(self.latencies)] = seconds
+        self.count += 1
+
+    def get_stats(self):
+        '''
+        Returns the number of calls and the mean, p50 and p99 latency in seconds of the recent calls.
+        '''
+        recent = self.latencies[:min(self.count, len(self.latencies))]
+        if len(recent) == 0:
+            return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p99': 0.0}
+        p50, p99 = np.percentile(recent, [50, 99])
+        return {'count': self.count, 'mean': float(recent.mean()), 'p50': float(p50), 'p99': float(p99)}
+
+
+class CountMinSketch:
+
+    def __init__(self, width, depth=4, sample_size=None):
+        '''
+        Approximate access counts of keys in 4 bit counters, halved every `sample_size` accesses so old popularity
+        fades (TinyLFU).
+        :param width: int
+            Specifies the number of counters per row, rounded up to a power of two.
+        :param depth: int
+            Specifies the number of rows, every key is counted once per row.
+        :param sample_size: int, optional
+            Specifies the number of accesses between halvings, 10 times the width by default.
+        '''
+        self.width = 1 << max(0, int(width - 1).bit_length())
+        self.table = np.zeros((depth, self.width), dtype=np.uint8)
+        self.sample_size = sample_size or 10 * self.width
+        self.additions = 0
+
+    def get_indices(self, keys):
+        keys = np.asarray(keys, dtype=np.int64).astype(np.uint64)
+        mask = np.uint64(self.width - 1)
+        return [(hash64(keys + np.uint64(0x9E3779B97F4A7C15 * (i + 1) % (1 << 64))) & mask).astype(np.int64)
+                for i in range(len(self.table))]
+
+    def add(self, keys):
+        for row, index in zip(self.table, self.get_indices(keys)):
+            np.add.at(row, index, 1)
+            row[index] = np.minimum(row[index], 15)
+        self.additions += len(keys)
+        if self.additions >= self.sample_size:
+            self.table >>= 1
+            self.additions //= 2
+
+    def estimate(self, keys):
+        if len(keys) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.min([row[index] for row, index in zip(self.table, self.get_indices(keys))], axis=0)
+
+
+def get_first(values):
+    '''
+    Returns the index of the first occurrence of every distinct value, in order of value. Sorting is faster than
+    the hash table of np.unique on the small arrays of a request.
+    '''
+    order = np.argsort(values, kind='stable')
+    ordered = values[order]
+    return order[np.concatenate(([True], ordered[1:] != ordered[:-1]))] if len(values) > 0 else order
+
+
+class KeyIndex:
+
+    # markers of never used and of deleted cells, these two keys cannot be stored
+    EMPTY = np.iinfo(np.int64).min
+    DELETED = EMPTY + 1
+
+    def __init__(self, capacity, max_load=0.7):
+        '''
+
+        Open addressing hash table from int64 keys to int64 values with linear probing, where every operation
+        handles an array of keys at once, one probe step per round. Deleted cells are marked and reused, the table
+        is rebuilt when live and deleted cells exceed `max_load`.
+        :param capacity: int
+            Specifies the largest number of keys stored at once.
+        :param max_load: float
+            Specifies the share of used cells that triggers a rebuild.
+        '''
+        self.max_load = max_load
+        size = 1 << int(math.ceil(capacity / max_load * 1.5) - 1).bit_length()
+        self.keys = np.full(size, self.EMPTY, dtype=np.int64)
+        self.values = np.zeros(size, dtype=np.int64)
+        self.mask = np.uint64(size - 1)
+        self.count = 0
+        self.used = 0
+
+    def get_home(self, keys):
+        return (hash64(keys) & self.mask).astype(np.int64)
+
+    def find(self, keys):
+        '''
+        Returns the cell of every key, -1 for keys not stored.
+        '''
+        cells = np.full(len(keys), -1, dtype=np.int64)
+        position = self.get_home(keys)
+        active = np.arange(len(keys))
+        while len(active) > 0:
+            found = self.keys[position[active]]
+            hit = found == keys[active]
+            cells[active[hit]] = position[active[hit]]
+            active = active[~hit & (found != self.EMPTY)]
+            position[active] = (position[active] + 1) & (len(self.keys) - 1)
+        return cells
+
+    def get(self, keys):
+        '''
+        Returns the value of every key, -1 for keys not stored.
+        '''
+        cells = self.find(keys)
+        return np.where(cells >= 0, self.values[cells], -1)
+
+    def remove(self, keys):
+        cells = self.find(keys)
+        cells = cells[cells >= 0]
+        self.keys[cells] = self.DELETED
+        self.count -= len(cells)
+
+    def add(self, keys, values):
+        '''
+        Stores distinct keys that are not stored yet.
+        '''
+        if self.used + len(keys) > self.max_load * len(self.keys):
+            self.rebuild()
+        position = self.get_home(keys)
+        pending = np.arange(len(keys))
+        while len(pending) > 0:
+            found = self.keys[position[pending]]
+            free = (found == self.EMPTY) | (found == self.DELETED)
+            # the first key claiming a free cell takes it, the others probe further
+            placed = np.zeros(len(pending), dtype=bool)
+            placed[np.flatnonzero(free)[get_first(position[pending[free]])]] = True
+            winners = pending[placed]
+            self.used += int((self.keys[position[winners]] == self.EMPTY).sum())
+            self.keys[position[winners]] = keys[winners]
+            self.values[position[winners]] = values[winners]
+            pending = pending[~placed]
+            position[pending] = (position[pending] + 1) & (len(self.keys) - 1)
+        self.count += len(keys)
+
+    def rebuild(self):
+        live = (self.keys != self.EMPTY) & (self.keys != self.DELETED)
+        keys, values = self.keys[live], self.values[live]
+        self.keys[:] = self.EMPTY
+        self.count = 0
+        self.used = 0
+        self.add(keys, values)
+
+
+class EmbeddingCache:
+
+    def __init__(self, source, capacity, policy='lru', window=0.01, samples=8, admit_batch=None, seed=0):
+        '''
+
+        Bounded in-memory cache of the rows of a sparse model file. Cached keys are found through a KeyIndex from
+        key to slot, all keys of a request are looked up at once and the missing ones are read from the file in a
+        single gather. Eviction is sampled: for every row to evict, `samples` random slots are drawn and the ones
+        the policy ranks lowest are replaced, so the cost of a request grows with its misses, not the capacity.
+        Misses are admitted in batches of `admit_batch` rows, which spreads the fixed cost of an admission over
+        several requests.
+        :param source: SparseModelFile
+            Specifies the memory mapped snapshot.
+        :param capacity: int
+            Specifies the number of cached rows.
+        :param policy: str
+            'lru' evicts the least recently used rows, 'lfu' the least frequently used ones, and 'tinylfu'
+            (W-TinyLFU) admits new rows to a small LRU window and moves rows leaving it to the main LRU segment
+            only if a count-min sketch has seen them more often than the row they would evict.
+        :param window: float
+            Specifies the share of the capacity used by the window of 'tinylfu'.
+        :param samples: int
+            Specifies the number of slots drawn per evicted row.
+        :param admit_batch: int, optional
+            Specifies the number of missed rows admitted at once, capacity / 64 up to 4096 by default.
+        :param seed: int
+            Specifies the seed of the sampling.
+        '''
+        if policy not in POLICIES:
+            raise ValueError("policy must be one of {}, got {}".format(POLICIES, policy))
+        if capacity < 1:
+            raise ValueError("capacity must be positive, got {}".format(capacity))
+        self.source = source
+        self.capacity = capacity
+        self.policy = policy
+        self.samples = samples
+        self.admit_batch = admit_batch or max(1, min(4096, capacity // 64))
+        self.pending = []
+        self.pending_rows = 0
+        self.rng = np.random.default_rng(seed)
+        vec = source.dtype['vector'].shape[0]
+        self.keys = np.zeros(capacity, dtype=np.int64)
+        self.vectors = np.zeros((capacity, vec), dtype=np.float32)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.index = KeyIndex(capacity)
+        self.tick = 0
+        # slots [0, window_size) are the window of 'tinylfu', every segment fills its slots in order
+        self.window_size = max(1, int(capacity * window)) if policy == 'tinylfu' and capacity > 1 else 0
+        self.filled = {0: 0, self.window_size: self.window_size}
+        self.sketch = CountMinSketch(4 * capacity) if policy == 'tinylfu' else None
+        self.hits = 0
+        self.misses = 0
+        self.latency = LatencyCounter()
+
+    def find(self, keys):
+        '''
+        Returns the slot of every key, -1 for keys not cached.
+        '''
+        return self.index.get(keys)
+
+    def get(self, keys):
+        '''
+        Returns the vectors of distinct keys, zeros for keys not in the snapshot, and caches the missing ones.
+        '''
+        start = time.perf_counter()
+        keys = np.asarray(keys, dtype=np.int64)
+        self.tick += 1
+        if self.sketch is not None:
+            self.sketch.add(keys)
+        slots = self.find(keys)
+        hit = slots >= 0
+        vectors = np.empty((len(keys), self.vectors.shape[1]), dtype=np.float32)
+        vectors[hit] = self.vectors[slots[hit]]
+        self.last_used[slots[hit]] = self.tick
+        self.counts[slots[hit]] += 1
+        missing = np.flatnonzero(~hit)
+        if len(missing) > 0:
+            # one sorted gather from the memory map
+            order = np.argsort(keys[missing])
+            missing = missing[order]
+            vectors[missing] = self.source.lookup(keys[missing])[0]
+            self.pending.append((keys[missing], vectors[missing]))
+            self.pending_rows += len(missing)
+            if self.pending_rows >= self.admit_batch:
+                self.flush()
+        self.hits += int(hit.sum())
+        self.misses += len(missing)
+        self.latency.record(time.perf_counter() - start)
+        return vectors
+
+    def flush(self):
+        '''
+        Admits the pending missed rows.
+        '''
+        if not self.pending:
+            return
+        keys = np.concatenate([k for k, _ in self.pending])
+        vectors = np.concatenate([v for _, v in self.pending])
+        self.pending = []
+        self.pending_rows = 0
+        # a key missed by several requests is admitted once
+        first = get_first(keys)
+        self.admit(keys[first], vectors[first])
+
+    def get_victims(self, count, start, stop):
+        '''
+        Returns up to `count` slots of [start, stop) to overwrite and how many of them are free. Free slots come
+        first, then among `samples` random slots per row those the policy evicts first, in eviction order, skipping
+        rows used by the current request.
+        '''
+        filled = self.filled[start]
+        free = np.arange(filled, min(stop, filled + count), dtype=np.int64)
+        self.filled[start] = filled + len(free)
+        count -= len(free)
+        if count <= 0:
+            return free, len(free)
+        if stop - start <= self.samples * count:
+            candidates = np.arange(start, stop, dtype=np.int64)
+        else:
+            candidates = self.rng.integers(start, stop, self.samples * count)
+        candidates = candidates[(candidates < filled) & (self.last_used[candidates] < self.tick)]
+        if len(candidates) > count:
+            candidates = candidates[np.argpartition(self.get_score(candidates), count - 1)[:count]]
+        # a slot drawn twice is evicted once
+        candidates = candidates[get_first(candidates)]
+        victims = candidates[np.argsort(self.get_score(candidates), kind='stable')]
+        return np.concatenate((free, victims)), len(free)
+
+    def get_score(self, slots):
+        # rows with the lowest score are evicted first
+        if self.policy == 'lfu':
+            return (self.counts[slots] << 40) + self.last_used[slots]
+        return self.last_used[slots]
+
+    def store(self, slots, keys, vectors, evicted):
+        '''
+        Writes rows to slots and updates the index. `evicted` are the slots of `slots` that held a row.
+        '''
+        self.index.remove(self.keys[evicted])
+        self.keys[slots] = keys
+        self.vectors[slots] = vectors
+        self.last_used[slots] = self.tick
+        self.counts[slots] = 1
+        self.index.add(keys, slots)
+
+    def admit(self, keys, vectors):
+        if self.policy != 'tinylfu':
+            slots, free = self.get_victims(len(keys), 0, self.capacity)
+            self.store(slots, keys[:len(slots)], vectors[:len(slots)], slots[free:])
+            return
+
+        # new rows enter the window, the rows they push out are candidates for the main segment
+        slots, free = self.get_victims(len(keys), 0, self.window_size)
+        pushed = slots[free:]
+        candidate_keys = np.concatenate((self.keys[pushed], keys[len(slots):]))
+        candidate_vectors = np.concatenate((self.vectors[pushed], vectors[len(slots):]))
+        self.store(slots, keys[:len(slots)], vectors[:len(slots)], pushed)
+        if len(candidate_keys) == 0:
+            return
+
+        frequency = self.sketch.estimate(candidate_keys)
+        order = np.argsort(-frequency.astype(np.int64), kind='stable')
+        candidate_keys, candidate_vectors, frequency = candidate_keys[order], candidate_vectors[order], \
+            frequency[order]
+        victims, free = self.get_victims(len(candidate_keys), self.window_size, self.capacity)
+        # free slots admit anyone, a used slot only a candidate seen more often than its row; the most frequent
+        # candidates face the rows evicted first
+        admitted = np.arange(len(victims)) < free
+        admitted[free:] = frequency[free:len(victims)] > self.sketch.estimate(self.keys[victims[free:]])
+        self.store(victims[admitted], candidate_keys[:len(victims)][admitted],
+                   candidate_vectors[:len(victims)][admitted], victims[free:][admitted[free:]])
+
+    def get_stats(self):
+        '''
+        Returns the hits, misses, hit rate, cached rows and lookup latency statistics.
+        '''
+        lookups = self.hits + self.misses
+        stats = {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                 'rows': sum(filled - start for start, filled in self.filled.items())}
+        stats.update({'latency_' + k: v for k, v in self.latency.get_stats().items() if k != 'count'})
+        return stats
+
+
+class ServingEmbeddingKernel(EmbeddingKernel):
+
+    def __init__(self, layer, input_shapes, executor):
+        '''
+        Embedding reading its vectors by key from an EmbeddingCache set as `cache`, forward only.
+        '''
+        Kernel.__init__(self, layer, input_shapes, executor)
+        self.cache = None
+
+    def get_rows(self, keys):
+        return keys
+
+    def lookup(self, rows):
+        return self.cache.get(rows)
+
+    def backward(self, grad_outputs):
+        raise ValueError("{}: serving embeddings cannot be trained".format(self.layer.get_name()))
+
+
+class InferenceEngine:
+
+    def __init__(self, model, dense_model_file=None, sparse_model_files=None, cache_rows=1 << 20, policy='lru'):
+        '''
+
+        Serves predictions of a trained model on CPU. Dense weights are loaded into memory, embedding vectors are
+        read from the memory mapped sparse model files through a bounded cache.
+        :param model: Model
+            Specifies the model.
+        :param dense_model_file: str, optional
+            Specifies the dense model file, `solver.dense_model_file` by default.
+        :param sparse_model_files: list of str, optional
+            Specifies the sparse model file of every embedding in layer order, `solver.sparse_model_file` by
+            default.
+        :param cache_rows: int or dict
+            Specifies the cache capacity in rows, per embedding name if a dict.
+        :param policy: str
+            Specifies the eviction policy of the caches, see `EmbeddingCache`.
+        '''
+        dense_model_file = dense_model_file or model.solver.dense_model_file
+        sparse_model_files = sparse_model_files or model.solver.sparse_model_file
+        if isinstance(sparse_model_files, str):
+            sparse_model_files = [sparse_model_files]
+        self.model = model
+        self.executor = ReferenceExecutor(model, kernels={L.DistributedSlotSparseEmbeddingHash: ServingEmbeddingKernel,
+                                                          L.LocalizedSlotSparseEmbeddingHash: ServingEmbeddingKernel})
+        embeddings = [k for k in self.executor.kernels if isinstance(k, ServingEmbeddingKernel)]
+        if len(embeddings) != len(sparse_model_files or []):
+            raise ValueError("{} embeddings but {} sparse model files".format(
+                len(embeddings), len(sparse_model_files or [])))
+        self.caches = dict()
+        for kernel, path in zip(embeddings, sparse_model_files):
+            name = kernel.layer.get_name()
+            rows = cache_rows[name] if isinstance(cache_rows, dict) else cache_rows
+            kernel.cache = EmbeddingCache(SparseModelFile.for_embedding(path, kernel.layer, True), rows, policy)
+            self.caches[name] = kernel.cache
+        if dense_model_file is not None:
+            for name, params in read_dense_model(model, dense_model_file).items():
+                kernel = self.executor.get_kernel(name)
+                kernel.params['weight'] = np.array(params['weight'])
+                kernel.params['bias'] = np.array(params['bias'])
+        self.latency = LatencyCounter()
+
+    def predict(self, batch):
+        '''
+        Returns the predicted probabilities of a batch keyed like the inputs of `ReferenceExecutor.forward`. The
+        label may be left out.
+        '''
+        start = time.perf_counter()
+        data = [k.layer for k in self.executor.kernels if isinstance(k, DataKernel)][0]
+        if data.label.get_name() not in batch:
+            batch = dict(batch)
+            size = len(batch[data.dense.get_name()])
+            batch[data.label.get_name()] = np.zeros((size, data.label.dim), dtype=np.float32)
+        result = self.executor.predict(batch)
+        self.latency.record(time.perf_counter() - start)
+        return result
+
+    def get_stats(self):
+        '''
+        Returns the request count and latency statistics, and the statistics of every embedding cache.
+        '''
+        stats = {'requests': self.latency.count}
+        stats.update({'latency_' + k: v for k, v in self.latency.get_stats().items() if k != 'count'})
+        stats['embeddings'] = {name: cache.get_stats() for name, cache in self.caches.items()}
+        return stats
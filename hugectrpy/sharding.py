@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+
+import numpy as np
+
+from hugectrpy.data import BinaryWriter, DataReader, open_data_file, write_file_list
+from hugectrpy.layers import Data, DistributedSlotSparseEmbeddingHash, LocalizedSlotSparseEmbeddingHash
+
+
+def get_loads(memory, traffic, assignment, num_devices):
+    '''
+    Returns the memory and traffic of every device relative to an even split, 1 being perfectly balanced.
+    '''
+    memory_load = np.bincount(assignment, memory, num_devices) * num_devices / max(memory.sum(), 1e-30)
+    traffic_load = np.bincount(assignment, traffic, num_devices) * num_devices / max(traffic.sum(), 1e-30)
+    return memory_load, traffic_load
+
+
+def balance_slots(memory, traffic, num_devices, max_swaps=1000):
+    '''
+
+    Assigns slots to devices so that the most loaded device, in memory or in traffic, is as light as possible.
+    Every device gets as many slots as with round-robin placement, so the assignment can be expressed as a
+    permutation of the slots. Slots are placed heaviest first on the device they load the least (LPT), then slots
+    of the most loaded device are swapped with slots of other devices while that lowers its load.
+    :param memory: float array
+        Specifies the memory of every slot.
+    :param traffic: float array
+        Specifies the lookup traffic of every slot.
+    :param num_devices: int
+        Specifies the number of devices.
+    :param max_swaps: int
+        Specifies the maximum number of swaps of the local search.
+    :return: int array
+        Device of every slot.
+    '''
+    memory = np.asarray(memory, dtype=np.float64)
+    traffic = np.asarray(traffic, dtype=np.float64)
+    slot_num = len(memory)
+    m = memory * num_devices / max(memory.sum(), 1e-30)
+    t = traffic * num_devices / max(traffic.sum(), 1e-30)
+    capacity = np.bincount(np.arange(slot_num) % num_devices, minlength=num_devices)
+
+    assignment = np.zeros(slot_num, dtype=np.int64)
+    memory_load = np.zeros(num_devices)
+    traffic_load = np.zeros(num_devices)
+    count = np.zeros(num_devices, dtype=np.int64)
+    for slot in np.argsort(-np.maximum(m, t), kind='stable'):
+        load = np.maximum(memory_load + m[slot], traffic_load + t[slot])
+        load[count >= capacity] = np.inf
+        device = int(np.argmin(load))
+        assignment[slot] = device
+        memory_load[device] += m[slot]
+        traffic_load[device] += t[slot]
+        count[device] += 1
+
+    for _ in range(max_swaps):
+        load = np.maximum(memory_load, traffic_load)
+        worst = int(np.argmax(load))
+        mine = np.flatnonzero(assignment == worst)
+        others = np.flatnonzero(assignment != worst)
+        if len(mine) == 0 or len(others) == 0:
+            break
+        # loads of both devices after swapping every pair (mine[i], others[j])
+        dm = m[others][None, :] - m[mine][:, None]
+        dt = t[others][None, :] - t[mine][:, None]
+        target = assignment[others][None, :]
+        after = np.maximum(np.maximum(memory_load[worst] + dm, traffic_load[worst] + dt),
+                           np.maximum(memory_load[target] - dm, traffic_load[target] - dt))
+        i, j = np.unravel_index(np.argmin(after), after.shape)
+        if after[i, j] >= load[worst] - 1e-12:
+            break
+        a, b = mine[i], others[j]
+        device = assignment[b]
+        assignment[a], assignment[b] = device, worst
+        memory_load[worst] += dm[i, j]
+        traffic_load[worst] += dt[i, j]
+        memory_load[device] -= dm[i, j]
+        traffic_load[device] -= dt[i, j]
+    return assignment
+
+
+class ShardingPlan:
+
+    def __init__(self, embedding, devices, memory, traffic, assignment):
+        '''
+        Result of `plan_sharding`.
+        :param embedding: DistributedSlotSparseEmbeddingHash
+            Specifies the planned embedding.
+        :param devices: list of tuples
+            Specifies the (node, gpu) devices.
+        :param memory: float array
+            Specifies the bytes of every slot.
+        :param traffic: float array
+            Specifies the bytes looked up per sample in every slot.
+        :param assignment: int array
+            Specifies the index in `devices` of the device of every slot.
+        '''
+        self.embedding = embedding
+        self.devices = devices
+        self.memory = memory
+        self.traffic = traffic
+        self.assignment = assignment
+
+    def get_imbalance(self, assignment=None):
+        '''
+        Returns the load of the most loaded device relative to an even split for memory, traffic and the larger of
+        both, by default for the planned assignment.
+        '''
+        assignment = self.assignment if assignment is None else assignment
+        memory_load, traffic_load = get_loads(self.memory, self.traffic, assignment, len(self.devices))
+        return {'memory': float(memory_load.max()), 'traffic': float(traffic_load.max()),
+                'combined': float(np.maximum(memory_load, traffic_load).max())}
+
+    def get_round_robin_imbalance(self):
+        '''
+        Returns the imbalance of the default placement, slot i on device i % number of devices.
+        '''
+        return self.get_imbalance(np.arange(len(self.assignment)) % len(self.devices))
+
+    def get_permutation(self):
+        '''
+        Returns the original slot placed at every position so that round-robin placement realizes the plan.
+        '''
+        D = len(self.devices)
+        slots = [list(np.flatnonzero(self.assignment == d)) for d in range(D)]
+        return np.array([slots[i % D][i // D] for i in range(len(self.assignment))], dtype=np.int64)
+
+    def get_slot_memory(self):
+        '''
+        Returns the bytes of every slot in the order of the applied plan, the `slot_weights` of `Model.plan_memory`.
+        '''
+        return self.memory[self.get_permutation()]
+
+    def apply(self, model):
+        '''
+        Replaces the embedding in the model with a LocalizedSlotSparseEmbeddingHash and marks its Sparse input as
+        'LocalizedSlot'. The data files must be rewritten with `permute_slots` and `get_permutation`.
+        :return: LocalizedSlotSparseEmbeddingHash
+        '''
+        e = self.embedding
+        localized = LocalizedSlotSparseEmbeddingHash(e.name, e.src_layers, e.vocabulary_size, e.load_factor,
+                                                     e.embedding_vec_size, e.combiner)
+        for i, layer in enumerate(model.layers):
+            if layer is e:
+                model.layers[i] = localized
+            elif isinstance(layer.src_layers, list) and any(src is e for src in layer.src_layers):
+                layer.src_layers = [localized if src is e else src for src in layer.src_layers]
+            elif layer.src_layers is e:
+                layer.src_layers = localized
+            elif isinstance(layer, Data):
+                for sp in layer.sparse:
+                    if sp.get_name() == e.get_bottom_names()[0]:
+                        sp.type = 'LocalizedSlot'
+        self.embedding = localized
+        return localized
+
+    def __str__(self):
+        lines = []
+        memory_load, traffic_load = get_loads(self.memory, self.traffic, self.assignment, len(self.devices))
+        for d, device in enumerate(self.devices):
+            lines.append("node {} gpu {}: slots {}, memory {:.2f}x, traffic {:.2f}x".format(
+                device[0], device[1], np.flatnonzero(self.assignment == d).tolist(), memory_load[d],
+                traffic_load[d]))
+        imbalance = self.get_imbalance()
+        lines.append("imbalance: memory {:.2f}, traffic {:.2f}, combined {:.2f} (round-robin {:.2f})".format(
+            imbalance['memory'], imbalance['traffic'], imbalance['combined'],
+            self.get_round_robin_imbalance()['combined']))
+        return "\n".join(lines)
+
+
+def plan_sharding(model, embedding_name, report, max_swaps=1000):
+    '''
+
+    Plans the placement of the slots of an embedding on the GPUs of `Solver.gpu` from per slot statistics, so that
+    every GPU holds about the same share of the hashtable and serves about the same share of the lookups. The
+    slowest GPU sets the step time, so the most loaded GPU is minimized.
+    :param model: Model
+        Specifies the model.
+    :param embedding_name: str
+        Specifies the name of the embedding.
+    :param report: CardinalityReport
+        Specifies the distinct keys and keys per sample of every slot, from `stats.scan_cardinality`.
+    :param max_swaps: int
+        Specifies the maximum number of swaps of the local search.
+    :return: ShardingPlan
+    '''
+    embeddings = [layer for layer in model.layers if layer.get_name() == embedding_name]
+    if len(embeddings) != 1 or not isinstance(embeddings[0], DistributedSlotSparseEmbeddingHash):
+        raise ValueError("{} is not an embedding of the model".format(embedding_name))
+    embedding = embeddings[0]
+    sparse = embedding.get_bottom_names()[0]
+    devices = model.solver.get_devices()
+
+    row_bytes = embedding.get_row_bytes(model.optimizer.get_state_tables_count(), model.solver.mixed_precision)
+    memory = report.get_distinct_keys(sparse) / embedding.load_factor * row_bytes
+    element_size = 2 if model.solver.mixed_precision else 4
+    traffic = report.get_keys_per_sample(sparse) * embedding.embedding_vec_size * element_size
+    assignment = balance_slots(memory, traffic, len(devices), max_swaps)
+    return ShardingPlan(embedding, devices, memory, traffic, assignment)
+
+
+def permute_file(data, path, output_path, order, batch_size):
+    f = open_data_file(data, path, check_features=False)
+    with BinaryWriter(output_path, f.layout) as writer:
+        for start in range(0, f.number_of_records, batch_size):
+            label, dense, keys = f.get_records(start, min(start + batch_size, f.number_of_records))
+            writer.write(label, dense, keys[:, order])
+    return output_path
+
+
+def permute_slots(data, sparse_name, permutation, output_dir, eval=False, file_list='file_list.txt',
+                  batch_size=65536):
+    '''
+
+    Rewrites the files of a Data layer with the slots of a Sparse input reordered.
+    :param data: Data
+        Specifies the Data layer whose files are rewritten.
+    :param sparse_name: str
+        Specifies the Sparse input whose slots are reordered.
+    :param permutation: int array
+        Specifies the original slot placed at every position, e.g. from `ShardingPlan.get_permutation`.
+    :param output_dir: str
+        Specifies the directory of the rewritten files and their file list.
+    :param eval: Boolean
+        If set, `eval_source` is rewritten instead of `source`.
+    :param file_list: str
+        Specifies the name of the file list written in `output_dir`.
+    :param batch_size: int
+        Specifies the number of records processed at once.
+    :return: str
+        Path of the file list.
+    '''
+    first = 0
+    for sp in data.sparse:
+        if sp.get_name() == sparse_name:
+            break
+        first += sp.slot_num
+    else:
+        raise ValueError("{} is not a Sparse input of {}".format(sparse_name, data.get_name()))
+    if sorted(permutation) != list(range(sp.slot_num)):
+        raise ValueError("permutation must reorder the {} slots of {}".format(sp.slot_num, sparse_name))
+    order = np.arange(sum(s.slot_num for s in data.sparse))
+    order[first:first + sp.slot_num] = first + np.asarray(permutation)
+
+    files = DataReader(data, batch_size, eval=eval).files
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = []
+    for i, path in enumerate(files):
+        outputs.append(os.path.join(output_dir, "{:05d}_{}".format(i, os.path.basename(path))))
+        permute_file(data, path, outputs[-1], order, batch_size)
+    path = os.path.join(output_dir, file_list)
+    write_file_list(path, outputs)
+    return path
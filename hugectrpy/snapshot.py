@@ -0,0 +1,420 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import mmap
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# header of a delta file: magic, embedding_vec_size, slot ids present, changed rows, deleted keys
+DELTA_MAGIC = b'HCTRDLT1'
+DELTA_HEADER_DTYPE = np.dtype([('magic', 'S8'), ('embedding_vec_size', '<i8'), ('slot_ids', '<i8'),
+                               ('changed', '<i8'), ('deleted', '<i8')])
+# a key and its row, the records of the sorted runs of `iter_sorted`
+KEY_ROW_DTYPE = np.dtype([('key', '<i8'), ('row', '<i8')])
+
+
+def get_record_dtype(embedding_vec_size, slot_ids=False):
+    '''
+    Returns the dtype of a row of a sparse model file: the key, the slot for localized embeddings, and the vector.
+    '''
+    fields = [('key', '<i8')]
+    if slot_ids:
+        fields.append(('slot', '<i8'))
+    fields.append(('vector', '<f4', (embedding_vec_size,)))
+    return np.dtype(fields)
+
+
+class SparseModelFile:
+
+    def __init__(self, path, embedding_vec_size, slot_ids=False, random_access=False):
+        '''
+
+        Memory mapped sparse model file as written by HugeCTR snapshots, one row per key: the key (long long),
+        the slot (size_t) for localized slot embeddings, then the embedding vector (floats). Rows are read on
+        access, only `find` reads all keys once to index them.
+        :param path: str
+            Specifies the path of the file.
+        :param embedding_vec_size: int
+            Specifies the vector size of the embedding.
+        :param slot_ids: Boolean
+            Specifies whether rows hold a slot, i.e. the file belongs to a LocalizedSlotSparseEmbeddingHash.
+        :param random_access: Boolean
+            Specifies whether rows are read at random, e.g. by lookups, which turns off the readahead of the mapping
+            so that a miss reads one page instead of a readahead window.
+        '''
+        self.path = path
+        self.dtype = get_record_dtype(embedding_vec_size, slot_ids)
+        size = os.path.getsize(path)
+        if size % self.dtype.itemsize != 0:
+            raise ValueError("{}: size {} is not a multiple of the row size {}, check embedding_vec_size".format(
+                path, size, self.dtype.itemsize))
+        if size == 0:
+            self.rows = np.zeros(0, self.dtype)
+        elif random_access and hasattr(mmap, 'MADV_RANDOM'):
+            with open(path, 'rb') as fp:
+                buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            buffer.madvise(mmap.MADV_RANDOM)
+            self.rows = np.frombuffer(buffer, dtype=self.dtype)
+        else:
+            self.rows = np.memmap(path, dtype=self.dtype, mode='r')
+        self._order = None
+
+    @classmethod
+    def for_embedding(cls, path, embedding, random_access=False):
+        '''
+        Opens the sparse model file of an embedding layer.
+        '''
+        from hugectrpy.layers import LocalizedSlotSparseEmbeddingHash
+        return cls(path, embedding.embedding_vec_size, isinstance(embedding, LocalizedSlotSparseEmbeddingHash),
+                   random_access)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get_rows(self, start, stop):
+        '''
+        Returns zero-copy keys and vectors of rows [start, stop).
+        '''
+        rows = self.rows[start:stop]
+        return rows['key'], rows['vector']
+
+    def get_order(self):
+        '''
+        Returns the row indices sorted by key and the sorted keys, computed on first use.
+        '''
+        if self._order is None:
+            keys = np.array(self.rows['key'])
+            if len(keys) < 2 or np.all(keys[1:] > keys[:-1]):
+                self._order = (np.arange(len(keys)), keys)
+            else:
+                order = np.argsort(keys, kind='stable')
+                self._order = (order, keys[order])
+        return self._order
+
+    def find(self, keys):
+        '''
+        Returns the row of every key, -1 for keys not in the file.
+        '''
+        keys = np.asarray(keys, dtype=np.int64)
+        order, sorted_keys = self.get_order()
+        if len(order) == 0:
+            return np.full(keys.shape, -1, dtype=np.int64)
+        position = np.minimum(np.searchsorted(sorted_keys, keys), len(order) - 1)
+        return np.where(sorted_keys[position] == keys, order[position], -1)
+
+    def lookup(self, keys):
+        '''
+        Returns the vectors of keys, zeros for keys not in the file, and a mask of the keys found.
+        '''
+        rows = self.find(keys)
+        found = rows >= 0
+        vectors = np.zeros(rows.shape + self.dtype['vector'].shape, dtype=np.float32)
+        vectors[found] = self.rows['vector'][rows[found]]
+        return vectors, found
+
+
+def merge_runs(pairs, runs, chunk):
+    '''
+    Streams (keys, rows) blocks in ascending key order from `pairs` holding the key-sorted runs [start, stop) of
+    `runs`, reading at most `chunk` pairs at once.
+    '''
+    block = max(1, chunk // len(runs))
+    positions = [start for start, _ in runs]
+    while True:
+        live = [i for i, (_, stop) in enumerate(runs) if positions[i] < stop]
+        if not live:
+            return
+        buffers = {i: pairs[positions[i]:min(positions[i] + block, runs[i][1])] for i in live}
+        # every key up to the smallest last key of the buffers has been read from every run
+        bound = min(buffers[i]['key'][-1] for i in live)
+        parts = []
+        for i in live:
+            count = int(np.searchsorted(buffers[i]['key'], bound, 'right'))
+            parts.append(np.array(buffers[i][:count]))
+            positions[i] += count
+        merged = np.concatenate(parts)
+        merged = merged[np.argsort(merged['key'], kind='stable')]
+        yield merged['key'], merged['row']
+
+
+def iter_sorted(snapshot, chunk=1 << 20, directory=None):
+    '''
+
+    Streams the keys of a snapshot in ascending order with their rows, without holding all keys at once: runs of
+    `chunk` rows are sorted into a temporary file of 16 bytes per row, then merged.
+    :param snapshot: SparseModelFile
+        Specifies the snapshot.
+    :param chunk: int
+        Specifies the number of rows sorted or merged at once.
+    :param directory: str, optional
+        Specifies the directory of the temporary file, the system default by default.
+    :return: generator of (keys, rows) int arrays
+    '''
+    if len(snapshot) <= chunk:
+        keys = np.array(snapshot.rows['key'])
+        order = np.argsort(keys, kind='stable')
+        if len(keys) > 0:
+            yield keys[order], order
+        return
+    with tempfile.TemporaryDirectory(dir=directory) as temp:
+        pairs = np.memmap(os.path.join(temp, 'runs.bin'), dtype=KEY_ROW_DTYPE, mode='w+', shape=(len(snapshot),))
+        runs = []
+        for start in range(0, len(snapshot), chunk):
+            keys = np.array(snapshot.rows['key'][start:start + chunk])
+            order = np.argsort(keys, kind='stable')
+            run = np.empty(len(keys), KEY_ROW_DTYPE)
+            run['key'] = keys[order]
+            run['row'] = order + start
+            pairs[start:start + len(run)] = run
+            runs.append((start, start + len(run)))
+        yield from merge_runs(pairs, runs, chunk)
+        del pairs
+
+
+def iter_join(old, new, chunk=1 << 20, directory=None):
+    '''
+
+    Streams the keys of two snapshots in ascending order, merging the sorted streams of `iter_sorted`.
+    :return: generator of (keys, new rows, old rows, deleted keys)
+        The keys of `new` with their rows in `new` and `old`, -1 for keys not in `old`, and the keys of `old` in the
+        same key range that are not in `new`.
+    '''
+    streams = [iter_sorted(old, chunk, directory), iter_sorted(new, chunk, directory)]
+    empty = (np.zeros(0, np.int64), np.zeros(0, np.int64))
+    buffers = [empty, empty]
+    done = [False, False]
+    while True:
+        for i in range(2):
+            if len(buffers[i][0]) == 0 and not done[i]:
+                buffers[i] = next(streams[i], None) or empty
+                done[i] = len(buffers[i][0]) == 0
+        if all(done) and not any(len(keys) for keys, _ in buffers):
+            return
+        # keys up to the bound have been read from both streams
+        bounds = [keys[-1] for (keys, _), finished in zip(buffers, done) if not finished]
+        taken = []
+        for i in range(2):
+            keys, rows = buffers[i]
+            count = len(keys) if not bounds else int(np.searchsorted(keys, min(bounds), 'right'))
+            taken.append((keys[:count], rows[:count]))
+            buffers[i] = (keys[count:], rows[count:])
+        (old_keys, old_rows), (new_keys, new_rows) = taken
+        if len(old_keys) == 0:
+            yield new_keys, new_rows, np.full(len(new_keys), -1, np.int64), old_keys
+            continue
+        position = np.minimum(np.searchsorted(old_keys, new_keys), len(old_keys) - 1)
+        found = old_keys[position] == new_keys
+        kept = np.zeros(len(old_keys), dtype=bool)
+        kept[position[found]] = True
+        yield new_keys, new_rows, np.where(found, old_rows[position], -1), old_keys[~kept]
+
+
+def get_row_change(old_vectors, new_vectors, norm='max'):
+    '''
+    Returns the change of every row, the largest absolute change of an element ('max') or the Euclidean distance
+    ('l2').
+    '''
+    difference = new_vectors - old_vectors
+    if norm == 'l2':
+        return np.sqrt(np.square(difference).sum(axis=1))
+    return np.abs(difference).max(axis=1, initial=0)
+
+
+def iter_changes(old, new, threshold=0.0, chunk=1 << 20, norm='max', directory=None):
+    # (changed rows, deleted keys) per block of `iter_join`
+    if old.dtype != new.dtype:
+        raise ValueError("snapshots have different rows: {} and {}".format(old.dtype, new.dtype))
+    if norm not in ('max', 'l2'):
+        raise ValueError("norm must be 'max' or 'l2', got {}".format(norm))
+    for keys, new_rows, old_rows, deleted in iter_join(old, new, chunk, directory):
+        changed = old_rows < 0
+        known = ~changed
+        changed[known] = get_row_change(old.rows['vector'][old_rows[known]], new.rows['vector'][new_rows[known]],
+                                        norm) > threshold
+        yield new.rows[new_rows[changed]], deleted
+
+
+def iter_diff(old, new, threshold=0.0, chunk=1 << 20, norm='max', directory=None):
+    '''
+
+    Streams the rows of `new` that are not in `old` or whose vector moved by more than `threshold`, in ascending
+    key order. Both snapshots are sorted by key in runs of `chunk` rows and merged, see `iter_sorted`.
+    :param old: SparseModelFile
+        Specifies the earlier snapshot.
+    :param new: SparseModelFile
+        Specifies the later snapshot.
+    :param threshold: float
+        Specifies the largest change of a row that is ignored.
+    :param chunk: int
+        Specifies the number of rows sorted or compared at once.
+    :param norm: str
+        Specifies how the change of a row is measured, the largest absolute change of an element ('max') or the
+        Euclidean distance ('l2').
+    :param directory: str, optional
+        Specifies the directory of the temporary files.
+    :return: generator of record arrays
+    '''
+    for rows, _ in iter_changes(old, new, threshold, chunk, norm, directory):
+        if len(rows) > 0:
+            yield rows
+
+
+def iter_deleted(old, new, chunk=1 << 20, directory=None):
+    '''
+    Streams the keys of `old` that are not in `new`, in ascending order.
+    '''
+    for _, _, _, deleted in iter_join(old, new, chunk, directory):
+        if len(deleted) > 0:
+            yield deleted
+
+
+class DeltaFile:
+
+    def __init__(self, path):
+        '''
+
+        Memory mapped delta between two snapshots written by `write_delta`: a header, the changed and added rows
+        sorted by key, then the deleted keys.
+        :param path: str
+            Specifies the path of the file.
+        '''
+        self.path = path
+        header = np.fromfile(path, dtype=DELTA_HEADER_DTYPE, count=1)
+        if len(header) == 0 or header[0]['magic'] != DELTA_MAGIC:
+            raise ValueError("{}: not a delta file".format(path))
+        header = header[0]
+        self.embedding_vec_size = int(header['embedding_vec_size'])
+        self.dtype = get_record_dtype(self.embedding_vec_size, bool(header['slot_ids']))
+        offset = DELTA_HEADER_DTYPE.itemsize
+        changed, deleted = int(header['changed']), int(header['deleted'])
+        self.rows = np.memmap(path, dtype=self.dtype, mode='r', offset=offset, shape=(changed,)) if changed \
+            else np.zeros(0, self.dtype)
+        offset += changed * self.dtype.itemsize
+        self.deleted = np.memmap(path, dtype='<i8', mode='r', offset=offset, shape=(deleted,)) if deleted \
+            else np.zeros(0, np.int64)
+
+
+def write_delta(old, new, path, threshold=0.0, chunk=1 << 20, norm='max'):
+    '''
+
+    Writes the rows of `new` that changed since `old` and the keys deleted from it to a compact delta file, in a
+    single sort-merge pass over both snapshots, see `iter_diff`.
+    :param old: SparseModelFile
+        Specifies the earlier snapshot.
+    :param new: SparseModelFile
+        Specifies the later snapshot.
+    :param path: str
+        Specifies the path of the delta file.
+    :param threshold: float
+        Specifies the largest change of a row that is ignored.
+    :param chunk: int
+        Specifies the number of rows sorted or compared at once.
+    :param norm: str
+        Specifies how the change of a row is measured, 'max' or 'l2'.
+    :return: dict
+        Number of `rows` of `new`, `changed` rows written (including added keys) and `deleted` keys.
+    '''
+    header = np.zeros(1, dtype=DELTA_HEADER_DTYPE)
+    header['magic'] = DELTA_MAGIC
+    header['embedding_vec_size'] = new.dtype['vector'].shape[0]
+    header['slot_ids'] = 1 if 'slot' in new.dtype.names else 0
+    directory = os.path.dirname(os.path.abspath(path))
+    # deleted keys follow the rows, they are collected in a temporary file next to the delta
+    with open(path, 'wb') as fp, tempfile.TemporaryFile(dir=directory) as deleted_fp:
+        fp.write(header.tobytes())
+        for rows, deleted in iter_changes(old, new, threshold, chunk, norm, directory):
+            header['changed'] += len(rows)
+            header['deleted'] += len(deleted)
+            fp.write(rows.tobytes())
+            deleted_fp.write(deleted.astype('<i8').tobytes())
+        deleted_fp.seek(0)
+        shutil.copyfileobj(deleted_fp, fp)
+        fp.seek(0)
+        fp.write(header.tobytes())
+    return {'rows': len(new), 'changed': int(header['changed'][0]), 'deleted': int(header['deleted'][0])}
+
+
+def merge_delta(base, delta, path, chunk=1 << 20):
+    '''
+
+    Applies a delta to a snapshot and writes the resulting full snapshot, streaming the base `chunk` rows at a
+    time: deleted keys are dropped, changed rows replaced and added rows appended.
+    :param base: SparseModelFile
+        Specifies the snapshot the delta was computed from.
+    :param delta: DeltaFile
+        Specifies the delta.
+    :param path: str
+        Specifies the path of the merged snapshot.
+    :return: SparseModelFile
+    '''
+    if base.dtype != delta.dtype:
+        raise ValueError("delta rows {} do not match snapshot rows {}".format(delta.dtype, base.dtype))
+    delta_order = np.argsort(delta.rows['key'], kind='stable')
+    delta_keys = np.asarray(delta.rows['key'])[delta_order]
+    deleted = np.sort(np.asarray(delta.deleted))
+    used = np.zeros(len(delta_keys), dtype=bool)
+
+    def search(sorted_keys, keys):
+        if len(sorted_keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        position = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        return np.where(sorted_keys[position] == keys, position, -1)
+
+    with open(path, 'wb') as fp:
+        for start in range(0, len(base), chunk):
+            rows = np.array(base.rows[start:start + chunk])
+            rows = rows[search(deleted, rows['key']) < 0]
+            position = search(delta_keys, rows['key'])
+            replaced = position >= 0
+            rows[replaced] = delta.rows[delta_order[position[replaced]]]
+            used[position[replaced]] = True
+            fp.write(rows.tobytes())
+        fp.write(np.asarray(delta.rows[np.sort(delta_order[~used])]).tobytes())
+    return SparseModelFile(path, base.dtype['vector'].shape[0], 'slot' in base.dtype.names)
+
+
+def read_dense_model(model, path):
+    '''
+
+    Reads a dense model file, the parameters of the FullyConnected layers in layer order (weight then bias) as
+    floats, without copying.
+    :param model: Model
+        Specifies the model the file belongs to.
+    :param path: str
+        Specifies the path of the file.
+    :return: dict
+        Maps layer names to dicts of `weight` (inputs, n) and `bias` (n,) arrays.
+    '''
+    from hugectrpy.layers import FullyConnected
+    values = np.memmap(path, dtype='<f4', mode='r') if os.path.getsize(path) > 0 else np.zeros(0, np.float32)
+    params = dict()
+    offset = 0
+    for layer, input_shapes, _ in model.infer_shapes():
+        if not isinstance(layer, FullyConnected):
+            continue
+        k, n = input_shapes[0][-1], layer.n
+        if offset + k * n + n > len(values):
+            raise ValueError("{}: {} floats are too few for the layers of the model".format(path, len(values)))
+        params[layer.get_name()] = {'weight': values[offset:offset + k * n].reshape(k, n),
+                                    'bias': values[offset + k * n:offset + k * n + n]}
+        offset += k * n + n
+    if offset != len(values):
+        raise ValueError("{}: {} floats but the layers of the model have {}".format(path, len(values), offset))
+    return params
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from hugectrpy.data import DataReader, open_data_file
+
+
+def hash64(keys):
+    '''
+    Mixes int64 keys into well distributed uint64 hashes (splitmix64 finalizer).
+    '''
+    h = np.asarray(keys).astype(np.uint64)
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def count_leading_zeros(values):
+    '''
+    Returns the number of leading zero bits of uint64 values, 64 for 0.
+    '''
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # frexp gives the bit length of integers exactly representable in float64
+    high_length = np.frexp(high)[1]
+    low_length = np.frexp(low)[1]
+    return np.where(high_length > 0, 32 - high_length, 64 - low_length)
+
+
+class HyperLogLog:
+
+    def __init__(self, precision=14, count=1):
+        '''
+
+        HyperLogLog sketches estimating the number of distinct keys with constant memory. The relative error is
+        about 1.04 / sqrt(2 ** precision).
+        :param precision: int
+            Specifies the number of hash bits selecting a register, 2 ** precision registers are used.
+        :param count: int
+            Specifies the number of independent sketches, e.g. one per slot.
+        '''
+        self.precision = precision
+        self.registers = np.zeros((count, 1 << precision), dtype=np.uint8)
+
+    def add(self, keys, sketches=None):
+        '''
+        Adds keys to the sketches.
+        :param keys: int array
+            Specifies the keys.
+        :param sketches: int array, optional
+            Specifies the sketch of every key, all keys go to the first sketch by default.
+        '''
+        h = hash64(keys).ravel()
+        p = self.precision
+        index = (h >> np.uint64(64 - p)).astype(np.int64)
+        rank = np.minimum(count_leading_zeros(h << np.uint64(p)), 64 - p) + 1
+        if sketches is not None:
+            index += np.asarray(sketches).ravel() * self.registers.shape[1]
+        np.maximum.at(self.registers.reshape(-1), index, rank.astype(np.uint8))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        '''
+        Returns the estimated number of distinct keys of every sketch.
+        '''
+        m = self.registers.shape[1]
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)), axis=1)
+        zeros = np.sum(self.registers == 0, axis=1)
+        # linear counting is more accurate for small cardinalities
+        small = (raw <= 2.5 * m) & (zeros > 0)
+        linear = m * np.log(m / np.maximum(zeros, 1))
+        return np.where(small, linear, raw)
+
+    def union(self):
+        '''
+        Returns a single sketch of the union of all sketches.
+        '''
+        union = HyperLogLog(self.precision)
+        union.registers[0] = self.registers.max(axis=0)
+        return union
+
+
+def scan_file(data, path, precision, batch_size):
+    '''
+    Returns the sketch, the histogram of keys per sample and the number of keys of every slot of every Sparse
+    input of one file.
+    '''
+    f = open_data_file(data, path, check_features=False)
+    sketches = {sp.get_name(): HyperLogLog(precision, sp.slot_num) for sp in data.sparse}
+    histograms = {sp.get_name(): np.zeros(1, dtype=np.int64) for sp in data.sparse}
+    slot_counts = {sp.get_name(): np.zeros(sp.slot_num, dtype=np.int64) for sp in data.sparse}
+    for start in range(0, f.number_of_records, batch_size):
+        _, _, keys = f.get_records(start, min(start + batch_size, f.number_of_records))
+        first = 0
+        for sp in data.sparse:
+            slot_keys = keys[:, first:first + sp.slot_num]
+            first += sp.slot_num
+            valid = slot_keys >= 0
+            slots = np.broadcast_to(np.arange(sp.slot_num)[None, :, None], slot_keys.shape)
+            sketches[sp.get_name()].add(slot_keys[valid], slots[valid])
+            slot_counts[sp.get_name()] += valid.sum(axis=(0, 2))
+            counts = np.bincount(valid.reshape(len(valid), -1).sum(axis=1))
+            histogram = histograms[sp.get_name()]
+            if len(counts) > len(histogram):
+                histogram = np.pad(histogram, (0, len(counts) - len(histogram)))
+            histogram[:len(counts)] += counts
+            histograms[sp.get_name()] = histogram
+    return sketches, histograms, slot_counts
+
+
+class CardinalityReport:
+
+    def __init__(self, data, sketches, histograms, slot_counts=None):
+        '''
+        Result of `scan_cardinality`.
+        :param data: Data
+            Specifies the scanned Data layer.
+        :param sketches: dict
+            Maps Sparse names to HyperLogLog sketches with one sketch per slot.
+        :param histograms: dict
+            Maps Sparse names to arrays counting the samples with every number of keys.
+        :param slot_counts: dict, optional
+            Maps Sparse names to the number of keys seen in every slot.
+        '''
+        self.data = data
+        self.sketches = sketches
+        self.histograms = histograms
+        self.slot_counts = slot_counts
+
+    def get_keys_per_sample(self, name):
+        '''
+        Returns the mean number of keys of every slot of a Sparse input per sample, i.e. its lookup traffic.
+        '''
+        return self.slot_counts[name] / max(1, int(self.histograms[name].sum()))
+
+    def get_distinct_keys(self, name):
+        '''
+        Returns the estimated number of distinct keys of every slot of a Sparse input.
+        '''
+        return self.sketches[name].estimate()
+
+    def get_total_distinct_keys(self, name):
+        '''
+        Returns the estimated number of distinct keys over all slots of a Sparse input.
+        '''
+        return float(self.sketches[name].union().estimate()[0])
+
+    def get_max_features(self, name):
+        '''
+        Returns the largest number of keys seen in a sample.
+        '''
+        return int(np.flatnonzero(self.histograms[name])[-1]) if self.histograms[name].any() else 0
+
+    def get_sparse_kwargs(self, name, headroom=0.1):
+        '''
+        Returns the recommended arguments of the Sparse constructor.
+        :param name: str
+            Specifies the name of the Sparse input.
+        :param headroom: float
+            Specifies the fraction added on top of the observed values.
+        '''
+        sparse = [sp for sp in self.data.sparse if sp.get_name() == name][0]
+        return {'name': name, 'slot_num': sparse.slot_num,
+                'max_feature_num_per_sample': max(1, int(math.ceil(self.get_max_features(name) * (1 + headroom))))}
+
+    def get_embedding_kwargs(self, name, headroom=0.1):
+        '''
+        Returns the recommended `vocabulary_size` of an embedding reading a Sparse input.
+        '''
+        return {'vocabulary_size': max(1, int(math.ceil(self.get_total_distinct_keys(name) * (1 + headroom))))}
+
+    def apply(self, model, headroom=0.1):
+        '''
+        Sets the recommended values on the Sparse inputs of the Data layer and on the embeddings reading them.
+        '''
+        from hugectrpy.layers import DistributedSlotSparseEmbeddingHash
+        for sp in self.data.sparse:
+            sp.max_feature_num_per_sample = self.get_sparse_kwargs(sp.get_name(), headroom)[
+                'max_feature_num_per_sample']
+        for layer in model.layers:
+            if isinstance(layer, DistributedSlotSparseEmbeddingHash) and \
+                    layer.get_bottom_names()[0] in self.sketches:
+                layer.vocabulary_size = self.get_embedding_kwargs(layer.get_bottom_names()[0], headroom)[
+                    'vocabulary_size']
+
+    def __str__(self):
+        lines = []
+        for sp in self.data.sparse:
+            name = sp.get_name()
+            lines.append("{}: ~{:.0f} distinct keys, per slot {}, at most {} keys per sample".format(
+                name, self.get_total_distinct_keys(name), np.round(self.get_distinct_keys(name)).astype(np.int64),
+                self.get_max_features(name)))
+        return "\n".join(lines)
+
+
+def scan_cardinality(data, eval=False, precision=14, batch_size=65536, processes=None):
+    '''
+
+    Scans the files of a Data layer once and estimates the distinct keys of every slot with HyperLogLog sketches
+    and the number of keys per sample with a histogram. Files are scanned in parallel and the sketches merged,
+    memory does not depend on the size of the dataset.
+    :param data: Data
+        Specifies the Data layer whose files are scanned.
+    :param eval: Boolean
+        If set, `eval_source` is scanned instead of `source`.
+    :param precision: int
+        Specifies the precision of the sketches.
+    :param batch_size: int
+        Specifies the number of records processed at once.
+    :param processes: int, optional
+        Specifies the number of processes, all CPUs by default. With 1 files are scanned in this process.
+    :return: CardinalityReport
+    '''
+    files = DataReader(data, batch_size, eval=eval).files
+    sketches = {sp.get_name(): HyperLogLog(precision, sp.slot_num) for sp in data.sparse}
+    histograms = {sp.get_name(): np.zeros(1, dtype=np.int64) for sp in data.sparse}
+    slot_counts = {sp.get_name(): np.zeros(sp.slot_num, dtype=np.int64) for sp in data.sparse}
+
+    def merge(file_sketches, file_histograms, file_slot_counts):
+        for name, sketch in file_sketches.items():
+            slot_counts[name] += file_slot_counts[name]
+            sketches[name].merge(sketch)
+            histogram = file_histograms[name]
+            size = max(len(histogram), len(histograms[name]))
+            histograms[name] = np.pad(histograms[name], (0, size - len(histograms[name]))) + \
+                np.pad(histogram, (0, size - len(histogram)))
+
+    # sketches are merged as files finish, as_completed drops its reference to a future once yielded, so only
+    # the sketches of files finished but not merged yet are held
+    if processes == 1:
+        for path in files:
+            merge(*scan_file(data, path, precision, batch_size))
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            for future in as_completed([pool.submit(scan_file, data, path, precision, batch_size) for path in files]):
+                merge(*future.result())
+    return CardinalityReport(data, sketches, histograms, slot_counts)
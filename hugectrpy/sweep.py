@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# Copyright Nvidia Corporation
+#
+#  Licensed under the Apache License, Version 2.0 (the License);
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import collections
+import copy
+import hashlib
+import io
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def iter_assignments(axes):
+    '''
+    Yields every combination of axis values as a dict, the last axis changing fastest.
+    '''
+    keys = list(axes)
+    for values in itertools.product(*(axes[key] for key in keys)):
+        yield dict(zip(keys, values))
+
+
+def make_variant(base, assignment, layer_index=None):
+    '''
+
+    Returns a copy of a model with the values of an assignment set. Only the solver, optimizer and layers that
+    change are copied (shallowly), everything else, including the cached JSON of unchanged objects, is shared with
+    the base model.
+    :param base: Model
+        Specifies the base model, it is not modified.
+    :param assignment: dict
+        Maps paths to values. Paths are 'solver.<attribute>', 'optimizer' (an Optimizer), 'optimizer.<attribute>'
+        and 'layers.<layer name>.<attribute>'. 'optimizer' is applied before 'optimizer.<attribute>'. Layer
+        attributes that change the names of the tops of a layer, e.g. its name, are rejected.
+    :param layer_index: dict, optional
+        Maps layer names to their position in `base.layers`, built when not given.
+    :return: Model
+    '''
+    if layer_index is None:
+        layer_index = {layer.get_name(): i for i, layer in enumerate(base.layers)}
+    variant = copy.copy(base)
+    copied = set()
+    paths = sorted(assignment, key=lambda path: path != 'optimizer')
+    for path in paths:
+        value = assignment[path]
+        parts = path.split('.')
+        if parts == ['optimizer']:
+            # the value belongs to the axis, it is copied if an attribute is set on it
+            variant.optimizer = value
+        elif parts[0] in ('solver', 'optimizer') and len(parts) == 2:
+            target = getattr(variant, parts[0])
+            if not hasattr(target, parts[1]):
+                raise ValueError("{}: {} has no attribute {}".format(path, type(target).__name__, parts[1]))
+            if parts[0] not in copied:
+                target = copy.copy(target)
+                setattr(variant, parts[0], target)
+                copied.add(parts[0])
+            setattr(target, parts[1], value)
+        elif parts[0] == 'layers' and len(parts) == 3:
+            if parts[1] not in layer_index:
+                raise ValueError("{}: no layer named {}".format(path, parts[1]))
+            if variant.layers is base.layers:
+                variant.layers = list(base.layers)
+            i = layer_index[parts[1]]
+            if not hasattr(variant.layers[i], parts[2]):
+                raise ValueError("{}: {} has no attribute {}".format(path, type(variant.layers[i]).__name__,
+                                                                      parts[2]))
+            if ('layers', i) not in copied:
+                variant.layers[i] = copy.copy(variant.layers[i])
+                copied.add(('layers', i))
+            setattr(variant.layers[i], parts[2], value)
+            # consumers still hold the base layer, their bottoms would name its old tops
+            if variant.layers[i].get_top_names() != base.layers[i].get_top_names():
+                raise ValueError("{}: changes the tops of {}, which the layers reading them would not follow".format(
+                    path, parts[1]))
+        else:
+            raise ValueError("{}: paths are 'solver.<attribute>', 'optimizer', 'optimizer.<attribute>' or "
+                             "'layers.<layer name>.<attribute>'".format(path))
+    return variant
+
+
+def get_digest(model):
+    '''
+    Returns the SHA-1 of the JSON configuration of a model, equal for models serializing to the same text.
+    '''
+    digest = hashlib.sha1()
+    for chunk in model.iter_json_chunks():
+        digest.update(chunk.encode())
+    return digest.hexdigest()
+
+
+def sweep(base, axes, dedupe=True, validate=False):
+    '''
+
+    Lazily yields the variants of a model for every combination of axis values. Variants share the unchanged
+    parts of the base model, so memory does not grow with the size of the grid.
+    :param base: Model
+        Specifies the base model.
+    :param axes: dict
+        Maps paths (see `make_variant`) to lists of values, e.g. {'solver.batch_size': [1024, 2048],
+        'layers.fc1.n': [256, 512]}.
+    :param dedupe: Boolean
+        If set, variants serializing to the same configuration as an earlier one are skipped.
+    :param validate: Boolean
+        If set, variants for which `Model.validate` raises ValueError are skipped.
+    :return: generator of (assignment dict, Model) tuples
+    '''
+    layer_index = {layer.get_name(): i for i, layer in enumerate(base.layers)}
+    seen = set()
+    for assignment in iter_assignments(axes):
+        variant = make_variant(base, assignment, layer_index)
+        if dedupe:
+            digest = get_digest(variant)
+            if digest in seen:
+                continue
+            seen.add(digest)
+        if validate:
+            try:
+                variant.validate()
+            except ValueError:
+                continue
+        yield assignment, variant
+
+
+def describe(value):
+    '''
+    Returns a JSON friendly form of an axis value, the configuration of Serializable values.
+    '''
+    if hasattr(value, 'get_cached_parameters'):
+        return value.get_cached_parameters()
+    return value
+
+
+_worker_base = None
+_worker_index = None
+
+
+def _init_worker(base_json):
+    global _worker_base, _worker_index
+    from hugectrpy.model import Model
+    _worker_base = Model.from_json(io.StringIO(base_json))
+    _worker_index = {layer.get_name(): i for i, layer in enumerate(_worker_base.layers)}
+
+
+def write_variants(assignments, output_dir, validate, base=None, layer_index=None):
+    '''
+    Writes the configurations of assignments to content addressed files and returns their digests, None for
+    invalid variants.
+    '''
+    base = _worker_base if base is None else base
+    layer_index = _worker_index if layer_index is None else layer_index
+    digests = []
+    for assignment in assignments:
+        variant = make_variant(base, assignment, layer_index)
+        if validate:
+            try:
+                variant.validate()
+            except ValueError:
+                digests.append(None)
+                continue
+        digest = get_digest(variant)
+        path = os.path.join(output_dir, digest + '.json')
+        if not os.path.exists(path):
+            # identical configurations may be written by several processes, the rename is atomic
+            temporary = "{}.{}.tmp".format(path, os.getpid())
+            with open(temporary, 'w') as fp:
+                variant.dump(fp)
+            os.replace(temporary, path)
+        digests.append(digest)
+    return digests
+
+
+def write_sweep(base, axes, output_dir, processes=None, chunk_size=256, max_pending=None, validate=False,
+                index='index.jsonl'):
+    '''
+
+    Writes the configurations of all variants of a sweep to `output_dir`, named by the SHA-1 of their content so
+    duplicates are written once. Assignments are generated lazily and handed to a process pool in chunks, every
+    process rebuilds the base model from its JSON once.
+    :param base: Model
+        Specifies the base model.
+    :param axes: dict
+        Maps paths to lists of values, see `sweep`.
+    :param output_dir: str
+        Specifies the directory of the configurations and the index.
+    :param processes: int, optional
+        Specifies the number of processes, all CPUs by default. With 1 variants are written in this process.
+    :param chunk_size: int
+        Specifies the number of assignments handed to a process at once.
+    :param max_pending: int, optional
+        Specifies the maximum number of chunks in flight, twice the number of processes by default.
+    :param validate: Boolean
+        If set, variants for which `Model.validate` raises ValueError are not written.
+    :param index: str
+        Specifies the name of the index file, one JSON line per distinct configuration with its file name and
+        assignment.
+    :return: str
+        Path of the index.
+    '''
+    processes = processes or os.cpu_count()
+    max_pending = max_pending or 2 * processes
+    os.makedirs(output_dir, exist_ok=True)
+    combinations = iter_assignments(axes)
+    chunks = iter(lambda: list(itertools.islice(combinations, chunk_size)), [])
+    index_path = os.path.join(output_dir, index)
+    seen = set()
+
+    with open(index_path, 'w') as fp:
+        def record(assignments, digests):
+            for assignment, digest in zip(assignments, digests):
+                if digest is None or digest in seen:
+                    continue
+                seen.add(digest)
+                entry = {'config': digest + '.json',
+                         'assignment': {path: describe(value) for path, value in assignment.items()}}
+                fp.write(json.dumps(entry) + "\n")
+
+        if processes == 1:
+            layer_index = {layer.get_name(): i for i, layer in enumerate(base.layers)}
+            for assignments in chunks:
+                record(assignments, write_variants(assignments, output_dir, validate, base, layer_index))
+        else:
+            with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(str(base),)) as pool:
+                pending = collections.deque()
+                for assignments in chunks:
+                    if len(pending) >= max_pending:
+                        done, future = pending.popleft()
+                        record(done, future.result())
+                    pending.append((assignments, pool.submit(write_variants, assignments, output_dir, validate)))
+                while pending:
+                    done, future = pending.popleft()
+                    record(done, future.result())
+    return index_path
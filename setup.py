@@ -7,5 +7,6 @@ setuptools.setup(
     author_email="ecan@nvidia.com",
     description="A Python wrapper for the HugeCTR package",
     packages=setuptools.find_packages(),
+    install_requires=['numpy'],
     python_requires='>=3.6',
 )
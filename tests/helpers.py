@@ -0,0 +1,30 @@
+# models shared by the tests, import as `from helpers import ...`
+
+
+def build_criteo_model():
+    from hugectrpy.model import Solver, AdamOptimizer, Model
+    from hugectrpy.layers import Dense, Label, Sparse, Data, DistributedSlotSparseEmbeddingHash, \
+        Reshape, FullyConnected, RELU, ELU, Dropout, Concat, Slice, BinaryCrossEntropyLoss
+
+    label = Label(name='label', dim=1)
+    sparse = Sparse(name='data1', max_feature_num_per_sample=2, slot_num=26)
+    data = Data(name='data', source="./file_list.txt", eval_source="./file_list_test.txt", check="Sum",
+                label=label, dense=Dense(name='dense', dim=13), sparse=sparse)
+    emb = DistributedSlotSparseEmbeddingHash(name='sparse_embedding1', src_layers=sparse, vocabulary_size=1603616,
+                                             load_factor=0.75, embedding_vec_size=16, combiner=0)
+    re1 = Reshape(name='reshape1', src_layers=emb, leading_dim=416)
+    concat1 = Concat(name='concat1', src_layers=[re1, data.dense])
+    slice1 = Slice(name='slice1', src_layers=concat1, ranges=[[0, 400], [400, 429]])
+    fc1 = FullyConnected(name='fc1', src_layers=slice1.get_top(0), n=200)
+    elu1 = ELU(name='elu1', src_layers=fc1, alpha=0.5)
+    fc2 = FullyConnected(name='fc2', src_layers=slice1.get_top(1), n=200)
+    relu2 = RELU(name='relu2', src_layers=fc2)
+    dropout1 = Dropout(name='dropout1', src_layers=relu2, rate=0.5)
+    concat2 = Concat(name='concat2', src_layers=[elu1, dropout1])
+    fc3 = FullyConnected(name='fc3', src_layers=concat2, n=1)
+    loss = BinaryCrossEntropyLoss(name='loss', src_layers=[fc3, label])
+
+    model = Model(Solver(gpu=[[0, 1], [2, 3]], mixed_precision=1024), AdamOptimizer(alpha=0.005))
+    model.add_layer(data)
+    model.add_layer_re(loss)
+    return model
@@ -0,0 +1,58 @@
+import unittest
+
+
+class TestBatching(unittest.TestCase):
+
+    def test_micro_batcher(self):
+        import asyncio
+        import time
+        import numpy as np
+        from hugectrpy.batching import MicroBatcher
+
+        sizes = []
+
+        def predict(batch):
+            sizes.append(len(batch['dense']))
+            time.sleep(0.01)
+            if (batch['dense'] < 0).any():
+                raise ValueError("negative input")
+            return batch['dense'].sum(axis=1, keepdims=True)
+
+        async def main():
+            self.assertRaises(ValueError, MicroBatcher, predict, 0)
+            batcher = MicroBatcher(predict, max_batch=4, max_wait=0.05, max_queue=6)
+            with self.assertRaises(ValueError):
+                await batcher.predict({'dense': np.ones(2)})
+            async with batcher:
+                results = await asyncio.gather(*[batcher.predict({'dense': np.full(2, i)}) for i in range(10)])
+                np.testing.assert_array_equal(np.concatenate(results), 2 * np.arange(10))
+                self.assertEqual(sorted(sizes), [2, 4, 4])
+                self.assertLessEqual(batcher.queue.qsize(), 6)
+
+                # a lone sample waits at most max_wait
+                start = time.perf_counter()
+                await batcher.predict({'dense': np.ones(2)})
+                self.assertLess(time.perf_counter() - start, 0.5)
+                self.assertEqual(sizes[-1], 1)
+
+                with self.assertRaises(ValueError):
+                    await batcher.predict({'dense': -np.ones(2)})
+
+                # a malformed sample fails its batch only, the batcher keeps running
+                with self.assertRaises(KeyError):
+                    await batcher.predict({'sparse': np.ones(2)})
+                errors = await asyncio.gather(batcher.predict({'dense': np.ones(3)}),
+                                              batcher.predict({'dense': np.ones(2)}), return_exceptions=True)
+                self.assertTrue(all(isinstance(e, ValueError) for e in errors))
+                np.testing.assert_array_equal(await batcher.predict({'dense': np.ones(2)}), [2])
+                stats = batcher.get_stats()
+                self.assertEqual(stats['batches'], 5)
+                self.assertEqual(stats['mean_batch'], 12 / 5)
+                self.assertGreater(stats['latency_p99'], 0)
+            self.assertIsNone(batcher.task)
+
+        asyncio.run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+
+class TestConvert(unittest.TestCase):
+
+    def write_tsv(self, path, count, seed):
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        rows = []
+        with open(path, 'w') as fp:
+            for i in range(count):
+                label = int(rng.integers(0, 2))
+                dense = [str(int(v)) if v >= 0 else '' for v in rng.integers(-1, 100, 3)]
+                keys = ['{:08x}'.format(int(v)) if v >= 0 else '' for v in rng.integers(-1, 1 << 32, 4)]
+                fp.write('\t'.join([str(label)] + dense + keys) + '\n')
+                rows.append((label, dense, keys))
+        return rows
+
+    def test_convert(self):
+        import os
+        import tempfile
+        import numpy as np
+        from hugectrpy.convert import convert
+        from hugectrpy.data import DataReader, BinaryFile
+        from hugectrpy.layers import Dense, Label, Sparse, Data
+
+        with tempfile.TemporaryDirectory() as directory:
+            inputs = [os.path.join(directory, 'day0.tsv'), os.path.join(directory, 'day1.tsv')]
+            rows = self.write_tsv(inputs[0], 700, 0) + self.write_tsv(inputs[1], 300, 1)
+
+            for processes in [1, 2]:
+                output_dir = os.path.join(directory, 'out' + str(processes))
+                # records take 17 bytes of label and dense and 4 slots of 14 bytes
+                file_list = convert(inputs, output_dir, dense_dim=3, slot_num=4, processes=processes,
+                                    chunk_size=64, max_pending=2, target_file_size=73 * 300)
+                data = Data(name='data', label=Label(name='label', dim=1), dense=Dense(name='dense', dim=3),
+                            sparse=Sparse(name='data1', slot_num=4, max_feature_num_per_sample=4), source=file_list)
+                reader = DataReader(data, batch_size=1000)
+                self.assertEqual([BinaryFile(f).number_of_records for f in reader.files], [300, 300, 300, 100])
+
+                batches = list(reader)
+                label = np.concatenate([b['label'] for b in batches])
+                dense = np.concatenate([b['dense'] for b in batches])
+                keys = np.concatenate([b['data1'] for b in batches])
+                np.testing.assert_array_equal(label[:, 0], [r[0] for r in rows])
+                expected = np.log1p([[float(v or 0) for v in r[1]] for r in rows]).astype(np.float32)
+                np.testing.assert_allclose(dense, expected, rtol=1e-6)
+                expected = [[int(v or '0', 16) | (s << 32) for s, v in enumerate(r[2])] for r in rows]
+                np.testing.assert_array_equal(keys[:, :, 0], expected)
+
+    def test_hash_fields(self):
+        import zlib
+        import numpy as np
+        from hugectrpy.convert import hash_fields
+
+        fields = [b'68fd1e64', b'', b'a', b'05db9164', b'\xff\x00', b'68fd1e64' * 3]
+        text = b'\t'.join(fields)
+        lengths = np.array([len(f) for f in fields])
+        starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+        hashes = hash_fields(np.frombuffer(text, np.uint8), starts, starts + lengths)
+        np.testing.assert_array_equal(hashes, [zlib.crc32(f) for f in fields])
+        self.assertEqual(len(hash_fields(np.zeros(0, np.uint8), starts[:0], starts[:0])), 0)
+
+    def test_invalid_lines(self):
+        import os
+        import tempfile
+        from hugectrpy.convert import convert
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'day0.tsv')
+            with open(path, 'w') as fp:
+                fp.write('1\t2\t3\n')
+            with self.assertRaises(ValueError):
+                convert(path, directory, dense_dim=3, slot_num=4, processes=1)
+            with open(path, 'w') as fp:
+                fp.write('1\t2\t3\t4\t0\t0\t0\txyz\n')
+            with self.assertRaises(ValueError):
+                convert(path, directory, dense_dim=3, slot_num=4, processes=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+
+
+def write_dataset(directory, count=100, nnz=2, check=True, files=2):
+    import os
+    import numpy as np
+    from hugectrpy.data import RecordLayout, BinaryWriter, write_file_list
+
+    rng = np.random.default_rng(0)
+    layout = RecordLayout(label_dim=1, dense_dim=3, slot_num=4, nnz=nnz, check=check)
+    paths = []
+    records = []
+    for i in range(files):
+        path = os.path.join(directory, 'part' + str(i) + '.bin')
+        label = rng.integers(0, 2, (count, 1)).astype(np.float32)
+        dense = rng.normal(size=(count, 3)).astype(np.float32)
+        keys = rng.integers(-1, 1 << 40, (count, 4, nnz))
+        with BinaryWriter(path, layout) as writer:
+            writer.write(label[:count // 2], dense[:count // 2], keys[:count // 2])
+            writer.write(label[count // 2:], dense[count // 2:], keys[count // 2:])
+        paths.append(path)
+        records.append((label, dense, keys))
+    file_list = os.path.join(directory, 'file_list.txt')
+    write_file_list(file_list, paths)
+    return file_list, records
+
+
+def build_data(source, check='Sum'):
+    from hugectrpy.layers import Dense, Label, Sparse, Data
+    return Data(name='data', label=Label(name='label', dim=1), dense=Dense(name='dense', dim=3),
+                sparse=[Sparse(name='data1', slot_num=3, max_feature_num_per_sample=6),
+                        Sparse(name='data2', slot_num=1, max_feature_num_per_sample=2)],
+                source=source, check=check)
+
+
+class TestData(unittest.TestCase):
+
+    def test_read(self):
+        import tempfile
+        import numpy as np
+        from hugectrpy.data import DataReader
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_list, records = write_dataset(directory)
+            reader = DataReader(build_data(file_list), batch_size=32)
+            self.assertEqual(reader.get_size(), 200)
+            batches = list(reader)
+            self.assertEqual([len(b['label']) for b in batches], [32, 32, 32, 4] * 2)
+
+            label = np.concatenate([b['label'] for b in batches[:4]])
+            dense = np.concatenate([b['dense'] for b in batches[4:]])
+            data1 = np.concatenate([b['data1'] for b in batches[:4]])
+            data2 = np.concatenate([b['data2'] for b in batches[4:]])
+            np.testing.assert_array_equal(label, records[0][0])
+            np.testing.assert_array_equal(dense, records[1][1])
+            np.testing.assert_array_equal(data1, records[0][2][:, :3])
+            np.testing.assert_array_equal(data2, records[1][2][:, 3:])
+
+            # batches are views of the memory map
+            self.assertFalse(batches[0]['data1'].flags.owndata)
+            del batches
+
+    def test_checks(self):
+        import tempfile
+        import numpy as np
+        from hugectrpy.data import DataReader, BinaryFile, HEADER_DTYPE
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_list, _ = write_dataset(directory, check=False, files=1)
+            list(DataReader(build_data(file_list, check=None), batch_size=32))
+            with self.assertRaises(ValueError):
+                list(DataReader(build_data(file_list), batch_size=32))
+
+            file_list, _ = write_dataset(directory, nnz=3, files=1)
+            with self.assertRaises(ValueError):
+                list(DataReader(build_data(file_list), batch_size=32))
+
+            file_list, _ = write_dataset(directory, files=1)
+            path = directory + '/part0.bin'
+            f = BinaryFile(path)
+            f.verify()
+            position = HEADER_DTYPE.itemsize + 57 * f.layout.record_size + 10
+            del f
+            with open(path, 'r+b') as fp:
+                fp.seek(position)
+                value = fp.read(1)
+                fp.seek(position)
+                fp.write(bytes([(value[0] + 1) % 256]))
+            with self.assertRaises(ValueError) as context:
+                BinaryFile(path).verify()
+            self.assertIn('record 57', str(context.exception))
+            with self.assertRaises(ValueError):
+                list(DataReader(build_data(file_list), batch_size=32))
+            self.assertEqual(len(list(DataReader(build_data(file_list), batch_size=32, verify=False))), 4)
+
+            with open(path, 'ab') as fp:
+                fp.write(np.zeros(3, dtype=np.uint8).tobytes())
+            with self.assertRaises(ValueError):
+                BinaryFile(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
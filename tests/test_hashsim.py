@@ -0,0 +1,59 @@
+import unittest
+
+
+class TestHashsim(unittest.TestCase):
+
+    def test_insert_keys(self):
+        import numpy as np
+        from hugectrpy.hashsim import insert_keys
+        from hugectrpy.stats import hash64
+
+        keys = np.random.default_rng(0).choice(1 << 40, 900, replace=False)
+        capacity = 1000
+        probes = insert_keys(keys, capacity, batch_size=256)
+
+        # one key at a time
+        occupied = np.zeros(capacity, dtype=bool)
+        expected = []
+        for home in (hash64(keys) % np.uint64(capacity)).astype(np.int64):
+            distance = 0
+            while occupied[(home + distance) % capacity]:
+                distance += 1
+            occupied[(home + distance) % capacity] = True
+            expected.append(distance + 1)
+        self.assertEqual(probes.sum(), sum(expected))
+        self.assertTrue(np.all(probes >= 1))
+        self.assertRaises(ValueError, insert_keys, keys, 800)
+
+    def test_simulate_hashtable(self):
+        import numpy as np
+        from hugectrpy.hashsim import simulate_hashtable, zipf_keys
+        from hugectrpy.layers import DistributedSlotSparseEmbeddingHash, Sparse
+
+        keys = zipf_keys(500000, 100000, seed=1)
+        distinct = len(np.unique(keys))
+        emb = DistributedSlotSparseEmbeddingHash(name='emb', src_layers=Sparse(name='data1', slot_num=1,
+                                                                               max_feature_num_per_sample=1),
+                                                 vocabulary_size=distinct, load_factor=0.5, embedding_vec_size=16,
+                                                 combiner=0)
+        report = simulate_hashtable(keys, load_factors=(0.5, 0.75, 0.95), max_probes=16, embedding=emb,
+                                    num_state_tables=2)
+        rows = report.rows
+        for row in rows:
+            a = row['load_factor']
+            # Knuth: about (1 + 1 / (1 - a)) / 2 probes per successful lookup
+            self.assertAlmostEqual(row['mean_probes'] / (0.5 * (1 + 1 / (1 - a))), 1, delta=0.1)
+        self.assertEqual(rows[0]['bytes'], rows[0]['capacity'] * emb.get_row_bytes(2))
+        self.assertEqual(rows[0]['capacity'], 2 * distinct)
+        self.assertLess(rows[0]['p99_probes'], rows[1]['p99_probes'])
+        self.assertLess(rows[1]['overflow'], rows[2]['overflow'])
+
+        self.assertEqual(report.recommend(max_p99_probes=rows[1]['p99_probes'],
+                                          max_overflow=rows[1]['overflow'])['load_factor'], 0.75)
+        self.assertEqual(report.recommend(max_p99_probes=1000, max_overflow=1)['load_factor'], 0.95)
+        self.assertIsNone(report.recommend(max_p99_probes=0))
+        self.assertIn('0.75', str(report))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+
+class TestHotKeys(unittest.TestCase):
+
+    def test_analyze_hot_keys(self):
+        import os
+        import tempfile
+        import numpy as np
+        from hugectrpy.data import RecordLayout, BinaryWriter, write_file_list
+        from hugectrpy.layers import Dense, Label, Sparse, Data, DistributedSlotSparseEmbeddingHash
+        from hugectrpy.model import Model, Solver, AdamOptimizer
+        from hugectrpy.hotkeys import analyze_hot_keys
+
+        rng = np.random.default_rng(0)
+        layout = RecordLayout(label_dim=1, dense_dim=1, slot_num=2, nnz=1, check=True)
+        with tempfile.TemporaryDirectory() as directory:
+            # slot 0 draws from 50 keys, slot 1 from 100000
+            keys = np.stack([rng.integers(0, 50, (1000, 1)), rng.integers(1000, 101000, (1000, 1))], axis=1)
+            keys[:100, 1] = -1
+            path = os.path.join(directory, '0.bin')
+            with BinaryWriter(path, layout) as writer:
+                writer.write(np.zeros((1000, 1)), np.zeros((1000, 1)), keys)
+            file_list = os.path.join(directory, 'file_list.txt')
+            write_file_list(file_list, [path])
+
+            hot, cold = Sparse(name='hot', slot_num=1, max_feature_num_per_sample=1), \
+                Sparse(name='cold', slot_num=1, max_feature_num_per_sample=1)
+            data = Data(name='data', label=Label(name='label', dim=1), dense=Dense(name='dense', dim=1),
+                        sparse=[hot, cold], source=file_list)
+            hot_emb = DistributedSlotSparseEmbeddingHash(name='hot_emb', src_layers=hot, vocabulary_size=50,
+                                                         load_factor=0.5, embedding_vec_size=16, combiner=0)
+            cold_emb = DistributedSlotSparseEmbeddingHash(name='cold_emb', src_layers=cold,
+                                                          vocabulary_size=100000, load_factor=0.5,
+                                                          embedding_vec_size=16, combiner=0)
+            model = Model(Solver(batch_size=100), AdamOptimizer(), [data, hot_emb, cold_emb])
+
+            report = analyze_hot_keys(model)
+            self.assertEqual(len(report.touched['hot_emb']), 10)
+            expected = [len(np.unique(keys[i:i + 100, 0])) for i in range(0, 1000, 100)]
+            np.testing.assert_array_equal(report.touched['hot_emb'], expected)
+            self.assertEqual(report.touched['cold_emb'][0], 0)
+            self.assertAlmostEqual(report.working_set['hot_emb'][-1], 50, delta=1)
+            self.assertTrue(np.all(np.diff(report.working_set['cold_emb']) >= 0))
+
+            # Adam keeps two state tables, weights and states are read and written
+            row = 2 * 16 * 4 * 3
+            self.assertEqual(report.get_update_bytes(True), (100 + 200000) * row)
+            self.assertAlmostEqual(report.get_update_bytes(False),
+                                   (np.mean(expected) + np.mean(report.touched['cold_emb'])) * row)
+            self.assertFalse(report.recommend_global_update())
+            self.assertIn('hot_emb', str(report))
+
+            # with only the hot embedding, batches touch most of its table
+            model.layers.remove(cold_emb)
+            report = analyze_hot_keys(model, max_iterations=3)
+            self.assertEqual(len(report.touched['hot_emb']), 3)
+            model.optimizer.global_update = False
+            report.apply(threshold=0.3)
+            self.assertTrue(model.optimizer.global_update)
+
+            # batches span file ends, only the last one is short
+            paths = [os.path.join(directory, name) for name in ('1.bin', '2.bin')]
+            for path, rows in zip(paths, [slice(0, 330), slice(330, 950)]):
+                with BinaryWriter(path, layout) as writer:
+                    writer.write(np.zeros((len(keys[rows]), 1)), np.zeros((len(keys[rows]), 1)), keys[rows])
+            write_file_list(file_list, paths)
+            report = analyze_hot_keys(model)
+            expected = [len(np.unique(keys[i:min(i + 100, 950), 0])) for i in range(0, 950, 100)]
+            np.testing.assert_array_equal(report.touched['hot_emb'], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+
+class TestIOBench(unittest.TestCase):
+
+    def test_report(self):
+        from hugectrpy.iobench import IOReport
+
+        rows = [{'threads': t, 'chunk_size': 1 << 20, 'readahead': 0, 'mb_per_second': s / 1000,
+                 'samples_per_second': s} for t, s in [(1, 100), (2, 190), (4, 300), (8, 310)]]
+        rows += [{'threads': t, 'chunk_size': 1 << 20, 'readahead': 1 << 24, 'mb_per_second': s / 1000,
+                  'samples_per_second': s} for t, s in [(1, 250), (2, 260), (4, 400)]]
+        report = IOReport(rows, required=280)
+        self.assertEqual([r['threads'] for r in report.get_knees()], [4, 1])
+        recommendation = report.recommend()
+        self.assertEqual((recommendation['threads'], recommendation['readahead']), (4, 0))
+        self.assertTrue(recommendation['sufficient'])
+        self.assertEqual(IOReport(rows, required=1000).recommend()['sufficient'], False)
+        self.assertIn('BELOW', str(IOReport(rows, required=1000)))
+
+    def test_benchmark_input(self):
+        import os
+        import tempfile
+        import numpy as np
+        from hugectrpy.data import RecordLayout, BinaryWriter, write_file_list
+        from hugectrpy.iobench import benchmark_input
+        from hugectrpy.layers import Dense, Label, Sparse, Data
+        from hugectrpy.model import Model, Solver, AdamOptimizer
+
+        layout = RecordLayout(label_dim=1, dense_dim=3, slot_num=2, nnz=1, check=False)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i in range(3):
+                paths.append(os.path.join(directory, str(i) + '.bin'))
+                with BinaryWriter(paths[-1], layout) as writer:
+                    writer.write(np.zeros((500 * (i + 1), 1)), np.zeros((500 * (i + 1), 3)),
+                                 np.ones((500 * (i + 1), 2, 1)))
+            file_list = os.path.join(directory, 'file_list.txt')
+            write_file_list(file_list, paths)
+            data = Data(name='data', label=Label(name='label', dim=1), dense=Dense(name='dense', dim=3),
+                        sparse=Sparse(name='data1', slot_num=2, max_feature_num_per_sample=2), source=file_list,
+                        check=None)
+            model = Model(Solver(batch_size=1000, gpu=[[0, 1, 2], [3]]), AdamOptimizer(), [data])
+
+            report = benchmark_input(model, threads=(1, 3), chunk_sizes=(4096, 1 << 20), readaheads=(0, 1 << 16),
+                                     step_time=0.01)
+            self.assertEqual(len(report.rows), 8)
+            self.assertEqual(report.required, 1000 * 3 / 4 / 0.01)
+            total = sum(os.path.getsize(path) for path in paths)
+            for row in report.rows:
+                self.assertEqual(row['bytes'], total)
+                self.assertEqual(row['samples'], 3000)
+                self.assertGreater(row['samples_per_second'], 0)
+            self.assertIn(report.recommend()['threads'], (1, 3))
+            self.assertIn('recommended', str(report))
+
+
+if __name__ == '__main__':
+    unittest.main()
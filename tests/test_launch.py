@@ -0,0 +1,84 @@
+import unittest
+
+# prints a HugeCTR training log with the configuration given after --train
+FAKE_BINARY = '''
+import json
+import sys
+import time
+
+config = json.load(open(sys.argv[sys.argv.index('--train') + 1]))
+solver = config['solver']
+print("[20d10h05m01s][HUGECTR][INFO]: Initial Session is ready", flush=True)
+sys.stdout.buffer.write(b"[20d10h05m01s][HUGECTR][INFO]: Evaluation, AUC: \\xff\\n")
+for i in range(solver['display'], solver['max_iter'] + 1, solver['display']):
+    print("[20d10h05m02s][HUGECTR][INFO]: Iter: {} Time({} iters): {:.6f}s Loss: {:.6f} lr:0.001000".format(
+        i, solver['display'], 0.5 if i != 40 else 1.0, 1.0 / i), flush=True)
+    if i % solver['eval_interval'] == 0:
+        print("[20d10h05m03s][HUGECTR][INFO]: Evaluation, AUC: {:.6f}".format(0.7 + i / 1000), flush=True)
+        print("[20d10h05m03s][HUGECTR][INFO]: Eval Time for 5 iters: 0.010000s", flush=True)
+    if i % solver['snapshot'] == 0:
+        print("[20d10h05m04s][HUGECTR][INFO]: Rank0: Write hash table to file", flush=True)
+        print("[20d10h05m04s][HUGECTR][INFO]: Dumping dense weights to file, successful", flush=True)
+    time.sleep(0.01)
+sys.exit(3)
+'''
+
+
+class TestLaunch(unittest.TestCase):
+
+    def test_parse_line(self):
+        from hugectrpy.launch import parse_line
+
+        event = parse_line("[24d09h32m43s][HUGECTR][INFO]: Iter: 2000 Time(1000 iters): 2.500000s Loss: 0.135040 "
+                           "lr:0.001000", 512)
+        self.assertEqual(event, {'type': 'iteration', 'iteration': 2000, 'loss': 0.13504, 'lr': 0.001,
+                                 'seconds': 2.5, 'samples_per_second': 1000 * 512 / 2.5})
+        self.assertEqual(parse_line("Iter: 10 Time(10 iters): 1s Loss: nan", 2)['lr'], None)
+        self.assertEqual(parse_line("[..]: Evaluation, AUC: 0.780912", 1), {'type': 'eval', 'auc': 0.780912})
+        self.assertEqual(parse_line("[..]: Evaluation, AUC: 0.78,", 1), {'type': 'eval', 'auc': 0.78})
+        self.assertEqual(parse_line("Iter: 10 Time(10 iters): 1s Loss: 0.1, lr: 1e-3", 2)['lr'], 0.001)
+        self.assertEqual(parse_line("Iter: 10 Time(10 iters): 1s Loss: 0.1,", 2)['loss'], 0.1)
+        self.assertIsNone(parse_line("[..]: Evaluation, AUC: n/a", 1))
+        self.assertEqual(parse_line("[..]: Dumping sparse weights to files, successful", 1)['what'], 'sparse')
+        self.assertIsNone(parse_line("[..]: Initial Session is ready", 1))
+
+    def test_launch(self):
+        import os
+        import sys
+        import tempfile
+        from hugectrpy.model import Model, Solver, AdamOptimizer
+        from hugectrpy.layers import Dense, Label, Sparse, Data
+
+        sparse = Sparse(name='data1', slot_num=2, max_feature_num_per_sample=2)
+        data = Data(name='data', label=Label(name='label', dim=1), dense=Dense(name='dense', dim=3), sparse=sparse)
+        model = Model(Solver(display=10, max_iter=50, batch_size=100, eval_interval=20, snapshot=25),
+                      AdamOptimizer(), [data])
+
+        with tempfile.TemporaryDirectory() as directory:
+            binary = os.path.join(directory, 'fake_huge_ctr.py')
+            with open(binary, 'w') as fp:
+                fp.write(FAKE_BINARY)
+            job = model.launch([sys.executable, binary], cwd=directory)
+            self.assertTrue(os.path.exists(os.path.join(directory, 'config.json')))
+
+            losses = [(e['iteration'], e['loss']) for e in job.metrics(types=['iteration'], timeout=30)
+                      if e['type'] == 'iteration']
+            self.assertEqual(losses, [(i, round(1.0 / i, 6)) for i in range(10, 51, 10)])
+            self.assertEqual(job.wait(30), 3)
+            aucs = [(e['iteration'], e['auc']) for e in job if e['type'] == 'eval']
+            self.assertEqual(aucs, [(20, 0.72), (40, 0.74)])
+            self.assertEqual([e['type'] for e in job.events][-1], 'exit')
+            self.assertEqual([e['iteration'] for e in job.events if e['type'] == 'snapshot'], [50, 50])
+
+            summary = job.get_summary()
+            self.assertEqual(summary['samples_per_second'], 10 * 100 / 0.5)
+            self.assertEqual(summary['samples_per_second_p10'], 1400)
+            self.assertEqual(summary['best_auc'], 0.74)
+            self.assertEqual(summary['loss'], 1 / 50)
+            self.assertEqual(summary['snapshots'], 2)
+            self.assertEqual(summary['returncode'], 3)
+            self.assertIn('Initial Session is ready', job.lines[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+
+from helpers import build_criteo_model
+
+
+class TestLoader(unittest.TestCase):
+
+    def test_round_trip(self):
+        import io
+        from hugectrpy.model import Model, Solver, MomentumSGD, Nesterov
+        from hugectrpy.layers import Label, Slice, Top
+
+        model = build_criteo_model()
+        text = str(model)
+        loaded = Model.from_json(io.StringIO(text))
+        self.assertEqual(str(loaded), text)
+        self.assertIsInstance(loaded.layers[-1].get_src_layers()[1], Label)
+        self.assertIsInstance(loaded.layers[5].get_src_layers(), Top)
+        self.assertIsInstance(loaded.layers[4], Slice)
+        self.assertEqual(loaded.validate(), model.validate())
+
+        for optimizer in [MomentumSGD(global_update=True, lr=0.1, momentum=0.9), Nesterov(momentum=0.5)]:
+            text = str(Model(Solver(batch_size=2048), optimizer))
+            self.assertEqual(str(Model.from_json(io.StringIO(text))), text)
+
+    def test_from_path(self):
+        import os
+        import tempfile
+        from hugectrpy.model import Model
+
+        model = build_criteo_model()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'config.json')
+            with open(path, 'w') as fp:
+                model.dump(fp)
+            self.assertEqual(str(Model.from_json(path)), str(model))
+
+    def test_lazy_layers(self):
+        import io
+        import json
+        from hugectrpy.model import Model, Solver, MomentumSGD
+        from hugectrpy.layers import Dense, Label, Sparse, Data, FullyConnected
+
+        data = Data(name='data', label=Label(name='label', dim=1), dense=Dense(name='dense', dim=13),
+                    sparse=Sparse(name='data1', slot_num=26))
+        model = Model(Solver(), MomentumSGD(), [data])
+        last = data.dense
+        for i in range(10000):
+            last = FullyConnected(name='fc' + str(i), src_layers=last, n=16)
+            model.add_layer(last)
+
+        loaded = Model.from_json(io.StringIO(str(model)))
+        self.assertEqual(loaded.get_layer_count(), 10001)
+        self.assertEqual(loaded.layers.get_built_count(), 0)
+        self.assertEqual(loaded.layers[3].get_name(), 'fc2')
+        self.assertEqual(loaded.layers.get_built_count(), 4)
+
+        # a deep chain is built without recursion
+        self.assertEqual(loaded.layers[-1].get_src_layers().get_name(), 'fc9998')
+        self.assertEqual(str(loaded), str(model))
+
+        # layers set or inserted before the layers using them are built are found by their top names
+        loaded = Model.from_json(io.StringIO(str(model)))
+        loaded.layers[5001] = FullyConnected(name='fc5000', src_layers=data.dense, n=8)
+        self.assertEqual(loaded.layers[5002].get_src_layers().n, 8)
+        config = json.loads(str(model))
+        config['layers'][1]['bottom'] = 'extra'
+        loaded = Model.from_json(io.StringIO(json.dumps(config)))
+        loaded.layers.insert(1, FullyConnected(name='extra', src_layers=data.dense, n=4))
+        self.assertEqual(loaded.layers[2].get_src_layers().get_name(), 'extra')
+
+    def test_config_keys(self):
+        import io
+        import json
+        from hugectrpy.model import Model
+
+        config = json.loads(str(build_criteo_model()))
+        config['solver']['max_eval_batches'] = 100
+        sparse = config['layers'][0]['sparse']['sparse'][0]
+        sparse['max_feature_num_per_sample'] = sparse.pop('max_faeture_num_per_sample')
+        model = Model.from_json(io.StringIO(json.dumps(config)))
+        self.assertEqual(model.layers[0].sparse[0].max_feature_num_per_sample, 2)
+        self.assertFalse(hasattr(model.solver, 'max_eval_batches'))
+
+    def test_errors(self):
+        import io
+        import json
+        from hugectrpy.model import Model, Solver, MomentumSGD
+        from hugectrpy.layers import FullyConnected
+
+        fc1 = FullyConnected(name='fc1', src_layers=None)
+        fc2 = FullyConnected(name='fc2', src_layers=fc1)
+        fc1.src_layers = fc2
+        text = str(Model(Solver(), MomentumSGD(), [fc1, fc2]))
+        with self.assertRaises(ValueError):
+            Model.from_json(io.StringIO(text)).layers[0]
+
+        config = json.loads(text)
+        config['layers'][0]['bottom'] = 'missing'
+        with self.assertRaises(ValueError):
+            Model.from_json(io.StringIO(json.dumps(config))).layers[0]
+
+        config['layers'][0]['type'] = 'Unknown'
+        with self.assertRaises(ValueError):
+            Model.from_json(io.StringIO(json.dumps(config)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -63,9 +63,378 @@ class TestModel(unittest.TestCase):
         loss = BinaryCrossEntropyLoss(name='loss', src_layers=[fc4, label])
 
         model.add_layer_re(loss)
+        self.assertEqual([l.get_name() for l in model.layers],
+                         ['data', 'sparse_embedding1', 'reshape1', 'fc1', 'relu1', 'fc2', 'relu2', 'fc3', 'relu3',
+                          'fc4', 'loss'])
 
         print(model)
 
+    def test_add_layer_re(self):
+        from hugectrpy.model import Solver, MomentumSGD, Model
+        from hugectrpy.layers import Dropout, ELU, FullyConnected, Concat
+        d = Dropout(name='dropout1', src_layers=None)
+        e = ELU(name="elu1", src_layers=d)
+        f = FullyConnected(name='fc1', src_layers=e, n=512)
+        c = Concat(name="concat", src_layers=[e, f])
+        model = Model(Solver(), MomentumSGD())
+        model.add_layer_re(c)
+        self.assertEqual([l.get_name() for l in model.layers], ['dropout1', 'elu1', 'fc1', 'concat'])
+
+        # adding again does not duplicate layers
+        model.add_layer_re(c)
+        self.assertEqual(model.get_layer_count(), 4)
+
+        f.src_layers = c
+        with self.assertRaises(ValueError):
+            Model(Solver(), MomentumSGD()).add_layer_re(c)
+        f.src_layers = e
+
+        other = FullyConnected(name='fc1', src_layers=e)
+        with self.assertRaises(ValueError):
+            Model(Solver(), MomentumSGD()).add_layer_re(Concat(name='concat', src_layers=[f, other]))
+
+    def test_plan_memory(self):
+        from hugectrpy.model import Solver, AdamOptimizer, MomentumSGD, Model
+        from hugectrpy.layers import Sparse, DistributedSlotSparseEmbeddingHash, LocalizedSlotSparseEmbeddingHash
+        sparse = Sparse(name='data1', slot_num=1)
+        emb = DistributedSlotSparseEmbeddingHash(name='sparse_embedding1', src_layers=sparse, vocabulary_size=1000,
+                                                 load_factor=0.5, embedding_vec_size=16, combiner=0)
+
+        # 2000 rows of 8 bytes key + 3 x 16 floats sharded across 3 GPUs on two nodes
+        model = Model(Solver(gpu=[[0, 1], [0]]), AdamOptimizer(), [emb])
+        plan = model.plan_memory()
+        self.assertEqual(plan, {(0, 0): 667 * 200, (0, 1): 667 * 200, (1, 0): 666 * 200})
+
+        # half precision with a single momentum table
+        model = Model(Solver(gpu=[0, 1], mixed_precision=1024), MomentumSGD(), [emb])
+        self.assertEqual(model.plan_memory(), {(0, 0): 1000 * 72, (0, 1): 1000 * 72})
+
+        with self.assertRaises(ValueError):
+            model.plan_memory(device_memory=1000 * 72 - 1)
+        model.plan_memory(device_memory={(0, 0): 1000 * 72})
+
+        # localized slots are stored whole, slots 0 and 2 on the first GPU
+        sparse = Sparse(name='data2', slot_num=3, type='LocalizedSlot')
+        localized = LocalizedSlotSparseEmbeddingHash(name='sparse_embedding2', src_layers=sparse,
+                                                     vocabulary_size=1000, load_factor=0.5, embedding_vec_size=16,
+                                                     combiner=0)
+        model = Model(Solver(gpu=[0, 1], mixed_precision=1024), MomentumSGD(), [localized])
+        self.assertEqual(model.plan_memory(), {(0, 0): 1333 * 72, (0, 1): 667 * 72})
+        self.assertEqual(model.plan_memory(slot_weights={'sparse_embedding2': [1, 2, 1]}),
+                         {(0, 0): 1000 * 72, (0, 1): 1000 * 72})
+        self.assertRaises(ValueError, model.plan_memory, slot_weights={'sparse_embedding2': [1, 2]})
+
+    def test_estimate_cost(self):
+        from hugectrpy.model import Solver, AdamOptimizer, Model
+        from hugectrpy.layers import Dense, Label, Sparse, Data, DistributedSlotSparseEmbeddingHash, \
+            Reshape, FullyConnected, RELU, BinaryCrossEntropyLoss
+
+        label = Label(name='label', dim=1)
+        sparse = Sparse(name='data1', max_feature_num_per_sample=2, slot_num=26)
+        data = Data(name='data', label=label, dense=Dense(name='dense', dim=13), sparse=sparse)
+        emb = DistributedSlotSparseEmbeddingHash(name='sparse_embedding1', src_layers=sparse, vocabulary_size=1000,
+                                                 load_factor=0.75, embedding_vec_size=16, combiner=0)
+        re1 = Reshape(name='reshape1', src_layers=emb, leading_dim=416)
+        fc1 = FullyConnected(name='fc1', src_layers=re1, n=200)
+        relu1 = RELU(name='relu1', src_layers=fc1)
+        fc2 = FullyConnected(name='fc2', src_layers=relu1, n=1)
+        loss = BinaryCrossEntropyLoss(name='loss', src_layers=[fc2, label])
+        model = Model(Solver(batch_size=1024, gpu=[0, 1]), AdamOptimizer(),
+                      [data, emb, re1, fc1, relu1, fc2, loss])
+
+        shapes = [output_shapes for _, _, output_shapes in model.infer_shapes()]
+        self.assertEqual(shapes[1], [(26, 16)])
+        self.assertEqual(shapes[2], [(416,)])
+        self.assertEqual(shapes[5], [(1,)])
+
+        cost = model.estimate_cost(peak_flops=1e12, memory_bandwidth=1e11)
+        fc1_cost = cost['layers'][3]
+        self.assertEqual(fc1_cost['name'], 'fc1')
+        self.assertEqual(fc1_cost['forward_flops'], 2 * 512 * 416 * 200 + 512 * 200)
+        self.assertEqual(cost['flops'], sum(c['forward_flops'] + c['backward_flops'] for c in cost['layers']))
+        self.assertGreater(cost['step_time'], 0)
+
+        # half precision halves the bytes moved
+        model.solver.mixed_precision = 1024
+        relu1_cost = cost['layers'][4]
+        self.assertEqual(model.estimate_cost()['layers'][4]['forward_bytes'], relu1_cost['forward_bytes'] // 2)
+
+    def test_serialization_cache(self):
+        import json
+        from hugectrpy.model import Solver, MomentumSGD, Model
+        from hugectrpy.layers import Dense, Label, Sparse, Data, FullyConnected, RELU
+
+        def rebuild(model):
+            return json.dumps({'solver': model.solver.get_parameters(),
+                               'optimizer': model.optimizer.get_parameters(),
+                               'layers': [l.get_parameters() for l in model.layers]})
+
+        label = Label(name='label', dim=1)
+        data = Data(name='data', label=label, dense=Dense(name='dense', dim=13),
+                    sparse=Sparse(name='data1', slot_num=26))
+        fc1 = FullyConnected(name='fc1', src_layers=data.dense, n=200)
+        relu1 = RELU(name='relu1', src_layers=fc1)
+        model = Model(Solver(), MomentumSGD(), [data, fc1, relu1])
+        self.assertEqual(str(model), rebuild(model))
+
+        fc1.n = 100
+        model.solver.gpu.append(1)
+        model.optimizer.lr = 0.1
+        label.dim = 2
+        self.assertEqual(str(model), rebuild(model))
+
+        # renaming a source changes the bottom of its consumers
+        fc1.name = 'fc_renamed'
+        self.assertEqual(relu1.get_cached_parameters()['bottom'], 'fc_renamed')
+        self.assertEqual(str(model), rebuild(model))
+
+    def test_dump(self):
+        import io
+        import json
+        from hugectrpy.model import Solver, AdamOptimizer, Model
+        from hugectrpy.layers import Dense, Label, Sparse, Data, FullyConnected, Slice
+
+        data = Data(name='data', label=Label(name='label', dim=1), dense=Dense(name='dense', dim=13),
+                    sparse=Sparse(name='data1', slot_num=26))
+        fc1 = FullyConnected(name='fc1', src_layers=data.dense, n=200)
+        slice1 = Slice(name='slice1', src_layers=fc1, ranges=[[0, 200]])
+        model = Model(Solver(), AdamOptimizer(), [data, fc1, slice1])
+
+        fp = io.StringIO()
+        model.dump(fp)
+        self.assertEqual(fp.getvalue(), json.dumps(model.get_parameters()))
+        self.assertEqual(''.join(model.iter_json_chunks(cache=False)), fp.getvalue())
+        self.assertEqual(str(model), fp.getvalue())
+
+        # nothing was cached while dumping
+        model = Model(Solver(), AdamOptimizer(), [fc1])
+        fc1.invalidate()
+        model.dump(io.StringIO())
+        self.assertIsNone(fc1._cache)
+
+    def test_validate(self):
+        from hugectrpy.model import Solver, AdamOptimizer, Model
+        from hugectrpy.layers import Dense, Label, Sparse, Data, DistributedSlotSparseEmbeddingHash, \
+            Reshape, FullyConnected, Concat, Slice, BinaryCrossEntropyLoss
+
+        label = Label(name='label', dim=1)
+        sparse = Sparse(name='data1', max_feature_num_per_sample=2, slot_num=26)
+        data = Data(name='data', label=label, dense=Dense(name='dense', dim=13), sparse=sparse)
+        emb = DistributedSlotSparseEmbeddingHash(name='sparse_embedding1', src_layers=sparse, vocabulary_size=1000,
+                                                 load_factor=0.75, embedding_vec_size=16, combiner=0)
+        re1 = Reshape(name='reshape1', src_layers=emb, leading_dim=416)
+        concat1 = Concat(name='concat1', src_layers=[re1, data.dense])
+        slice1 = Slice(name='slice1', src_layers=concat1, ranges=[[0, 400], [400, 429]])
+        fc1 = FullyConnected(name='fc1', src_layers=slice1.get_top(1), n=1)
+        loss = BinaryCrossEntropyLoss(name='loss', src_layers=[fc1, label])
+        model = Model(Solver(gpu=[0, 1]), AdamOptimizer(), [data])
+        model.add_layer_re(loss)
+
+        shapes = model.validate()
+        self.assertEqual(shapes['concat1'], (429,))
+        self.assertEqual(shapes['slice1_0'], (400,))
+        self.assertEqual(shapes['slice1_1'], (29,))
+        self.assertEqual(shapes['loss'], ())
+
+        # every problem is reported at once, consumers of broken layers are not reported again
+        re1.leading_dim = 100
+        slice1.ranges = [[0, 400], [400, 430]]
+        model.solver.batch_size = 511
+        missing = FullyConnected(name='fc2', src_layers=FullyConnected(name='unknown', src_layers=None))
+        model.add_layer(missing)
+        with self.assertRaises(ValueError) as context:
+            model.validate()
+        message = str(context.exception)
+        self.assertIn('leading_dim 100 does not divide input width 416', message)
+        self.assertIn('bottom unknown is not produced by any layer', message)
+        self.assertIn('batch_size 511', message)
+        self.assertNotIn('slice1', message)
+
+    def test_optimize(self):
+        import io
+        import numpy as np
+        from hugectrpy.model import Solver, AdamOptimizer, Model
+        from hugectrpy.layers import Dense, Label, Sparse, Data, DistributedSlotSparseEmbeddingHash, \
+            Reshape, FullyConnected, FusedFullyConnected, RELU, Dropout, Concat, BinaryCrossEntropyLoss
+        from hugectrpy.reference import ReferenceExecutor
+
+        label = Label(name='label', dim=1)
+        sparse = Sparse(name='data1', max_feature_num_per_sample=2, slot_num=3)
+        data = Data(name='data', label=label, dense=Dense(name='dense', dim=4), sparse=sparse)
+        emb = DistributedSlotSparseEmbeddingHash(name='sparse_embedding1', src_layers=sparse, vocabulary_size=50,
+                                                 load_factor=0.75, embedding_vec_size=4, combiner=0)
+        re1 = Reshape(name='reshape1', src_layers=emb, leading_dim=12)
+        re2 = Reshape(name='reshape2', src_layers=re1, leading_dim=12)
+        concat1 = Concat(name='concat1', src_layers=[re2, data.dense])
+        fc1 = FullyConnected(name='fc1', src_layers=concat1, n=8)
+        relu1 = RELU(name='relu1', src_layers=fc1)
+        dropout1 = Dropout(name='dropout1', src_layers=relu1, rate=0.0)
+        concat2 = Concat(name='concat2', src_layers=[dropout1, data.dense])
+        concat3 = Concat(name='concat3', src_layers=[concat2, re1])
+        fc2 = FullyConnected(name='fc2', src_layers=concat3, n=1)
+        dead = FullyConnected(name='dead', src_layers=concat1, n=3)
+        loss = BinaryCrossEntropyLoss(name='loss', src_layers=[fc2, label])
+        model = Model(Solver(batch_size=16, mixed_precision=1024), AdamOptimizer(), [data])
+        model.add_layer_re(loss)
+        model.layers.insert(5, dead)
+
+        rng = np.random.default_rng(0)
+        batch = {'label': np.ones((16, 1), np.float32), 'dense': rng.normal(size=(16, 4)).astype(np.float32),
+                 'data1': rng.integers(0, 50, (16, 3, 2))}
+        before = ReferenceExecutor(model)
+        expected = before.predict(batch)
+
+        report = model.optimize()
+        self.assertEqual(len(report), 5)
+        self.assertTrue(any('reshape2' in line for line in report))
+        self.assertTrue(any('dropout1' in line for line in report))
+        self.assertTrue(any('fused fc1 and relu1' in line for line in report))
+        self.assertTrue(any('merged concat2 into concat3' in line for line in report))
+        self.assertTrue(any('dead' in line for line in report))
+        self.assertEqual([layer.get_name() for layer in model.layers],
+                         ['data', 'sparse_embedding1', 'reshape1', 'concat1', 'relu1', 'concat3', 'fc2', 'loss'])
+        fused = model.layers[4]
+        self.assertIsInstance(fused, FusedFullyConnected)
+        self.assertEqual(fused.get_bottom_names(), ['concat1'])
+        self.assertEqual(model.layers[3].get_bottom_names(), ['reshape1', 'dense'])
+        self.assertEqual(model.layers[5].get_bottom_names(), ['relu1', 'dense', 'reshape1'])
+        self.assertEqual(model.validate()['concat3'], (24,))
+        self.assertIn('"FusedInnerProduct"', str(model))
+        self.assertEqual(str(Model.from_json(io.StringIO(str(model)))), str(model))
+        self.assertEqual(model.optimize(), [])
+        # the layers of the caller are untouched
+        self.assertEqual(concat3.get_bottom_names(), ['concat2', 'reshape1'])
+        self.assertIs(relu1.get_src_layers(), fc1)
+        self.assertIs(fc2.get_src_layers(), concat3)
+        self.assertNotIn(id(fc2), [id(layer) for layer in model.layers])
+
+        # same parameters, same predictions
+        after = ReferenceExecutor(model)
+        after.get_kernel('sparse_embedding1').params.update(before.get_kernel('sparse_embedding1').params)
+        after.get_kernel('relu1').params.update(before.get_kernel('fc1').params)
+        after.get_kernel('fc2').params.update(before.get_kernel('fc2').params)
+        np.testing.assert_allclose(after.predict(batch), expected, rtol=1e-5)
+
+        # without mixed precision FullyConnected and RELU stay apart
+        model = Model(Solver(), AdamOptimizer(), [data])
+        model.add_layer_re(BinaryCrossEntropyLoss(name='loss', src_layers=[
+            FullyConnected(name='fc', src_layers=RELU(name='relu', src_layers=FullyConnected(
+                name='fc0', src_layers=data.dense, n=4)), n=1), label]))
+        self.assertEqual(model.optimize(), [])
+
+    def test_alignment(self):
+        from hugectrpy.model import Solver, AdamOptimizer, Model
+        from hugectrpy.layers import Dense, Label, Sparse, Data, DistributedSlotSparseEmbeddingHash, \
+            Reshape, FullyConnected, Concat, Slice, RELU, Dropout, BinaryCrossEntropyLoss
+
+        label = Label(name='label', dim=1)
+        sparse = Sparse(name='data1', max_feature_num_per_sample=2, slot_num=26)
+        data = Data(name='data', label=label, dense=Dense(name='dense', dim=13), sparse=sparse)
+        emb = DistributedSlotSparseEmbeddingHash(name='sparse_embedding1', src_layers=sparse, vocabulary_size=1000,
+                                                 load_factor=0.75, embedding_vec_size=10, combiner=0)
+        re1 = Reshape(name='reshape1', src_layers=emb, leading_dim=260)
+        re2 = Reshape(name='reshape2', src_layers=emb, leading_dim=10)
+        fc0 = FullyConnected(name='fc0', src_layers=re2, n=3)
+        re3 = Reshape(name='reshape3', src_layers=fc0, leading_dim=78)
+        concat1 = Concat(name='concat1', src_layers=[re1, data.dense, re3])
+        fc1 = FullyConnected(name='fc1', src_layers=concat1, n=100)
+        slice1 = Slice(name='slice1', src_layers=fc1, ranges=[[0, 50], [50, 100]])
+        fc2 = FullyConnected(name='fc2', src_layers=slice1.get_top(1), n=1)
+        loss = BinaryCrossEntropyLoss(name='loss', src_layers=[fc2, label])
+        model = Model(Solver(mixed_precision=1024), AdamOptimizer(), [data])
+        model.add_layer_re(loss)
+
+        findings = {(f['layer'], f['parameter']): f for f in model.check_alignment()}
+        self.assertEqual(findings[('sparse_embedding1', 'embedding_vec_size')]['aligned'], 16)
+        self.assertAlmostEqual(findings[('sparse_embedding1', 'embedding_vec_size')]['efficiency'], 10 / 16)
+        self.assertEqual(findings[('concat1', 'width')]['value'], 260 + 13 + 78)
+        self.assertAlmostEqual(findings[('fc1', 'input width')]['efficiency'], 351 / 352 * 100 / 104)
+        self.assertIn(('fc1', 'n'), findings)
+        self.assertIn(('reshape2', 'leading_dim'), findings)
+        self.assertEqual(findings[('reshape1', 'leading_dim')]['aligned'], 264)
+
+        report = model.pad_alignment()
+        self.assertEqual(len(report), 6)
+        self.assertEqual((emb.embedding_vec_size, fc0.n, fc1.n, fc2.n), (16, 8, 104, 1))
+        self.assertEqual((re1.leading_dim, re2.leading_dim, re3.leading_dim), (416, 16, 208))
+        shapes = model.validate()
+        self.assertEqual(shapes['concat1'], (416 + 13 + 208,))
+        remaining = {(f['layer'], f['parameter']) for f in model.check_alignment()}
+        # the dense width and slice ranges are not padded and the loss input keeps its width
+        self.assertEqual(remaining, {('concat1', 'width'), ('fc1', 'input width'), ('fc2', 'input width'),
+                                     ('fc2', 'n')})
+        self.assertEqual(model.pad_alignment(), [])
+
+        # padding fc3 would move the columns of fc4 that slice2 selects, fc4 comes last and is padded at the end
+        fc3 = FullyConnected(name='fc3', src_layers=data.dense, n=3)
+        fc4 = FullyConnected(name='fc4', src_layers=data.dense, n=5)
+        slice2 = Slice(name='slice2', src_layers=Concat(name='concat2', src_layers=[fc3, fc4]),
+                       ranges=[[0, 3], [3, 8]])
+        fc5 = FullyConnected(name='fc5', src_layers=slice2.get_top(1), n=1)
+        model = Model(Solver(), AdamOptimizer(), [data])
+        model.add_layer_re(BinaryCrossEntropyLoss(name='loss', src_layers=[fc5, label]))
+        self.assertEqual(model.pad_alignment(), ['fc4: n 5 -> 8'])
+        self.assertEqual((fc3.n, fc4.n, slice2.ranges), (3, 8, [[0, 3], [3, 8]]))
+
+        # a width the Reshape cannot split keeps its producer, the other layers are still padded
+        fc6 = FullyConnected(name='fc6', src_layers=data.dense, n=6)
+        reshape = Reshape(name='reshape4', src_layers=fc6, leading_dim=2)
+        fc7 = FullyConnected(name='fc7', src_layers=Reshape(name='reshape5', src_layers=FullyConnected(
+            name='fc8', src_layers=reshape, n=3), leading_dim=9), n=1)
+        model = Model(Solver(), AdamOptimizer(), [data])
+        model.add_layer_re(BinaryCrossEntropyLoss(name='loss', src_layers=[fc7, label]))
+        self.assertEqual(model.pad_alignment(), ['fc8: n 3 -> 8', 'reshape5: leading_dim 9 -> 24'])
+        self.assertEqual((fc6.n, reshape.leading_dim), (6, 2))
+
+        # the predictions keep their width through activations and dropout
+        fc9 = FullyConnected(name='fc9', src_layers=data.dense, n=100)
+        fc10 = FullyConnected(name='fc10', src_layers=fc9, n=1)
+        model = Model(Solver(), AdamOptimizer(), [data])
+        model.add_layer_re(BinaryCrossEntropyLoss(name='loss', src_layers=[
+            Dropout(name='dropout', src_layers=RELU(name='relu', src_layers=fc10), rate=0.5), label]))
+        self.assertEqual(model.pad_alignment(), ['fc9: n 100 -> 104'])
+        self.assertEqual(fc10.n, 1)
+
+    def test_scale_to(self):
+        import io
+        from hugectrpy.model import Solver, AdamOptimizer, MomentumSGD, Model
+
+        solver = Solver(gpu=[0], batch_size=1024, max_iter=80000, eval_interval=1000, eval_batches=100,
+                        snapshot=10000)
+        adam = AdamOptimizer(lr=0.001, alpha=0.002)
+        plan = solver.scale_to([[0, 1, 2, 3], [4, 5, 6, 7]], optimizer=adam)
+        scaled = plan.scaled_solver
+        self.assertEqual(plan.scale, 8)
+        self.assertEqual((scaled.batch_size, scaled.max_iter, scaled.eval_interval, scaled.eval_batches,
+                          scaled.snapshot), (8192, 10000, 125, 13, 1250))
+        self.assertEqual(scaled.warmup_steps, 100)
+        self.assertAlmostEqual(plan.scaled_optimizer.lr, 0.008)
+        self.assertAlmostEqual(plan.scaled_optimizer.alpha, 0.016)
+        # the originals are untouched
+        self.assertEqual((solver.gpu, solver.batch_size, solver.warmup_steps, adam.lr), ([0], 1024, None, 0.001))
+        self.assertNotIn('warmup_steps', str(Model(solver, adam)))
+
+        text = str(plan)
+        self.assertIn('batch_size', text)
+        self.assertIn('8192', text)
+
+        model = Model(solver, adam)
+        plan.apply(model)
+        self.assertIn('"warmup_steps": 100', str(model))
+        self.assertEqual(Model.from_json(io.StringIO(str(model))).solver.warmup_steps, 100)
+
+        plan = solver.scale_to(list(range(4)), optimizer=MomentumSGD(lr=0.1), lr_rule='sqrt', eval_overhead=0.01,
+                               snapshot_overhead=0.01, step_time=0.01, snapshot_time=30)
+        self.assertAlmostEqual(plan.scaled_optimizer.lr, 0.2)
+        # 25 eval batches at a third of a step every 834 iterations
+        self.assertEqual(plan.scaled_solver.eval_interval, 834)
+        self.assertEqual(plan.scaled_solver.snapshot, 300000)
+
+        # scaling down keeps the warmup in samples
+        plan = plan.scaled_solver.scale_to([0, 1])
+        self.assertEqual((plan.scaled_solver.batch_size, plan.scaled_solver.warmup_steps), (2048, 400))
+        self.assertRaises(ValueError, solver.scale_to, [0, 1], lr_rule='cubic')
+
 
 if __name__ == '__main__':
     unittest.main()
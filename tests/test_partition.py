@@ -0,0 +1,61 @@
+import unittest
+
+
+class TestPartition(unittest.TestCase):
+
+    def test_pack_files(self):
+        import numpy as np
+        from hugectrpy.partition import pack_files
+
+        weights = np.random.default_rng(0).lognormal(10, 1, 200).astype(np.int64)
+        for seed in (None, 1, 2):
+            assignment = pack_files(weights, 7, seed)
+            loads = np.bincount(assignment, weights, 7)
+            self.assertLess(loads.max() / loads.mean(), 1.01)
+        self.assertFalse(np.array_equal(pack_files(weights, 7, 1), pack_files(weights, 7, 2)))
+        np.testing.assert_array_equal(pack_files(weights, 7, 1), pack_files(weights, 7, 1))
+
+        # LPT alone puts 3 + 2 + 2 and 3 + 2 on two parts, a swap balances them
+        np.testing.assert_array_equal(np.bincount(pack_files([3, 3, 2, 2, 2], 2), [3, 3, 2, 2, 2]), [6, 6])
+        self.assertEqual(len(set(pack_files([5], 3))), 1)
+        self.assertRaises(ValueError, pack_files, [1], 0)
+
+    def test_partition_files(self):
+        import os
+        import tempfile
+        import numpy as np
+        from hugectrpy.data import RecordLayout, BinaryWriter, read_file_list, write_file_list
+        from hugectrpy.layers import Dense, Label, Sparse, Data
+        from hugectrpy.partition import get_file_weights, partition_files
+
+        layout = RecordLayout(label_dim=1, dense_dim=1, slot_num=1, nnz=1, check=False)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for i, count in enumerate([40, 10, 30, 20, 25, 15, 5, 35]):
+                paths.append(os.path.join(directory, str(i) + '.bin'))
+                with BinaryWriter(paths[-1], layout) as writer:
+                    writer.write(np.zeros((count, 1)), np.zeros((count, 1)), np.zeros((count, 1, 1)))
+            file_list = os.path.join(directory, 'file_list.txt')
+            write_file_list(file_list, paths)
+            data = Data(name='data', label=Label(name='label', dim=1), dense=Dense(name='dense', dim=1),
+                        sparse=Sparse(name='data1', slot_num=1, max_feature_num_per_sample=1), source=file_list,
+                        check=None)
+            np.testing.assert_array_equal(get_file_weights(paths[:2], by='records'), [40, 10])
+            self.assertRaises(ValueError, get_file_weights, paths, 'lines')
+
+            plan = partition_files(data, 3, by='records')
+            self.assertEqual(plan.get_loads().sum(), 180)
+            self.assertLessEqual(plan.get_imbalance(), 65 / 60)
+            self.assertIn('imbalance', str(plan))
+
+            written = plan.write(os.path.join(directory, 'parts'))
+            listed = [read_file_list(path) for path in written]
+            self.assertEqual(sorted(sum(listed, [])), sorted(paths))
+
+            shuffled = partition_files(data, 3, by='size', seed=4)
+            self.assertLess(shuffled.get_imbalance(), 1.05)
+            self.assertEqual(sorted(sum(shuffled.get_file_lists(), [])), sorted(paths))
+
+
+if __name__ == '__main__':
+    unittest.main()
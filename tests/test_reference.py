@@ -0,0 +1,94 @@
+import unittest
+
+
+def build_model(optimizer, combiner=0):
+    from hugectrpy.model import Solver, Model
+    from hugectrpy.layers import Dense, Label, Sparse, Data, DistributedSlotSparseEmbeddingHash, \
+        Reshape, FullyConnected, RELU, ELU, Dropout, Concat, Slice, BinaryCrossEntropyLoss
+
+    label = Label(name='label', dim=1)
+    sparse = Sparse(name='data1', max_feature_num_per_sample=2, slot_num=3)
+    data = Data(name='data', label=label, dense=Dense(name='dense', dim=4), sparse=sparse)
+    emb = DistributedSlotSparseEmbeddingHash(name='sparse_embedding1', src_layers=sparse, vocabulary_size=50,
+                                             load_factor=0.75, embedding_vec_size=4, combiner=combiner)
+    re1 = Reshape(name='reshape1', src_layers=emb, leading_dim=12)
+    concat1 = Concat(name='concat1', src_layers=[re1, data.dense])
+    slice1 = Slice(name='slice1', src_layers=concat1, ranges=[[0, 12], [4, 16]])
+    fc1 = FullyConnected(name='fc1', src_layers=slice1.get_top(0), n=8)
+    elu1 = ELU(name='elu1', src_layers=fc1)
+    fc2 = FullyConnected(name='fc2', src_layers=slice1.get_top(1), n=8)
+    relu2 = RELU(name='relu2', src_layers=fc2)
+    dropout2 = Dropout(name='dropout2', src_layers=relu2, rate=0.1)
+    concat2 = Concat(name='concat2', src_layers=[elu1, dropout2])
+    fc3 = FullyConnected(name='fc3', src_layers=concat2, n=1)
+    loss = BinaryCrossEntropyLoss(name='loss', src_layers=[fc3, label])
+    model = Model(Solver(batch_size=64), optimizer, [data])
+    model.add_layer_re(loss)
+    return model
+
+
+def make_batch(rng, batch_size):
+    import numpy as np
+    keys = rng.integers(0, 20, (batch_size, 3, 2))
+    keys[:, :, 1][rng.random((batch_size, 3)) < 0.5] = -1
+    dense = rng.normal(size=(batch_size, 4)).astype(np.float32)
+    # the label depends on the first key and the dense features
+    label = ((keys[:, 0, 0] % 2 == 0) + dense[:, 0] > 0.5).astype(np.float32)[:, None]
+    return {'label': label, 'dense': dense, 'data1': keys}
+
+
+class TestReference(unittest.TestCase):
+
+    def test_gradients(self):
+        import numpy as np
+        from hugectrpy.model import MomentumSGD
+        from hugectrpy.reference import ReferenceExecutor
+
+        for combiner in [0, 1]:
+            model = build_model(MomentumSGD(), combiner)
+            for layer in model.layers:
+                if layer.get_name() == 'dropout2':
+                    layer.rate = 0
+            executor = ReferenceExecutor(model)
+            batch = make_batch(np.random.default_rng(1), 16)
+            executor.backward(executor.forward(batch, training=True))
+
+            for name, param in [('fc1', 'weight'), ('fc2', 'bias'), ('sparse_embedding1', 'table')]:
+                kernel = executor.get_kernel(name)
+                grad = kernel.grads[param]
+                values = kernel.params[param]
+                if isinstance(grad, tuple):
+                    rows, grad_rows = grad
+                    index, expected = (rows[0], 1), grad_rows[0, 1]
+                else:
+                    index = (0,) * values.ndim
+                    expected = grad[index]
+                original = values[index]
+                values[index] = original + 1e-2
+                plus = executor.evaluate(batch)
+                values[index] = original - 1e-2
+                minus = executor.evaluate(batch)
+                values[index] = original
+                self.assertAlmostEqual((plus - minus) / 2e-2, expected, places=3)
+
+    def test_training(self):
+        import numpy as np
+        from hugectrpy.model import AdamOptimizer, MomentumSGD, Nesterov
+        from hugectrpy.reference import ReferenceExecutor
+
+        for optimizer in [AdamOptimizer(alpha=0.01), AdamOptimizer(gloabl_update=True, alpha=0.01),
+                          MomentumSGD(lr=0.1, momentum=0.9), Nesterov(lr=0.1, momentum=0.9)]:
+            executor = ReferenceExecutor(build_model(optimizer))
+            rng = np.random.default_rng(0)
+            test = make_batch(rng, 256)
+            before = executor.evaluate(test)
+            for _ in range(200):
+                executor.train_step(make_batch(rng, 64))
+            self.assertLess(executor.evaluate(test), before * 0.8)
+            predictions = executor.predict(test)
+            self.assertEqual(predictions.shape, (256, 1))
+            self.assertTrue(np.all((predictions >= 0) & (predictions <= 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
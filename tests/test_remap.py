@@ -0,0 +1,94 @@
+import unittest
+
+
+class TestRemap(unittest.TestCase):
+
+    def test_dictionary(self):
+        import os
+        import tempfile
+        import numpy as np
+        from hugectrpy.remap import KeyCounts, KeyDictionary, merge_counts
+
+        keys, counts = merge_counts(np.array([7, 3, 7, 9, 3, 7]), np.array([1, 2, 1, 1, 1, 1]))
+        np.testing.assert_array_equal(keys, [3, 7, 9])
+        np.testing.assert_array_equal(counts, [3, 3, 1])
+
+        key_counts = KeyCounts(2)
+        for k, c in [([3, 7], [2, 1]), ([7], [1]), ([7, 9], [1, 1]), ([3], [1])]:
+            key_counts.add(0, np.array(k), np.array(c))
+        self.assertEqual(len(key_counts.pending[0]), 1)
+        merged_keys, merged_counts = key_counts.get()
+        np.testing.assert_array_equal(merged_keys[0], keys)
+        np.testing.assert_array_equal(merged_counts[0], counts)
+        self.assertEqual(len(merged_keys[1]), 0)
+
+        # slot 0: 7 and 3 tie, 9 is rare; slot 1: a single key
+        dictionary = KeyDictionary.from_counts([keys, np.array([1 << 40])], [counts, np.array([5])], min_count=2)
+        self.assertEqual(dictionary.get_vocabulary_size(), 5)
+        batch = np.array([[[3, 7, 9, -1], [1 << 40, 5, -1, -1]]])
+        np.testing.assert_array_equal(dictionary.remap(batch), [[[0, 1, 2, -1], [3, 4, -1, -1]]])
+        np.testing.assert_array_equal(dictionary.remap(batch[:, 1:], first_slot=1), [[[3, 4, -1, -1]]])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'dictionary.npz')
+            dictionary.save(path)
+            loaded = KeyDictionary.load(path)
+            np.testing.assert_array_equal(loaded.remap(batch), dictionary.remap(batch))
+
+    def test_remap_files(self):
+        import os
+        import tempfile
+        import numpy as np
+        from hugectrpy.data import RecordLayout, BinaryWriter, DataReader, write_file_list
+        from hugectrpy.layers import Dense, Label, Sparse, Data
+        from hugectrpy.remap import build_dictionary, remap_files
+
+        rng = np.random.default_rng(0)
+        layout = RecordLayout(label_dim=1, dense_dim=2, slot_num=2, nnz=2, check=True)
+        with tempfile.TemporaryDirectory() as directory:
+            paths, all_keys = [], []
+            for i in range(2):
+                # key k of slot 0 appears about (200 - k) times, slot 1 has large hashed keys
+                keys = np.stack([rng.choice(200, (1000, 2), p=np.arange(200, 0, -1) / 20100),
+                                 (1 << 50) + rng.integers(0, 50, (1000, 2))], axis=1)
+                keys[::7, 0, 1] = -1
+                all_keys.append(keys)
+                paths.append(os.path.join(directory, str(i) + '.bin'))
+                with BinaryWriter(paths[-1], layout) as writer:
+                    writer.write(np.arange(1000).reshape(1000, 1), np.zeros((1000, 2)), keys)
+            file_list = os.path.join(directory, 'file_list.txt')
+            write_file_list(file_list, paths)
+            data = Data(name='data', label=Label(name='label', dim=1), dense=Dense(name='dense', dim=2),
+                        sparse=Sparse(name='data1', slot_num=2, max_feature_num_per_sample=4), source=file_list)
+
+            dictionary = build_dictionary(data, min_count=3, processes=1)
+            parallel = build_dictionary(data, min_count=3, processes=2)
+            np.testing.assert_array_equal(dictionary.ids, parallel.ids)
+
+            all_keys = np.concatenate(all_keys)
+            values, counts = np.unique(all_keys[:, 0][all_keys[:, 0] >= 0], return_counts=True)
+            kept = (counts >= 3).sum()
+            self.assertEqual(dictionary.get_vocabulary_size(), kept + 1 + 50 + 1)
+            ids = dictionary.remap(all_keys)
+            # the most frequent key gets the first ID
+            self.assertEqual(ids[:, 0][all_keys[:, 0] == values[np.argmax(counts)]][0], 0)
+            rare = np.isin(all_keys[:, 0], values[counts < 3])
+            self.assertTrue(np.all(ids[:, 0][rare] == kept))
+            self.assertTrue(np.all(ids[:, 0][all_keys[:, 0] < 0] == -1))
+            self.assertTrue(np.all((ids[:, 1] > kept) & (ids[:, 1] <= kept + 50)))
+
+            output = remap_files(data, dictionary, os.path.join(directory, 'remapped'), processes=1)
+            parallel = remap_files(data, dictionary, os.path.join(directory, 'parallel'), processes=2)
+            with open(output) as fp, open(parallel) as parallel_fp:
+                for path, parallel_path in zip(fp.read().split()[1:], parallel_fp.read().split()[1:]):
+                    with open(path, 'rb') as f, open(parallel_path, 'rb') as parallel_f:
+                        self.assertEqual(f.read(), parallel_f.read())
+            data.source = output
+            batches = list(DataReader(data, 1000))
+            np.testing.assert_array_equal(np.concatenate([b['data1'] for b in batches]), ids)
+            np.testing.assert_array_equal(np.concatenate([b['label'] for b in batches])[:, 0],
+                                          np.tile(np.arange(1000), 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+
+
+class TestServing(unittest.TestCase):
+
+    def test_cache_policies(self):
+        import os
+        import tempfile
+        import numpy as np
+        from hugectrpy.serving import EmbeddingCache
+        from hugectrpy.snapshot import SparseModelFile, get_record_dtype
+
+        rows = np.zeros(1000, get_record_dtype(4))
+        rows['key'] = np.arange(1000) * 7
+        rows['vector'] = np.random.default_rng(0).normal(size=(1000, 4))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sparse.bin')
+            rows.tofile(path)
+            source = SparseModelFile(path, 4)
+            self.assertRaises(ValueError, EmbeddingCache, source, 10, 'fifo')
+
+            # Zipf distributed ranks
+            p = 1 / np.arange(1, 1001)
+            requests = np.random.default_rng(1).choice(1000, (200, 32), p=p / p.sum()) * 7
+            hit_rates = dict()
+            for policy in ('lru', 'lfu', 'tinylfu'):
+                cache = EmbeddingCache(source, 100, policy, window=0.05)
+                for keys in requests:
+                    keys = np.unique(np.append(keys, 3))
+                    vectors = cache.get(keys)
+                    expected = np.zeros((len(keys), 4), dtype=np.float32)
+                    expected[keys % 7 == 0] = rows['vector'][keys[keys % 7 == 0] // 7]
+                    np.testing.assert_array_equal(vectors, expected)
+                    self.assertLessEqual(cache.get_stats()['rows'], 100)
+                    slots = np.concatenate([np.arange(start, filled) for start, filled in cache.filled.items()])
+                    self.assertEqual(cache.index.count, len(slots))
+                    np.testing.assert_array_equal(cache.index.get(cache.keys[slots]), slots)
+                stats = cache.get_stats()
+                self.assertEqual(stats['hits'] + stats['misses'], sum(len(np.unique(np.append(k, 3)))
+                                                                      for k in requests))
+                hit_rates[policy] = stats['hit_rate']
+            self.assertGreater(min(hit_rates.values()), 0.3)
+            self.assertGreater(hit_rates['tinylfu'], hit_rates['lru'])
+
+    def test_inference_engine(self):
+        import os
+        import tempfile
+        import numpy as np
+        from hugectrpy.layers import Dense, Label, Sparse, Data, DistributedSlotSparseEmbeddingHash, Reshape, \
+            Concat, FullyConnected, RELU, BinaryCrossEntropyLoss
+        from hugectrpy.model import Model, Solver, AdamOptimizer
+        from hugectrpy.reference import ReferenceExecutor
+        from hugectrpy.serving import InferenceEngine
+        from hugectrpy.snapshot import get_record_dtype
+
+        label = Label(name='label', dim=1)
+        sparse = Sparse(name='data1', slot_num=2, max_feature_num_per_sample=4)
+        data = Data(name='data', label=label, dense=Dense(name='dense', dim=3), sparse=sparse)
+        emb = DistributedSlotSparseEmbeddingHash(name='emb', src_layers=sparse, vocabulary_size=50,
+                                                 load_factor=0.5, embedding_vec_size=4, combiner=1)
+        concat = Concat(name='concat', src_layers=[Reshape(name='reshape', src_layers=emb, leading_dim=8),
+                                                   data.dense])
+        fc1 = FullyConnected(name='fc1', src_layers=concat, n=6)
+        fc2 = FullyConnected(name='fc2', src_layers=RELU(name='relu', src_layers=fc1), n=1)
+        model = Model(Solver(), AdamOptimizer(), [data])
+        model.add_layer_re(BinaryCrossEntropyLoss(name='loss', src_layers=[fc2, label]))
+
+        rng = np.random.default_rng(0)
+        reference = ReferenceExecutor(model, seed=3)
+        reference.get_kernel('emb').params['table'] = rng.normal(size=(50, 4)).astype(np.float32)
+        batch = {'label': np.zeros((16, 1), dtype=np.float32),
+                 'dense': rng.normal(size=(16, 3)).astype(np.float32),
+                 'data1': rng.integers(-1, 50, (16, 2, 2))}
+        with tempfile.TemporaryDirectory() as directory:
+            rows = np.zeros(50, get_record_dtype(4))
+            rows['key'] = np.arange(50)[::-1]
+            rows['vector'] = reference.get_kernel('emb').params['table'][::-1]
+            sparse_path = os.path.join(directory, 'sparse.bin')
+            rows.tofile(sparse_path)
+            dense_path = os.path.join(directory, 'dense.bin')
+            np.concatenate([reference.get_kernel(name).params[p].ravel() for name in ('fc1', 'fc2')
+                            for p in ('weight', 'bias')]).tofile(dense_path)
+
+            self.assertRaises(ValueError, InferenceEngine, model, dense_path, [sparse_path] * 2)
+            engine = InferenceEngine(model, dense_path, [sparse_path], cache_rows={'emb': 20}, policy='lfu')
+            request = {k: v for k, v in batch.items() if k != 'label'}
+            np.testing.assert_allclose(engine.predict(request), reference.predict(batch), rtol=1e-5)
+            np.testing.assert_allclose(engine.predict(request), reference.predict(batch), rtol=1e-5)
+            self.assertRaises(ValueError, engine.executor.get_kernel('emb').backward, [None])
+
+            stats = engine.get_stats()
+            self.assertEqual(stats['requests'], 2)
+            self.assertGreater(stats['latency_p99'], 0)
+            self.assertEqual(stats['embeddings']['emb']['rows'], 20)
+            self.assertGreater(stats['embeddings']['emb']['hits'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
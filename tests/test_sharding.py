@@ -0,0 +1,84 @@
+import unittest
+
+
+class TestSharding(unittest.TestCase):
+
+    def test_balance_slots(self):
+        import numpy as np
+        from hugectrpy.sharding import balance_slots, get_loads
+
+        rng = np.random.default_rng(0)
+        memory = rng.pareto(1.0, 26) + 0.1
+        traffic = rng.pareto(1.0, 26) + 0.1
+        assignment = balance_slots(memory, traffic, 4)
+        np.testing.assert_array_equal(np.bincount(assignment), [7, 7, 6, 6])
+        planned = np.maximum(*get_loads(memory, traffic, assignment, 4)).max()
+        round_robin = np.maximum(*get_loads(memory, traffic, np.arange(26) % 4, 4)).max()
+        self.assertLess(planned, round_robin)
+        # no device can be lighter than its heaviest slot
+        bound = max(1.0, 4 * max((memory / memory.sum()).max(), (traffic / traffic.sum()).max()))
+        self.assertLess(planned, 1.25 * bound)
+
+        # one slot per device leaves nothing to balance
+        self.assertEqual(sorted(balance_slots([1, 2, 3], [3, 2, 1], 3)), [0, 1, 2])
+
+    def test_plan_sharding(self):
+        import io
+        import os
+        import tempfile
+        import numpy as np
+        from helpers import build_criteo_model
+        from hugectrpy.data import RecordLayout, BinaryWriter, DataReader, write_file_list
+        from hugectrpy.layers import LocalizedSlotSparseEmbeddingHash
+        from hugectrpy.model import Model
+        from hugectrpy.sharding import plan_sharding, permute_slots
+
+        class Report:
+            def get_distinct_keys(self, name):
+                return np.arange(1, 27) ** 2.0
+
+            def get_keys_per_sample(self, name):
+                return np.where(np.arange(26) % 4 == 0, 2.0, 1.0)
+
+        model = build_criteo_model()
+        plan = plan_sharding(model, 'sparse_embedding1', Report())
+        self.assertEqual(plan.devices, [(0, 0), (0, 1), (1, 2), (1, 3)])
+        self.assertLess(plan.get_imbalance()['combined'], plan.get_round_robin_imbalance()['combined'])
+        self.assertLess(plan.get_imbalance()['combined'], 1.1)
+        self.assertIn('node 1 gpu 3', str(plan))
+
+        permutation = plan.get_permutation()
+        np.testing.assert_array_equal(plan.assignment[permutation], np.arange(26) % 4)
+
+        localized = plan.apply(model)
+        self.assertIsInstance(localized, LocalizedSlotSparseEmbeddingHash)
+        self.assertIs(model.layers[2].get_src_layers(), localized)
+        text = str(model)
+        self.assertIn('"LocalizedSlot"', text)
+        loaded = Model.from_json(io.StringIO(text))
+        self.assertIsInstance(loaded.layers[1], LocalizedSlotSparseEmbeddingHash)
+        self.assertEqual(str(loaded), text)
+        self.assertEqual(model.validate()['sparse_embedding1'], (26, 16))
+        # the memory of every GPU follows the planned slots
+        memory = model.plan_memory(slot_weights={'sparse_embedding1': plan.get_slot_memory()})
+        expected = np.bincount(plan.assignment, plan.memory, 4) / plan.memory.sum() * localized.get_capacity()
+        np.testing.assert_allclose([memory[d] / localized.get_row_bytes(2, 1024) for d in plan.devices], expected,
+                                   atol=1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            data = model.layers[0]
+            layout = RecordLayout(label_dim=1, dense_dim=13, slot_num=26, nnz=2, check=True)
+            keys = np.arange(10 * 26 * 2).reshape(10, 26, 2)
+            path = os.path.join(directory, '0.bin')
+            with BinaryWriter(path, layout) as writer:
+                writer.write(np.zeros((10, 1)), np.zeros((10, 13)), keys)
+            data.source = os.path.join(directory, 'file_list.txt')
+            write_file_list(data.source, [path])
+            data.sparse[0].max_feature_num_per_sample = 52
+            data.source = permute_slots(data, 'data1', permutation, os.path.join(directory, 'sharded'))
+            batch = next(iter(DataReader(data, 10)))
+            np.testing.assert_array_equal(batch['data1'], keys[:, permutation])
+
+
+if __name__ == '__main__':
+    unittest.main()
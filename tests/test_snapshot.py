@@ -0,0 +1,115 @@
+import unittest
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def test_diff_and_merge(self):
+        import os
+        import tempfile
+        import numpy as np
+        from hugectrpy.snapshot import SparseModelFile, DeltaFile, get_record_dtype, write_delta, merge_delta, \
+            iter_sorted
+
+        rng = np.random.default_rng(0)
+        dtype = get_record_dtype(4)
+        old = np.zeros(1000, dtype)
+        old['key'] = rng.choice(1 << 40, 1000, replace=False)
+        old['vector'] = rng.normal(size=(1000, 4))
+        new = old.copy()
+        new['vector'][:100] += 1
+        new['vector'][100:200] += 1e-4
+        new = np.concatenate([new[:-50], np.zeros(30, dtype)])
+        new['key'][-30:] = -np.arange(1, 31)
+        new['vector'][-30:] = 5
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ('old.bin', 'new.bin')]
+            old.tofile(paths[0])
+            new.tofile(paths[1])
+            old_file, new_file = SparseModelFile(paths[0], 4), SparseModelFile(paths[1], 4)
+            self.assertEqual(len(new_file), 980)
+            keys, vectors = new_file.get_rows(10, 12)
+            np.testing.assert_array_equal(keys, new['key'][10:12])
+            np.testing.assert_array_equal(new_file.find([new['key'][500], 12345, -3]), [500, -1, 952])
+            vectors, found = old_file.lookup([old['key'][7], 3])
+            np.testing.assert_array_equal(vectors[0], old['vector'][7])
+            np.testing.assert_array_equal(found, [True, False])
+            self.assertRaises(ValueError, SparseModelFile, paths[0], 5)
+            blocks = list(iter_sorted(new_file, chunk=100))
+            np.testing.assert_array_equal(np.concatenate([keys for keys, _ in blocks]), np.sort(new['key']))
+            np.testing.assert_array_equal(new['key'][np.concatenate([rows for _, rows in blocks])],
+                                          np.sort(new['key']))
+            self.assertLessEqual(max(len(keys) for keys, _ in blocks), 100)
+
+            delta_path = os.path.join(directory, 'delta.bin')
+            stats = write_delta(old_file, new_file, delta_path, threshold=1e-3, chunk=128)
+            self.assertEqual(stats, {'rows': 980, 'changed': 130, 'deleted': 50})
+            delta = DeltaFile(delta_path)
+            self.assertEqual(os.path.getsize(delta_path), 40 + 130 * dtype.itemsize + 50 * 8)
+            self.assertEqual(set(delta.deleted), set(old['key'][-50:]))
+            self.assertTrue(np.all(np.diff(delta.rows['key']) > 0))
+            # the threshold applies to rows: 1e-4 on 4 elements is 2e-4 in L2
+            self.assertEqual(write_delta(old_file, new_file, delta_path, 1.5e-4, chunk=128, norm='l2')['changed'],
+                             230)
+            self.assertRaises(ValueError, write_delta, old_file, new_file, delta_path, norm='sum')
+            write_delta(old_file, new_file, delta_path, threshold=1e-3, chunk=128)
+
+            merged = merge_delta(old_file, delta, os.path.join(directory, 'merged.bin'), chunk=100)
+            self.assertEqual(len(merged), 980)
+            order = np.argsort(new['key'])
+            merged_rows = np.array(merged.rows)[np.argsort(merged.rows['key'])]
+            np.testing.assert_array_equal(merged_rows['key'], new['key'][order])
+            # changes below the threshold are not shipped
+            np.testing.assert_allclose(merged_rows['vector'], new['vector'][order], atol=1e-3)
+
+            # an exact delta reproduces the new snapshot
+            write_delta(old_file, new_file, delta_path, chunk=128)
+            merged = merge_delta(old_file, DeltaFile(delta_path), os.path.join(directory, 'exact.bin'))
+            merged_rows = np.array(merged.rows)[np.argsort(merged.rows['key'])]
+            np.testing.assert_array_equal(merged_rows, new[order])
+
+    def test_localized_and_dense(self):
+        import os
+        import tempfile
+        import numpy as np
+        from hugectrpy.layers import Dense, Label, Sparse, Data, LocalizedSlotSparseEmbeddingHash, Reshape, \
+            Concat, FullyConnected, RELU, BinaryCrossEntropyLoss
+        from hugectrpy.model import Model, Solver, AdamOptimizer
+        from hugectrpy.snapshot import SparseModelFile, get_record_dtype, read_dense_model
+
+        label = Label(name='label', dim=1)
+        sparse = Sparse(name='data1', slot_num=2, max_feature_num_per_sample=1, type='LocalizedSlot')
+        data = Data(name='data', label=label, dense=Dense(name='dense', dim=3), sparse=sparse)
+        emb = LocalizedSlotSparseEmbeddingHash(name='emb', src_layers=sparse, vocabulary_size=10, load_factor=0.5,
+                                               embedding_vec_size=2, combiner=0)
+        concat = Concat(name='concat', src_layers=[Reshape(name='reshape', src_layers=emb, leading_dim=4),
+                                                   data.dense])
+        fc1 = FullyConnected(name='fc1', src_layers=concat, n=5)
+        fc2 = FullyConnected(name='fc2', src_layers=RELU(name='relu', src_layers=fc1), n=1)
+        model = Model(Solver(), AdamOptimizer(), [data])
+        model.add_layer_re(BinaryCrossEntropyLoss(name='loss', src_layers=[fc2, label]))
+
+        with tempfile.TemporaryDirectory() as directory:
+            rows = np.zeros(3, get_record_dtype(2, slot_ids=True))
+            rows['key'] = [5, 9, 2]
+            rows['slot'] = [0, 1, 1]
+            path = os.path.join(directory, 'sparse.bin')
+            rows.tofile(path)
+            snapshot = SparseModelFile.for_embedding(path, emb)
+            np.testing.assert_array_equal(snapshot.rows['slot'], [0, 1, 1])
+            np.testing.assert_array_equal(snapshot.find([2, 5]), [2, 0])
+
+            values = np.arange(7 * 5 + 5 + 5 * 1 + 1, dtype=np.float32)
+            path = os.path.join(directory, 'dense.bin')
+            values.tofile(path)
+            params = read_dense_model(model, path)
+            self.assertEqual(params['fc1']['weight'].shape, (7, 5))
+            np.testing.assert_array_equal(params['fc1']['bias'], values[35:40])
+            np.testing.assert_array_equal(params['fc2']['weight'][:, 0], values[40:45])
+            self.assertEqual(params['fc2']['bias'][0], 45)
+            values[:-1].tofile(path)
+            self.assertRaises(ValueError, read_dense_model, model, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
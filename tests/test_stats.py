@@ -0,0 +1,88 @@
+import unittest
+
+
+class TestStats(unittest.TestCase):
+
+    def test_hyperloglog(self):
+        import numpy as np
+        from hugectrpy.stats import HyperLogLog, count_leading_zeros
+
+        values = np.array([0, 1, 1 << 31, 1 << 32, (1 << 63) + 5, (1 << 40) - 1], dtype=np.uint64)
+        np.testing.assert_array_equal(count_leading_zeros(values), [64, 63, 32, 31, 0, 24])
+
+        rng = np.random.default_rng(0)
+        sketch = HyperLogLog(precision=12, count=3)
+        sizes = (100, 10000, 300000)
+        for i, size in enumerate(sizes):
+            keys = rng.choice(1 << 50, size, replace=False)
+            # every key several times, in two halves merged afterwards
+            other = HyperLogLog(precision=12, count=3)
+            sketch.add(np.repeat(keys[:size // 2], 3), np.full(3 * (size // 2), i))
+            other.add(keys[size // 2:], np.full(size - size // 2, i))
+            sketch.merge(other)
+        for estimate, size in zip(sketch.estimate(), sizes):
+            self.assertLess(abs(estimate - size) / size, 0.05)
+        self.assertLess(abs(sketch.union().estimate()[0] - sum(sizes)) / sum(sizes), 0.05)
+
+    def test_scan_cardinality(self):
+        import os
+        import tempfile
+        import numpy as np
+        from hugectrpy.data import RecordLayout, BinaryWriter, write_file_list
+        from hugectrpy.layers import Dense, Label, Sparse, Data, DistributedSlotSparseEmbeddingHash
+        from hugectrpy.model import Model, Solver, AdamOptimizer
+        from hugectrpy.stats import scan_cardinality
+
+        rng = np.random.default_rng(0)
+        layout = RecordLayout(label_dim=1, dense_dim=2, slot_num=3, nnz=4, check=True)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            seen = [set(), set(), set()]
+            for i in range(3):
+                keys = np.stack([rng.integers(0, 1000, (5000, 4)),
+                                 rng.integers(1 << 40, (1 << 40) + 20000, (5000, 4)),
+                                 rng.integers(0, 10, (5000, 4))], axis=1)
+                # samples have 3 to 12 valid keys
+                keys[:, :, 1:][rng.random((5000, 3, 3)) < 0.5] = -1
+                keys[:10, :, 1:] = -1
+                for slot in range(3):
+                    seen[slot].update(keys[:, slot][keys[:, slot] >= 0].tolist())
+                paths.append(os.path.join(directory, str(i) + '.bin'))
+                with BinaryWriter(paths[-1], layout) as writer:
+                    writer.write(np.zeros((5000, 1)), np.zeros((5000, 2)), keys)
+            file_list = os.path.join(directory, 'file_list.txt')
+            write_file_list(file_list, paths)
+
+            sparse = Sparse(name='data1', slot_num=3, max_feature_num_per_sample=1)
+            data = Data(name='data', label=Label(name='label', dim=1), dense=Dense(name='dense', dim=2),
+                        sparse=sparse, source=file_list)
+            emb = DistributedSlotSparseEmbeddingHash(name='emb', src_layers=sparse, vocabulary_size=1,
+                                                     load_factor=0.5, embedding_vec_size=8, combiner=0)
+            model = Model(Solver(), AdamOptimizer(), [data, emb])
+
+            report = scan_cardinality(data, processes=1)
+            parallel = scan_cardinality(data, processes=2)
+            np.testing.assert_array_equal(report.get_distinct_keys('data1'), parallel.get_distinct_keys('data1'))
+            np.testing.assert_array_equal(report.histograms['data1'], parallel.histograms['data1'])
+
+            distinct = report.get_distinct_keys('data1')
+            np.testing.assert_allclose(distinct, [len(keys) for keys in seen], rtol=0.05)
+            self.assertEqual(report.get_max_features('data1'), 12)
+            self.assertEqual(report.get_keys_per_sample('data1').shape, (3,))
+            np.testing.assert_allclose(report.get_keys_per_sample('data1'),
+                                       parallel.get_keys_per_sample('data1'))
+            self.assertTrue(np.all((report.get_keys_per_sample('data1') > 1) &
+                                   (report.get_keys_per_sample('data1') < 4)))
+            self.assertGreaterEqual(report.histograms['data1'][3], 30)
+            self.assertEqual(report.histograms['data1'].sum(), 15000)
+            self.assertEqual(report.get_sparse_kwargs('data1', headroom=0.25)['max_feature_num_per_sample'], 15)
+
+            report.apply(model, headroom=0.1)
+            self.assertEqual(sparse.max_feature_num_per_sample, 14)
+            total = len(set.union(*seen))
+            self.assertAlmostEqual(emb.vocabulary_size / (1.1 * total), 1, delta=0.05)
+            self.assertIn('data1', str(report))
+
+
+if __name__ == '__main__':
+    unittest.main()
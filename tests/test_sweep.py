@@ -0,0 +1,76 @@
+import unittest
+
+
+class TestSweep(unittest.TestCase):
+
+    def test_sweep(self):
+        from helpers import build_criteo_model
+        from hugectrpy.model import MomentumSGD
+        from hugectrpy.sweep import sweep, make_variant
+
+        base = build_criteo_model()
+        text = str(base)
+        axes = {'solver.batch_size': [4096, 8192],
+                'optimizer': [base.optimizer, MomentumSGD(momentum=0.9)],
+                'optimizer.lr': [0.001, 0.01],
+                'layers.fc1.n': [200, 256],
+                'layers.sparse_embedding1.embedding_vec_size': [16]}
+        variants = sweep(base, axes)
+        assignment, first = next(variants)
+        self.assertEqual(assignment['solver.batch_size'], 4096)
+        rest = list(variants)
+        self.assertEqual(len(rest) + 1, 16)
+        self.assertEqual(str(base), text)
+
+        # unchanged layers are shared, changed ones are copies
+        self.assertIs(first.layers[0], base.layers[0])
+        fc1 = [layer for layer in first.layers if layer.get_name() == 'fc1'][0]
+        self.assertIsNot(fc1, [layer for layer in base.layers if layer.get_name() == 'fc1'][0])
+        self.assertIsNot(first.solver, base.solver)
+
+        changed = make_variant(base, {'layers.fc1.n': 256, 'optimizer': MomentumSGD(), 'optimizer.lr': 0.5})
+        self.assertIn('"num_output": 256', str(changed))
+        self.assertIn('MomentumSGD', str(changed))
+        self.assertEqual(changed.optimizer.lr, 0.5)
+
+        # values equal to the base serialize identically and are dropped
+        self.assertEqual(len(list(sweep(base, {'layers.fc1.n': [200, 200, 300]}))), 2)
+        self.assertEqual(len(list(sweep(base, {'layers.fc1.n': [200, 200]}, dedupe=False))), 2)
+        self.assertEqual(len(list(sweep(base, {'solver.batch_size': [4096, 4097]}, validate=True))), 1)
+        self.assertRaises(ValueError, make_variant, base, {'layers.nope.n': 1})
+        self.assertRaises(ValueError, make_variant, base, {'solver.nope': 1})
+        # consumers would keep reading the old names
+        self.assertRaises(ValueError, make_variant, base, {'layers.fc1.name': 'fc9'})
+        self.assertRaises(ValueError, make_variant, base, {'layers.slice1.ranges': [[0, 429]]})
+
+    def test_write_sweep(self):
+        import io
+        import json
+        import os
+        import tempfile
+        from helpers import build_criteo_model
+        from hugectrpy.model import Model
+        from hugectrpy.sweep import write_sweep
+
+        base = build_criteo_model()
+        axes = {'solver.batch_size': [2048, 4096, 4096], 'layers.fc2.n': [100, 200], 'solver.mixed_precision':
+                [None, 1024]}
+        with tempfile.TemporaryDirectory() as directory:
+            serial = write_sweep(base, axes, os.path.join(directory, 'serial'), processes=1, chunk_size=5)
+            parallel = write_sweep(base, axes, os.path.join(directory, 'parallel'), processes=2, chunk_size=5)
+            with open(serial) as fp:
+                entries = [json.loads(line) for line in fp]
+            with open(parallel) as fp:
+                self.assertEqual([json.loads(line) for line in fp], entries)
+            self.assertEqual(len(entries), 8)
+            self.assertEqual(len(os.listdir(os.path.join(directory, 'parallel'))), 9)
+            entry = entries[-1]
+            self.assertEqual(entry['assignment'], {'solver.batch_size': 4096, 'layers.fc2.n': 200,
+                                                   'solver.mixed_precision': 1024})
+            loaded = Model.from_json(os.path.join(directory, 'parallel', entry['config']))
+            self.assertEqual(loaded.solver.batch_size, 4096)
+            self.assertEqual([layer.n for layer in loaded.layers if layer.get_name() == 'fc2'], [200])
+
+
+if __name__ == '__main__':
+    unittest.main()